@@ -0,0 +1,93 @@
+"""
+参数修复模块 - 把模型给出的近似参数对应到提供给它的合法选项
+
+模型偶尔给出与选项不完全一致的参数：多余的空格、全角字符、带上了例子说明，
+或者把 Entity 名称 / 列表序号当成了 elementId。这些情况下选择本身是明确的，
+在执行函数前按规范化后的文本、别名和序号对应到唯一的合法选项，不让整条材料失败。
+无法唯一确定时仍返回无效，由 main.call_mandated_function 只重新提示这一轮。
+"""
+import re
+import threading
+import unicodedata
+from config import TOOL_ARGUMENT_REPAIR_ENABLED
+
+
+_stats = {'repaired': 0, 'reprompted': 0}
+_stats_lock = threading.Lock()
+
+# 选项后面附带的说明，如 "金属材料 (例子: ...)"、"E1（相似度 0.98）"
+_SUFFIX_PATTERN = re.compile(r'\s*[(（\[【].*$')
+
+
+def normalize_text(value):
+    """NFKC（全角 → 半角）、去掉所有空白和首尾引号 / 句号、统一箭头写法、忽略大小写"""
+    text = unicodedata.normalize('NFKC', str(value)).replace('->', '→')
+    text = ''.join(text.split())
+    return text.strip('\'"`“”‘’「」《》。.,，').casefold()
+
+
+def match_option(value, options, aliases=None, allow_index=True):
+    """
+    把参数值对应到唯一的合法选项
+    
+    Args:
+        value: 模型给出的参数值
+        options: 合法取值列表
+        aliases: {别名: 合法取值}（如 Entity 名称 → elementId）
+        allow_index: 是否接受从 1 开始的序号（选项按列表顺序展示时）
+    
+    Returns:
+        tuple: (合法取值, 修复说明)；value 本身合法时修复说明为 None；
+               无法唯一确定时返回 (None, None)
+    """
+    # True / False 与 1 / 0 相等：布尔值既不是合法的 id 也不是序号
+    if isinstance(value, bool):
+        return None, None
+    if value in options:
+        return value, None
+    if not TOOL_ARGUMENT_REPAIR_ENABLED or not isinstance(value, (str, int, float)):
+        return None, None
+    
+    aliases = aliases or {}
+    if value in aliases:
+        return _repaired(aliases[value], f"别名 '{value}' → '{aliases[value]}'")
+    
+    # 规范化后唯一匹配（选项本身或别名）
+    table = {}
+    for option in options:
+        table.setdefault(normalize_text(option), set()).add(option)
+    for alias, option in aliases.items():
+        table.setdefault(normalize_text(alias), set()).add(option)
+    
+    for text in (str(value), _SUFFIX_PATTERN.sub('', str(value))):
+        matched = table.get(normalize_text(text), set())
+        if len(matched) == 1:
+            option = next(iter(matched))
+            return _repaired(option, f"'{value}' → '{option}'")
+    
+    # 列表序号（从 1 开始）
+    if allow_index:
+        text = normalize_text(value).rstrip('.、')
+        if text.isdigit() and 1 <= int(text) <= len(options):
+            option = options[int(text) - 1]
+            return _repaired(option, f"序号 {value} → '{option}'")
+    
+    return None, None
+
+
+def _repaired(option, note):
+    with _stats_lock:
+        _stats['repaired'] += 1
+    return option, note
+
+
+def record_reprompt():
+    """记录一次因参数无效而重新提示的轮次"""
+    with _stats_lock:
+        _stats['reprompted'] += 1
+
+
+def repair_stats():
+    """返回 {repaired, reprompted}"""
+    with _stats_lock:
+        return dict(_stats)
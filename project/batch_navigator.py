@@ -0,0 +1,175 @@
+"""
+批量导航模块 - 把停留在同一Class节点的材料合并成一个提示词
+
+同一节点的选项和例子对所有材料都一样，合并后每批只发送一次，
+模型为每条材料返回一个选择。批量导航只负责向下走Class层级，
+到达叶子节点（或批量未给出有效选择）后交给 process_single_material 继续处理。
+"""
+import asyncio
+from config import (
+    ROOT_ELEMENT_ID, ROOT_NAME,
+    BATCH_CLASSIFICATION_SIZE, MAX_CLASSIFICATION_DEPTH, ROUND_DEADLINE_SECONDS
+)
+from deadline import DeadlineExceeded, deadline_scope
+from data_loader import format_material_for_prompt
+from classifier import build_tools_for_batch_class_node
+from routing_memo import get_routing_memo, composition_signature
+from model_router import get_model_router
+
+
+async def navigate_in_batches(all_materials, neo4j_conn, logger, handler,
+                              batch_size=BATCH_CLASSIFICATION_SIZE, start_paths=None):
+    """
+    批量向下导航所有材料，返回每条材料停下来的分类路径
+    
+    Args:
+        all_materials: 材料数据列表
+        neo4j_conn: Neo4j连接器
+        logger: 日志记录器
+        handler: FunctionCallHandler
+        batch_size: 每个提示词最多包含的材料数
+        start_paths: {材料索引: 已确定的分类路径}（如预路由结果），其余材料从根节点开始
+    
+    Returns:
+        dict: {材料索引: classification_path [{name, elementId}, ...]}
+    """
+    routing_memo = get_routing_memo()
+    start_paths = start_paths or {}
+    paths = {
+        idx: [dict(node) for node in start_paths[idx]] if idx in start_paths
+        else [{'name': ROOT_NAME, 'elementId': ROOT_ELEMENT_ID}]
+        for idx in range(len(all_materials))
+    }
+    signatures = {
+        idx: composition_signature(material_data)
+        for idx, material_data in enumerate(all_materials)
+    }
+    # 仍在批量导航中的材料
+    active = set(paths)
+    
+    for depth in range(1, MAX_CLASSIFICATION_DEPTH + 1):
+        if not active:
+            break
+        
+        # 按当前所在节点分组
+        groups = {}
+        for idx in sorted(active):
+            groups.setdefault(paths[idx][-1]['elementId'], []).append(idx)
+        
+        logger.info(f"\n【批量导航 第{depth}层】{len(active)} 条材料分布在 {len(groups)} 个节点")
+        
+        outcomes = await asyncio.gather(*(
+            _navigate_group(
+                paths[indices[0]][-1], len(paths[indices[0]]) - 1, indices, all_materials, signatures,
+                routing_memo, neo4j_conn, logger, handler, batch_size
+            )
+            for indices in groups.values()
+        ))
+        
+        active = set()
+        for moves in outcomes:
+            for idx, node in moves.items():
+                paths[idx].append(node)
+                active.add(idx)
+    
+    return paths
+
+
+async def _navigate_group(node, node_depth, indices, all_materials, signatures, routing_memo,
+                          neo4j_conn, logger, handler, batch_size):
+    """
+    处理停在同一节点（深度为 node_depth）的一组材料
+    
+    Returns:
+        dict: {材料索引: 下一个节点 {name, elementId}}；不在返回值中的材料停止批量导航
+    """
+    current_element_id = node['elementId']
+    current_name = node['name']
+    
+    labels = await asyncio.to_thread(neo4j_conn.get_node_labels, current_element_id)
+    if 'Class' not in labels:
+        return {}
+    
+    tier = get_model_router().select('navigate_outbound_batch', node_depth, current_name)
+    moves = {}
+    for start in range(0, len(indices), batch_size):
+        batch = indices[start:start + batch_size]
+        
+        tools, available_functions, helper_data = await asyncio.to_thread(
+            build_tools_for_batch_class_node,
+            current_element_id, current_name, neo4j_conn, batch
+        )
+        outbound_nodes = helper_data['outbound_nodes']
+        
+        # 叶子节点：停止批量导航，交给单条处理流程查看Entity
+        if not outbound_nodes:
+            return moves
+        
+        # 先用路由备忘，剩余的材料才发给LLM
+        pending = []
+        for idx in batch:
+            memo_node = (
+                routing_memo.lookup(current_element_id, signatures[idx], outbound_nodes)
+                if routing_memo is not None else None
+            )
+            if memo_node:
+                moves[idx] = {'name': memo_node['name'], 'elementId': memo_node['elementId']}
+            else:
+                pending.append(idx)
+        
+        if not pending:
+            continue
+        
+        if len(pending) != len(batch):
+            tools, available_functions, helper_data = await asyncio.to_thread(
+                build_tools_for_batch_class_node,
+                current_element_id, current_name, neo4j_conn, pending
+            )
+        
+        materials_block = "\n\n".join(
+            f"[{idx}]\n{format_material_for_prompt(all_materials[idx], 'navigation')}" for idx in pending
+        )
+        prompt = f"""你是材料知识图谱的导航助手。
+
+当前位置：{current_name}
+状态：🔽 **还有 {len(outbound_nodes)} 个子分类可选**
+
+任务：
+1. 仔细阅读每个子分类选项后的【例子】
+2. 为下面每一条材料（方括号内为材料编号）选择最匹配的子分类
+3. 调用 navigate_outbound_batch，一次性给出 user 消息中所有材料的选择
+
+请调用 navigate_outbound_batch 函数。"""
+        
+        # 节点说明在前（同一节点的各批次共享缓存前缀），材料列表在最后
+        messages = [
+            {"role": "system", "content": prompt},
+            {"role": "user", "content": f"材料列表（共 {len(pending)} 条）：\n{materials_block}"}
+        ]
+        # 每个批次的LLM调用受单轮截止时间限制，超时的批次改为单条处理
+        try:
+            with deadline_scope(ROUND_DEADLINE_SECONDS):
+                result = await handler.call_function_standard(
+                    messages, tools, available_functions,
+                    temperature=0, tool_choice='navigate_outbound_batch', tier=tier
+                )
+        except DeadlineExceeded as e:
+            result = {'success': False, 'error': f"超时: {e}"}
+        
+        if not result['success']:
+            logger.warning(
+                f"  ⚠️  节点 '{current_name}' 批量导航失败，{len(pending)} 条材料改为单条处理: "
+                f"{result.get('error')}"
+            )
+            continue
+        
+        func_result = result['result']
+        for idx, move in func_result['moves'].items():
+            moves[idx] = {'name': move['to_node'], 'elementId': move['new_element_id']}
+        
+        logger.info(
+            f"  {current_name}: 批量选择 {len(func_result['moves'])} 条，"
+            f"缺失 {len(func_result['missing'])} 条"
+        )
+    
+    return moves
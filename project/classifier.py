@@ -2,14 +2,95 @@
 分类器模块 - 动态构建tools（修改版）
 """
 from functools import partial
+from config import REASONING_MODE, REASONING_MAX_CHARS
 from material_functions import (
     navigate_outbound,
+    navigate_outbound_batch,
+    navigate_to_leaf,
     navigate_inbound,
     get_similar_materials,
     mount_to_entity
 )
 
 
+def reasoning_parameter(description, final_step=False, mode=None):
+    """
+    按 REASONING_MODE 生成 reasoning 参数的 schema
+    
+    Args:
+        description: reasoning 参数的说明
+        final_step: 是否为最终挂载步骤（final_only 模式下只有最终步骤要求理由）
+        mode: 覆盖 config 中的 REASONING_MODE
+    
+    Returns:
+        tuple: (properties 字典, required 列表)；不需要理由时两者都为空
+    
+    capped 模式的 maxLength 和字数提示只是对模型的建议（DeepSeek 不强制执行 schema 约束），
+    不能限制输出 token 数；超长的理由由 cap_reasoning 在执行函数前截断。
+    """
+    mode = mode or REASONING_MODE
+    
+    if mode == 'off' or (mode == 'final_only' and not final_step):
+        return {}, []
+    
+    if mode == 'capped':
+        return {
+            "reasoning": {
+                "type": "string",
+                "maxLength": REASONING_MAX_CHARS,
+                "description": f"{description}（可选，不超过{REASONING_MAX_CHARS}字）"
+            }
+        }, []
+    
+    return {"reasoning": {"type": "string", "description": description}}, ["reasoning"]
+
+
+def cap_reasoning(arguments, mode=None):
+    """
+    capped 模式下把模型给出的 reasoning 截断到 REASONING_MAX_CHARS 字（包括批量 decisions 中的理由）
+    
+    Args:
+        arguments: 模型给出的函数参数
+        mode: 覆盖 config 中的 REASONING_MODE
+    
+    Returns:
+        dict: 截断后的参数（不修改传入的字典）
+    """
+    if (mode or REASONING_MODE) != 'capped' or not isinstance(arguments, dict):
+        return arguments
+    
+    def cap(item):
+        reasoning = item.get('reasoning')
+        if isinstance(reasoning, str) and len(reasoning) > REASONING_MAX_CHARS:
+            return dict(item, reasoning=reasoning[:REASONING_MAX_CHARS])
+        return item
+    
+    arguments = cap(arguments)
+    if isinstance(arguments.get('decisions'), list):
+        arguments = dict(arguments, decisions=[
+            cap(decision) if isinstance(decision, dict) else decision
+            for decision in arguments['decisions']
+        ])
+    return arguments
+
+
+def format_options_with_examples(outbound_nodes, neo4j_conn):
+    """
+    为每个子分类选项获取例子，拼成工具描述中的选项列表
+    
+    Returns:
+        str: "可用选项和例子如下：\n- 选项A (例子: ...)\n- ..."
+    """
+    options_with_examples = []
+    for node in outbound_nodes:
+        examples = neo4j_conn.get_node_examples(node['elementId'])
+        example_str = f" (例子: {', '.join(examples)})" if examples else " (无例子)"
+        options_with_examples.append(node['name'] + example_str)
+    
+    options_formatted = "\n- ".join(options_with_examples)
+    return f"可用选项和例子如下：\n- {options_formatted}"
+
+
 def build_tools_for_class_node(current_element_id, current_name, neo4j_conn):
     """
     为Class节点构建可用工具（函数1、2）
@@ -22,18 +103,14 @@ def build_tools_for_class_node(current_element_id, current_name, neo4j_conn):
     
     if outbound_nodes:
         # --- 新增代码：为每个选项获取例子 ---
-        options_with_examples = []
-        for node in outbound_nodes:
-            examples = neo4j_conn.get_node_examples(node['elementId'])
-            example_str = f" (例子: {', '.join(examples)})" if examples else " (无例子)"
-            options_with_examples.append(node['name'] + example_str)
-        
-        options_formatted = "\n- ".join(options_with_examples)
         description_with_examples = (
             f"选择下一个要移动到的Class节点。\n"
-            f"可用选项和例子如下：\n- {options_formatted}"
+            f"{format_options_with_examples(outbound_nodes, neo4j_conn)}"
         )
-
+        reasoning_properties, reasoning_required = reasoning_parameter(
+            "为什么选择这个节点？请结合例子和材料特征进行说明。"
+        )
+        
         tools.append({
             "type": "function",
             "function": {
@@ -49,12 +126,9 @@ def build_tools_for_class_node(current_element_id, current_name, neo4j_conn):
                             # --- 修改这里的 description ---
                             "description": description_with_examples
                         },
-                        "reasoning": {
-                            "type": "string",
-                            "description": "为什么选择这个节点？请结合例子和材料特征进行说明。"
-                        }
+                        **reasoning_properties
                     },
-                    "required": ["next_node_name", "reasoning"]
+                    "required": ["next_node_name"] + reasoning_required
                 }
             }
         })
@@ -73,6 +147,7 @@ def build_tools_for_class_node(current_element_id, current_name, neo4j_conn):
     else:
         inbound_description = f"查看'{current_name}'下的具体材料实例（Entity节点）。当前已到达分类树的叶子节点，没有更细的子分类。"
     
+    reasoning_properties, reasoning_required = reasoning_parameter("为什么要查看Entity节点？")
     tools.append({
         "type": "function",
         "function": {
@@ -80,8 +155,8 @@ def build_tools_for_class_node(current_element_id, current_name, neo4j_conn):
             "description": inbound_description,
             "parameters": {
                 "type": "object",
-                "properties": { "reasoning": { "type": "string", "description": "为什么要查看Entity节点？"}},
-                "required": ["reasoning"]
+                "properties": reasoning_properties,
+                "required": reasoning_required
             }
         }
     })
@@ -95,6 +170,148 @@ def build_tools_for_class_node(current_element_id, current_name, neo4j_conn):
     
     return tools, available_functions, helper_data
 
+
+def build_tools_for_subtree(current_element_id, current_name, neo4j_conn, leaf_paths):
+    """
+    为Class节点构建"一次选到叶子"的工具：整个剩余子树展开为路径列表
+    
+    Args:
+        current_element_id: 当前Class节点的elementId
+        current_name: 当前Class节点名称
+        neo4j_conn: Neo4j连接器
+        leaf_paths: get_subtree_leaf_paths 的结果 [[{name, elementId}, ...], ...]
+    
+    Returns:
+        tuple: (tools列表, available_functions字典, helper_data)；
+               helper_data['leaf_nodes'] 为所有叶子节点 [{name, elementId}]
+    """
+    available_paths = {}
+    options = []
+    for path in leaf_paths:
+        path_str = " → ".join(node['name'] for node in path)
+        available_paths[path_str] = path
+        examples = neo4j_conn.get_node_examples(path[-1]['elementId'])
+        example_str = f" (例子: {', '.join(examples)})" if examples else " (无例子)"
+        options.append(path_str + example_str)
+    
+    options_formatted = "\n- ".join(options)
+    reasoning_properties, reasoning_required = reasoning_parameter(
+        "为什么选择这个叶子分类？请结合例子和材料特征进行说明。"
+    )
+    
+    tools = [{
+        "type": "function",
+        "function": {
+            "name": "navigate_to_leaf",
+            "description": (
+                f"从当前节点'{current_name}'直接移动到子树中的某个叶子分类。"
+                f"请参考每条路径后的例子进行选择。"
+            ),
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "leaf_path": {
+                        "type": "string",
+                        "enum": list(available_paths),
+                        "description": f"选择的分类路径。可用路径和例子如下：\n- {options_formatted}"
+                    },
+                    **reasoning_properties
+                },
+                "required": ["leaf_path"] + reasoning_required
+            }
+        }
+    }]
+    
+    available_functions = {
+        'navigate_to_leaf': partial(
+            navigate_to_leaf,
+            current_element_id=current_element_id,
+            current_name=current_name,
+            available_paths=available_paths,
+            neo4j_conn=neo4j_conn
+        )
+    }
+    
+    helper_data = {'leaf_nodes': [path[-1] for path in leaf_paths]}
+    return tools, available_functions, helper_data
+
+
+def build_tools_for_batch_class_node(current_element_id, current_name, neo4j_conn, material_ids):
+    """
+    为停留在同一Class节点的一批材料构建批量导航工具
+    
+    选项和例子只出现一次，模型为每条材料返回一个选择。
+    
+    Args:
+        current_element_id: 当前Class节点的elementId
+        current_name: 当前Class节点名称
+        neo4j_conn: Neo4j连接器
+        material_ids: 本批材料的编号列表（提示词中的 [编号]）
+    
+    Returns:
+        tuple: (tools列表, available_functions字典, helper_data)；
+               没有子分类时 tools 为空列表
+    """
+    outbound_nodes = neo4j_conn.get_outbound_class_nodes(current_element_id)
+    helper_data = {'outbound_nodes': outbound_nodes}
+    
+    if not outbound_nodes:
+        return [], {}, helper_data
+    
+    reasoning_properties, reasoning_required = reasoning_parameter("选择理由（简要）")
+    tools = [{
+        "type": "function",
+        "function": {
+            "name": "navigate_outbound_batch",
+            "description": (
+                f"为每条材料从当前节点'{current_name}'选择下一级Class节点。"
+                f"每条材料必须给出一个选择。\n"
+                f"{format_options_with_examples(outbound_nodes, neo4j_conn)}"
+            ),
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "decisions": {
+                        "type": "array",
+                        "description": "每条材料的选择，按材料编号逐条给出",
+                        "items": {
+                            "type": "object",
+                            "properties": {
+                                "material_id": {
+                                    "type": "integer",
+                                    "enum": list(material_ids),
+                                    "description": "材料编号（提示词中方括号内的数字）"
+                                },
+                                "next_node_name": {
+                                    "type": "string",
+                                    "enum": [node['name'] for node in outbound_nodes],
+                                    "description": "为该材料选择的子分类"
+                                },
+                                **reasoning_properties
+                            },
+                            "required": ["material_id", "next_node_name"] + reasoning_required
+                        }
+                    }
+                },
+                "required": ["decisions"]
+            }
+        }
+    }]
+    
+    available_functions = {
+        'navigate_outbound_batch': partial(
+            navigate_outbound_batch,
+            current_element_id=current_element_id,
+            current_name=current_name,
+            available_nodes=outbound_nodes,
+            material_ids=list(material_ids),
+            neo4j_conn=neo4j_conn
+        )
+    }
+    
+    return tools, available_functions, helper_data
+
+
 def build_tools_for_entity_selection(entities, need_similarity, current_element_id,
                                      material_data, neo4j_conn):
     """
@@ -115,6 +332,7 @@ def build_tools_for_entity_selection(entities, need_similarity, current_element_
     
     # 函数3：相似度搜索（仅在Entity数量>=20时提供）
     if need_similarity:
+        reasoning_properties, reasoning_required = reasoning_parameter("为什么需要使用相似度筛选？")
         tools.append({
             "type": "function",
             "function": {
@@ -122,13 +340,8 @@ def build_tools_for_entity_selection(entities, need_similarity, current_element_
                 "description": f"从 {len(entities)}+ 个Entity节点中筛选出top5最相似的材料牌号。基于成分比重的相似度计算。",
                 "parameters": {
                     "type": "object",
-                    "properties": {
-                        "reasoning": {
-                            "type": "string",
-                            "description": "为什么需要使用相似度筛选？"
-                        }
-                    },
-                    "required": ["reasoning"]
+                    "properties": reasoning_properties,
+                    "required": reasoning_required
                 }
             }
         })
@@ -148,6 +361,9 @@ def build_tools_for_entity_selection(entities, need_similarity, current_element_
     else:
         description = "将材料挂载到选定的Entity节点。建议先使用相似度搜索筛选后再挂载。"
     
+    reasoning_properties, reasoning_required = reasoning_parameter(
+        "为什么选择这个Entity节点？基于材料特征的匹配说明。", final_step=True
+    )
     tools.append({
         "type": "function",
         "function": {
@@ -160,12 +376,9 @@ def build_tools_for_entity_selection(entities, need_similarity, current_element_
                         "type": "string",
                         "description": "选择的Entity节点的elementId（从之前的查询结果中获取）"
                     },
-                    "reasoning": {
-                        "type": "string",
-                        "description": "为什么选择这个Entity节点？基于材料特征的匹配说明。"
-                    }
+                    **reasoning_properties
                 },
-                "required": ["target_element_id", "reasoning"]
+                "required": ["target_element_id"] + reasoning_required
             }
         }
     })
@@ -173,7 +386,8 @@ def build_tools_for_entity_selection(entities, need_similarity, current_element_
     available_functions['mount_to_entity'] = partial(
         mount_to_entity,
         material_data=material_data,
-        neo4j_conn=neo4j_conn
+        neo4j_conn=neo4j_conn,
+        candidates=[{'name': e['name'], 'elementId': e['elementId']} for e in entities]
     )
     
     return tools, available_functions
\ No newline at end of file
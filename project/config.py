@@ -10,7 +10,121 @@ NEO4J_PASSWORD = "thl123!@#"
 
 # DeepSeek API配置
 DEEPSEEK_API_KEY = os.getenv("DEEPSEEK_API_KEY")
-DEEPSEEK_BASE_URL = "https://api.deepseek.com"
+DEEPSEEK_BASE_URL = os.getenv("DEEPSEEK_BASE_URL", "https://api.deepseek.com")
+# API Key 池：逗号分隔的 "key" 或 "key@base_url"（未写地址时使用 DEEPSEEK_BASE_URL）
+# 未设置时只使用 DEEPSEEK_API_KEY；请求按未完成请求数最少的 Key 分配
+DEEPSEEK_API_KEYS = [
+    item.strip() for item in os.getenv("DEEPSEEK_API_KEYS", "").split(",") if item.strip()
+] or ([DEEPSEEK_API_KEY] if DEEPSEEK_API_KEY else [])
+LLM_KEY_COOLDOWN = 30              # Key 遇到 429 且没有 Retry-After 时的冷却时间（秒）
+
+# Function Call 是否进行第二次调用生成最终回答（main.py 不使用 final_answer，默认关闭）
+FUNCTION_CALL_FINAL_ANSWER = False
+
+# 只允许调用唯一函数的步骤的执行策略：
+#   "direct" - 确定性函数（navigate_inbound / get_similar_materials / Entity节点挂载）直接执行，
+#              其余步骤强制 tool_choice 为该函数
+#   "force"  - 全部调用模型，但强制 tool_choice 为该函数
+#   "auto"   - 全部调用模型，tool_choice="auto"（旧行为）
+MANDATED_TOOL_POLICY = "direct"
+
+# 工具参数修复：执行函数前把近似的参数（空格 / 全角 / 附带说明 / 名称代替 elementId / 序号）
+# 对应到唯一的合法选项；仍无效时只重新提示当前这一轮（最多 TOOL_ARGUMENT_MAX_REPROMPTS 次）
+TOOL_ARGUMENT_REPAIR_ENABLED = True
+TOOL_ARGUMENT_MAX_REPROMPTS = 1
+
+# 工具参数中 reasoning（选择理由）的要求，可用环境变量 REASONING_MODE 按次运行切换：
+#   "full"       - 所有工具都必须给出理由（旧行为，审计时使用）
+#   "capped"     - 理由可选，提示模型不超过 REASONING_MAX_CHARS 字；超长的理由在执行函数前截断
+#                  （字数限制只是提示，不能保证限制输出 token 数）
+#   "final_only" - 只有最终挂载（mount_to_entity）需要理由，导航步骤不要求
+#   "off"        - 所有工具都不要求理由
+# 生成理由是补全 token 的主要来源，也是每轮延迟的主要来源
+REASONING_MODE = os.getenv("REASONING_MODE", "final_only")
+REASONING_MAX_CHARS = 40
+
+# 模型分级：按轮次类型（函数名）/ 节点深度（根节点为 0）/ 节点名称选择模型和生成参数
+# 按顺序匹配，第一条满足全部给出条件的规则生效；都不匹配时使用 LLM_DEFAULT_MODEL
+# 可用字段: name, model, params（传给 chat.completions.create）, functions, min_depth, max_depth, nodes
+LLM_DEFAULT_MODEL = "deepseek-chat"
+# 上层分类轮次的输出上限：只在导航步骤不生成理由时限制（"full" / "capped" 模式下理由可能很长，
+# 限制输出会截断强制的 tool call JSON，解析失败后重新提示也会被同样截断）
+LLM_UPPER_TIER_MAX_TOKENS = 256 if REASONING_MODE in ("off", "final_only") else None
+LLM_MODEL_TIERS = [
+    # 上层分类选项少、差别明显：不生成理由时限制输出长度
+    {
+        "name": "upper",
+        "functions": ["navigate_outbound", "navigate_to_leaf"],
+        "max_depth": 1,
+        "model": "deepseek-chat",
+        "params": {"max_tokens": LLM_UPPER_TIER_MAX_TOKENS} if LLM_UPPER_TIER_MAX_TOKENS else {}
+    },
+    # 叶子Entity的选择最难：使用默认模型，不限制输出
+    {
+        "name": "leaf",
+        "functions": ["get_similar_materials", "mount_to_entity"],
+        "model": "deepseek-chat",
+        "params": {}
+    }
+]
+
+# DeepSeek 调用限流（所有 FunctionCallHandler 共享；RPM / TPM / 初始并发按单个 Key 计，按 Key 数放大）
+LLM_RATE_LIMIT_RPM = 600           # 每分钟请求数上限，None 表示不限
+LLM_RATE_LIMIT_TPM = 1000000       # 每分钟 token 数上限，None 表示不限
+LLM_CONCURRENCY_INITIAL = 8        # AIMD 初始并发上限
+LLM_CONCURRENCY_MIN = 1
+LLM_CONCURRENCY_MAX = 64
+LLM_AIMD_DECREASE_FACTOR = 0.5     # 遇到 429 / 超时时并发上限乘以该系数
+LLM_AIMD_DECREASE_COOLDOWN = 5     # 两次收缩之间的最短间隔（秒）
+LLM_MAX_RETRIES = 5                # 429 / 超时 / 5xx 的最大重试次数
+LLM_RETRY_BASE_DELAY = 1.0         # 指数退避的初始等待（秒）
+LLM_RETRY_MAX_DELAY = 30.0
+LLM_REQUEST_TIMEOUT = 60           # 单次请求超时（秒）
+
+# 整次运行共享的 HTTP 连接池（所有材料共用一个 AsyncOpenAI 客户端）
+LLM_HTTP_MAX_CONNECTIONS = 100     # 连接总数上限
+LLM_HTTP_MAX_KEEPALIVE = 32        # 保持空闲的长连接数
+LLM_HTTP_KEEPALIVE_EXPIRY = 60     # 空闲长连接的保留时间（秒）
+LLM_HTTP2 = True                   # 安装了 h2 时使用 HTTP/2（pip install httpx[http2]）
+
+# 流式调用：边生成边解析 tool call 参数，决定性参数完整后立即执行函数（不必等 reasoning 生成完）
+LLM_STREAMING_ENABLED = True
+# 各函数的决定性参数（都已完整时提前执行该函数）；不在表中的函数等流结束后再执行
+LLM_STREAM_DECISIVE_ARGS = {
+    "navigate_outbound": ["next_node_name"],
+    "navigate_to_leaf": ["leaf_path"],
+    "mount_to_entity": ["target_element_id"]
+}
+LLM_STREAM_ABORT_WHEN_COMPLETE = True   # 函数的必填参数都已完整时停止生成（舍弃可选的 reasoning）
+
+# 对冲请求：超过最近延迟的分位数仍未返回时再发一个相同请求，先返回者生效
+# 只对非流式调用生效：流式调用会提前执行函数，不能发出两个请求，
+# 因此 LLM_STREAMING_ENABLED = True 时不会发出对冲请求（创建 handler 时打印警告）
+LLM_HEDGE_ENABLED = False
+LLM_HEDGE_PERCENTILE = 0.9         # 对冲等待时间取最近延迟的该分位数
+LLM_HEDGE_MIN_SAMPLES = 20         # 样本不足时使用默认等待时间
+LLM_HEDGE_DEFAULT_DELAY = 15.0     # 默认对冲等待时间（秒）
+LLM_HEDGE_MAX_RATE = 0.1           # 对冲请求占总请求的比例上限
+LLM_HEDGE_WINDOW = 200             # 统计延迟的最近样本数
+
+# LLM 单价（元 / 百万 token，用于估算费用，请按实际价格修改）
+LLM_PRICE_INPUT_CACHE_HIT = 0.2
+LLM_PRICE_INPUT_CACHE_MISS = 2.0
+LLM_PRICE_OUTPUT = 3.0
+
+# 运行预算：达到 token 数或费用上限后的处理方式
+RUN_TOKEN_BUDGET = None            # 总 token 数上限，None 表示不限
+RUN_COST_BUDGET = None             # 费用上限（元），None 表示不限
+RUN_BUDGET_ACTION = "stop"         # "stop" - 不再开始新的材料；"throttle" - LLM 并发收紧
+RUN_BUDGET_THROTTLE_CONCURRENCY = 1
+
+# LLM 回答缓存（SQLite，键为 model/temperature/messages/tools 的哈希）
+LLM_CACHE_ENABLED = True
+LLM_CACHE_PATH = "cache/llm_cache.sqlite3"
+LLM_CACHE_MAX_ENTRIES = 50000      # 超过后按最近访问时间淘汰
+LLM_CACHE_MAX_AGE_DAYS = 30        # 超过天数的记录失效；None 表示不过期
+# 请求合并：同时在途的相同请求只向上游发送一次，其余等待并共享结果
+LLM_SINGLE_FLIGHT_ENABLED = True
 
 # 数据文件路径
 DATA_FILE_PATH = "/home/thl/2025Fall/Mount-Data-to-KG/project/data/high_entropy_alloy.json"
@@ -21,10 +135,84 @@ ROOT_NAME = "材料"
 
 # ===== 新增配置 =====
 ENTITY_SIMILARITY_THRESHOLD = 20
+
+# 相似度筛选后的自动挂载：top1 相似度不低于阈值且领先第二名足够多时，跳过 mount_to_entity 的LLM调用
+AUTO_MOUNT_ENABLED = True
+AUTO_MOUNT_MIN_SIMILARITY = 0.98   # top1 余弦相似度下限
+AUTO_MOUNT_MIN_MARGIN = 0.05       # top1 与第二名的相似度差下限
 MAX_CONVERSATION_ROUNDS = 20
+# 同时处理的材料数上限（瓶颈是LLM延迟而非CPU）
+MAX_CONCURRENT_MATERIALS = 16
+# 截止时间：超过后取消进行中的LLM请求和Neo4j查询，记录超时错误并继续处理下一条材料
+MATERIAL_DEADLINE_SECONDS = 300    # 单条材料的时间预算（秒），None 表示不限
+ROUND_DEADLINE_SECONDS = 90        # 单轮（一次导航 / 筛选 / 挂载决策）的时间预算（秒），None 表示不限
+# 路由备忘：(Class节点, 成分签名) → 子节点，命中时不调用LLM
+ROUTING_MEMO_ENABLED = True
+ROUTING_MEMO_PATH = "cache/routing_memo.json"
+ROUTING_MEMO_RATIO_STEP = 0.05     # 成分摩尔分数的取整步长（比例接近的材料视为同一签名）
+ROUTING_MEMO_MIN_COUNT = 1         # 同一选择至少出现多少次才直接使用
+# 一次选到叶子：子树较小时把剩余子树展开为 "A → B → 叶子" 路径列表，一轮直接选择叶子节点
+ONE_SHOT_LEAF_ENABLED = True
+ONE_SHOT_MAX_LEAVES = 30           # 叶子数超过该值时改为逐层导航
+ONE_SHOT_MAX_DEPTH = 6             # 子树深度超过该值时改为逐层导航
+# kNN 路径预测：按成分与已挂载的材料比较，邻居一致且足够相似时直接挂载，不调用LLM
+KNN_PREDICTOR_ENABLED = True
+KNN_K = 5                          # 参与投票的最近邻个数
+KNN_MIN_SIMILARITY = 0.98          # 最近邻的余弦相似度下限
+KNN_MIN_CONFIDENCE = 0.8           # 指向同一Entity的邻居的相似度加权占比下限
+KNN_MIN_AGREEING = 2               # 至少多少个邻居指向同一Entity
+KNN_MAX_SAMPLES = 50000            # 启动时从图中读取的已挂载材料数上限
+# 批量导航：把停在同一Class节点的材料合并成一个提示词（每批最多 BATCH_CLASSIFICATION_SIZE 条）
+BATCH_CLASSIFICATION_ENABLED = False
+BATCH_CLASSIFICATION_SIZE = 20
+# 提示词中的材料字段投影（按轮次类型）
+#   fields: 保留的 data 字段（None 表示全部）；exclude_prefixes: 排除的字段前缀
+#   formula: 成分比重输出为化学式（如 Mn1Fe1Nb2）；compact: 紧凑 JSON（无缩进）
+# _id / _meta_id / _tid 等顶层元数据不会输出；删除某一项则该轮次输出完整数据
+PROMPT_PROFILES = {
+    "navigation": {
+        "fields": ["成分比重", "MGE18_标题", "MGE18_摘要", "MGE18_关键词"],
+        "formula": True,
+        "compact": True
+    },
+    "similarity": {
+        "fields": ["成分比重"],
+        "formula": True,
+        "compact": True
+    },
+    "mount": {
+        "fields": ["成分比重", "MGE18_标题", "MGE18_摘要"],
+        "formula": True,
+        "compact": True
+    }
+}
+# Neo4j 查询结果的短期缓存（分类树结构在一次运行中基本不变，所有材料共用）
+NEO4J_CACHE_ENABLED = True
+NEO4J_CACHE_TTL = 300              # 缓存有效期（秒）
+NEO4J_CACHE_MAX_ENTRIES = 20000
+# 推测预取：LLM 选择子分类期间，预先查询每个候选子节点下一轮需要的数据
+NEO4J_PREFETCH_ENABLED = True
+NEO4J_PREFETCH_WORKERS = 8         # 预取专用线程数（不占用主流程的线程池）
 # 特殊节点列表（需要特殊分类的节点）
 SPECIAL_NODES = ["高熵合金"]  # 后续可扩展
 
+# 规则预路由：按成分 / 元数据识别材料，直接跳到已知的分类路径前缀，只在落点以下调用LLM
+# 只启用落点（path 的最后一个节点）在 SPECIAL_NODES 中的规则；同一条材料按顺序取第一条命中的规则
+# 规则条件（都满足才命中，未写的条件不检查）：
+#   min_principal_elements - 摩尔分数不低于 principal_fraction 的元素数下限
+#   keywords               - keyword_fields 中任一字段包含任一关键词（不区分大小写）
+PRE_ROUTER_ENABLED = True
+PRE_ROUTER_RULES = [
+    {
+        "name": "高熵合金",
+        "path": ["材料", "金属材料", "特殊用途金属材料", "高熵合金"],
+        "min_principal_elements": 5,
+        "principal_fraction": 0.05,
+        "keywords": ["高熵合金", "high-entropy", "high entropy"],
+        "keyword_fields": ["MGE18_标题", "MGE18_摘要", "MGE18_关键词"]
+    }
+]
+
 # 分类最大深度（防止死循环）
 MAX_CLASSIFICATION_DEPTH = 20
 
@@ -34,4 +222,17 @@ LOG_FILE_PREFIX = "mount_log"  # 格式: mount_log_20250113_143025.log
 
 # 结果文件配置
 RESULT_DIR = "results"
-RESULT_FILE_PREFIX = "mount_result"  # 格式: mount_result_20250113_143025.json
\ No newline at end of file
+RESULT_FILE_PREFIX = "mount_result"  # 格式: mount_result_20250113_143025.json
+
+# 本地 LLM 替身（mock_llm_server.py，离线压测用）
+MOCK_LLM_HOST = "127.0.0.1"
+MOCK_LLM_PORT = 8765
+MOCK_LLM_SEED = 42
+# 延迟分布: {"type": "fixed", "ms": 0} / {"type": "uniform", "min_ms": .., "max_ms": ..}
+#          / {"type": "lognormal", "median_ms": .., "sigma": ..}
+MOCK_LLM_LATENCY = {"type": "lognormal", "median_ms": 3000, "sigma": 0.5}
+MOCK_LLM_ERROR_RATES = {429: 0.0, 500: 0.0, 503: 0.0}   # 各状态码的注入概率
+MOCK_LLM_SCRIPT_PATH = None        # 脚本规则 JSON 文件，None 表示只用内置规则
+MOCK_LLM_REASONING_CHARS = 200     # 生成的 reasoning 长度（字符）
+MOCK_LLM_STREAM_CHUNK_CHARS = 4    # 流式返回时每个分块的字符数
+MOCK_LLM_STREAM_CHUNK_DELAY_MS = 20   # 流式返回时分块之间的间隔（模拟逐 token 生成）
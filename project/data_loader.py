@@ -2,6 +2,7 @@
 数据加载模块 - 负责读取和解析材料数据
 """
 import json
+from config import PROMPT_PROFILES
 
 
 def load_material_data(file_path, index=0):
@@ -79,14 +80,73 @@ def load_all_materials(file_path):
         return []
 
 
-def format_material_for_prompt(material_data):
+def composition_to_formula(composition):
+    """
+    将成分比重转换为化学式字符串
+    
+    Args:
+        composition: {'Mn': 1.0, 'Fe': 1.0, 'Nb': 2.0, ...}
+    
+    Returns:
+        str: 例如 "Mn1Fe1Nb2"（整数比例去掉小数点，其余保留有效数字）
+    """
+    parts = []
+    for element, ratio in composition.items():
+        if isinstance(ratio, (int, float)):
+            ratio_str = str(int(ratio)) if float(ratio).is_integer() else f"{ratio:g}"
+        else:
+            ratio_str = str(ratio)
+        parts.append(f"{element}{ratio_str}")
+    return "".join(parts)
+
+
+def project_material(material_data, profile):
+    """
+    按投影配置挑选材料字段
+    
+    Args:
+        material_data: 材料数据字典
+        profile: PROMPT_PROFILES 中的一项 {fields, exclude_prefixes, formula}
+    
+    Returns:
+        dict: 只包含配置字段的材料数据（成分比重可替换为化学式）
+    """
+    data = material_data.get('data', {})
+    fields = profile.get('fields')
+    exclude_prefixes = tuple(profile.get('exclude_prefixes', ()))
+    
+    projected = {}
+    for key in (fields if fields is not None else data.keys()):
+        if key not in data or (exclude_prefixes and key.startswith(exclude_prefixes)):
+            continue
+        value = data[key]
+        # 空字段和 "None" 不影响分类，直接省略
+        if value in ('', None, 'None'):
+            continue
+        if key == '成分比重' and profile.get('formula') and isinstance(value, dict):
+            projected['化学式'] = composition_to_formula(value)
+        else:
+            projected[key] = value
+    return projected
+
+
+def format_material_for_prompt(material_data, profile_name=None):
     """
     将材料数据格式化为适合Prompt的字符串
     
     Args:
         material_data: 材料数据字典
+        profile_name: 投影配置名（navigation / similarity / mount，见 config.PROMPT_PROFILES）；
+                      None 或未配置时输出完整数据
     
     Returns:
         str: 格式化后的JSON字符串
     """
-    return json.dumps(material_data, ensure_ascii=False, indent=2)
\ No newline at end of file
+    profile = PROMPT_PROFILES.get(profile_name) if profile_name else None
+    if profile is None:
+        return json.dumps(material_data, ensure_ascii=False, indent=2)
+    
+    projected = project_material(material_data, profile)
+    if profile.get('compact', True):
+        return json.dumps(projected, ensure_ascii=False, separators=(',', ':'))
+    return json.dumps(projected, ensure_ascii=False, indent=2)
\ No newline at end of file
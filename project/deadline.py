@@ -0,0 +1,104 @@
+"""
+截止时间模块 - 每条材料 / 每轮的时间预算
+
+截止时间（time.monotonic() 的绝对时刻）保存在 ContextVar 中，与 usage_tracker 一样
+随 asyncio 任务和 asyncio.to_thread 传递：FunctionCallHandler 据此缩短 LLM 请求的超时，
+Neo4jConnector 据此设置查询的事务超时，不需要显式传参。
+"""
+import asyncio
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+
+_current_deadline = ContextVar('deadline', default=None)
+
+
+class DeadlineExceeded(TimeoutError):
+    """超过了材料或轮次的截止时间"""
+
+
+def set_deadline(seconds, parent=None):
+    """
+    把当前任务的截止时间设为 now + seconds（不晚于 parent）
+    
+    Args:
+        seconds: 时间预算（秒）；None 表示只受 parent 限制
+        parent: 外层截止时间（例如材料的截止时间），None 表示没有外层限制
+    
+    Returns:
+        float: 新的截止时间；都不限时为 None
+    """
+    deadline = time.monotonic() + seconds if seconds else None
+    if parent is not None:
+        deadline = parent if deadline is None else min(deadline, parent)
+    _current_deadline.set(deadline)
+    return deadline
+
+
+@contextmanager
+def deadline_scope(seconds, parent=None):
+    """在 with 块内使用 set_deadline 设置的截止时间，退出时恢复原值"""
+    token = _current_deadline.set(_current_deadline.get())
+    try:
+        yield set_deadline(seconds, parent)
+    finally:
+        _current_deadline.reset(token)
+
+
+def current_deadline():
+    """当前任务的截止时间（没有时返回 None）"""
+    return _current_deadline.get()
+
+
+def remaining_time():
+    """距离截止时间的秒数（可能为负）；没有截止时间时返回 None"""
+    deadline = _current_deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+def deadline_expired():
+    """是否已经超过截止时间"""
+    remaining = remaining_time()
+    return remaining is not None and remaining <= 0
+
+
+def request_timeout(default):
+    """
+    单次请求 / 查询的超时：default 与剩余时间中较小者
+    
+    Raises:
+        DeadlineExceeded: 已经超过截止时间
+    """
+    remaining = remaining_time()
+    if remaining is None:
+        return default
+    if remaining <= 0:
+        raise DeadlineExceeded("已超过截止时间")
+    return remaining if default is None else min(default, remaining)
+
+
+def raise_if_expired(error):
+    """捕获到异常时调用：已经超过截止时间则改为抛出 DeadlineExceeded（不再当作普通错误处理）"""
+    if deadline_expired():
+        raise DeadlineExceeded(f"已超过截止时间: {error}") from error
+
+
+async def with_deadline(awaitable):
+    """
+    在当前截止时间内等待 awaitable，超时则取消它
+    
+    Raises:
+        DeadlineExceeded: 超过截止时间
+    """
+    remaining = remaining_time()
+    if remaining is None:
+        return await awaitable
+    try:
+        return await asyncio.wait_for(awaitable, timeout=max(remaining, 0))
+    except DeadlineExceeded:
+        raise
+    except asyncio.TimeoutError as e:
+        raise DeadlineExceeded("已超过截止时间，已取消进行中的请求") from e
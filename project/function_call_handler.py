@@ -1,60 +1,402 @@
 """
-Function Call 处理模块 - 标准实现（支持对话历史）
+Function Call 处理模块 - 标准实现（支持对话历史，基于 AsyncOpenAI）
 """
+import asyncio
+import copy
 import json
-from openai import OpenAI
-from config import DEEPSEEK_API_KEY, DEEPSEEK_BASE_URL
+import random
+import time
+from openai import (
+    RateLimitError, APITimeoutError,
+    InternalServerError, APIConnectionError
+)
+from config import (
+    FUNCTION_CALL_FINAL_ANSWER,
+    LLM_MAX_RETRIES, LLM_RETRY_BASE_DELAY, LLM_RETRY_MAX_DELAY, LLM_REQUEST_TIMEOUT,
+    LLM_STREAMING_ENABLED, LLM_STREAM_DECISIVE_ARGS, LLM_STREAM_ABORT_WHEN_COMPLETE
+)
+from llm_client import get_shared_key_pool, ApiKeyPool
+from stream_parser import IncrementalArgumentParser
+from llm_cache import get_completion_cache
+from rate_limiter import get_shared_rate_limiter, estimate_request_tokens
+from hedging import get_shared_hedge_policy
+from model_router import get_model_router
+from classifier import cap_reasoning
+from single_flight import get_single_flight, request_key
+from usage_tracker import record_llm_call, extract_usage
+from deadline import (
+    DeadlineExceeded, request_timeout, remaining_time, raise_if_expired, with_deadline
+)
 
 
 class FunctionCallHandler:
-    """处理 DeepSeek Function Calling 的标准实现"""
+    """
+    处理 DeepSeek Function Calling 的标准实现
     
-    def __init__(self):
-        if not DEEPSEEK_API_KEY:
-            raise ValueError("未找到 DEEPSEEK_API_KEY 环境变量")
-        self.client = OpenAI(api_key=DEEPSEEK_API_KEY, base_url=DEEPSEEK_BASE_URL)
+    所有调用都是协程；被调用的 Python 函数（会访问 Neo4j）在线程池中执行，
+    因此多个材料可以在同一个事件循环里并发处理。
+    handler 本身不保存对话状态，一个实例可以被所有并发的材料共用。
+    """
     
-    def call_function_standard(self, messages, tools, available_functions, temperature=0):
+    def __init__(self, client=None, cache=None, rate_limiter=None, hedge_policy=None,
+                 streaming=None, key_pool=None, single_flight=None):
+        # 整次运行共享的 API Key 池（每个 Key 一个 AsyncOpenAI 客户端，连接池在材料之间复用）；
+        # 传入 client 时只使用该客户端
+        if key_pool is None:
+            key_pool = ApiKeyPool.from_client(client) if client is not None else get_shared_key_pool()
+        self.key_pool = key_pool
+        # 持久化的LLM回答缓存（默认使用进程内共享实例，未启用时为 None）
+        self.cache = cache if cache is not None else get_completion_cache()
+        # 所有 handler 共享的限流器（令牌桶 + AIMD 并发控制）
+        self.rate_limiter = rate_limiter or get_shared_rate_limiter()
+        # 对冲请求策略（未启用时为 None）
+        self.hedge_policy = hedge_policy or get_shared_hedge_policy()
+        # 流式调用 + 提前执行函数
+        self.streaming = LLM_STREAMING_ENABLED if streaming is None else streaming
+        # 相同的在途请求合并为一次上游调用（未启用时为 None）
+        self.single_flight = single_flight or get_single_flight()
+        
+        if self.streaming and self.hedge_policy is not None:
+            _warn_hedging_disabled()
+    
+    async def _create_completion(self, early_dispatch=None, **request):
+        """
+        调用 chat.completions.create，返回规范化的消息字典（先查缓存）
+        
+        Args:
+            early_dispatch: _EarlyDispatch，不为 None 时使用流式调用，
+                            决定性参数完整后立即执行函数（此时不对冲）；
+                            请求与在途的相同请求合并时不提前执行，由调用方在返回后执行
+            **request: chat.completions.create 的参数
+        
+        Returns:
+            dict: {role, content, tool_calls: [{id, type, function: {name, arguments}}]}
+        """
+        started = time.monotonic()
+        
+        cache_key = None
+        if self.cache is not None:
+            cache_key = self.cache.make_key(request)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                record_llm_call(
+                    _called_function_name(cached, request), extract_usage(None),
+                    (time.monotonic() - started) * 1000, from_cache=True
+                )
+                return cached
+        
+        async def request_upstream():
+            # 超过当前材料 / 轮次的截止时间时取消请求（包括重试和对冲）
+            if early_dispatch is not None:
+                response = await with_deadline(self._request_with_retry(
+                    request, send=lambda client: self._stream_request(client, request, early_dispatch)
+                ))
+                return response.message, response.usage, response.complete
+            response = await with_deadline(self._request_hedged(request))
+            return _normalize_message(response.choices[0].message), response.usage, True
+        
+        if self.single_flight is not None:
+            (message, usage, complete), shared = await with_deadline(
+                self.single_flight.run(request_key(request), request_upstream)
+            )
+        else:
+            (message, usage, complete), shared = await request_upstream(), False
+        
+        if shared:
+            # 共享其他调用的结果：不消耗 token，按缓存命中记录；复制一份避免调用方之间互相修改
+            record_llm_call(
+                _called_function_name(message, request), extract_usage(None),
+                (time.monotonic() - started) * 1000, from_cache=True
+            )
+            return copy.deepcopy(message)
+        
+        # 记录 token 用量和耗时（归到当前材料的当前轮次）
+        record_llm_call(
+            _called_function_name(message, request), extract_usage(usage),
+            (time.monotonic() - started) * 1000
+        )
+        
+        # 停止生成的流式回答只含已完整的字段，不是模型完整生成的回答，不写入缓存
+        if cache_key is not None and complete:
+            self.cache.put(cache_key, message)
+        
+        return message
+    
+    async def _request_hedged(self, request):
+        """
+        发出请求；超过对冲等待时间仍未返回时再发一个相同请求，先返回者生效，另一个被取消
+        
+        未启用对冲或对冲比例已达上限时等同于 _request_with_retry。
+        """
+        policy = self.hedge_policy
+        if policy is None:
+            return await self._request_with_retry(request)
+        
+        policy.record_request()
+        primary = asyncio.create_task(self._request_with_retry(request))
+        tasks = [primary]
+        # 调用方在任何一次等待中被取消（截止时间 / 请求合并）时，都取消尚未完成的请求，
+        # 不让它们继续占用限流名额和 Key
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=policy.hedge_delay())
+            if done or not policy.try_hedge():
+                return await primary
+            
+            hedge = asyncio.create_task(self._request_with_retry(request))
+            tasks.append(hedge)
+            pending = {primary, hedge}
+            while True:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                succeeded = [task for task in done if task.exception() is None]
+                if succeeded:
+                    if hedge in succeeded and primary not in succeeded:
+                        policy.record_hedge_win()
+                    return succeeded[0].result()
+                # 一个请求失败时继续等另一个；都失败则抛出异常
+                if not pending:
+                    return done.pop().result()
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+    
+    async def _request_with_retry(self, request, send=None):
+        """
+        经限流器和 Key 池调用 DeepSeek；429 / 超时收缩并发并退避重试，5xx / 连接错误只退避重试
+        
+        429 时该 Key 进入冷却；还有其他可用的 Key 时立即换 Key 重试，不收缩并发也不退避；
+        所有 Key 都在冷却时，在占用限流名额之前等待最早结束冷却的 Key（这就是 429 的退避，
+        冷却时间取 Retry-After），不再另外退避。
+        
+        Args:
+            request: chat.completions.create 的参数
+            send: 发出请求的协程函数（参数为 AsyncOpenAI 客户端），None 时直接调用 chat.completions.create
+        
+        Raises:
+            最后一次调用的异常（超过 LLM_MAX_RETRIES 次仍失败）；
+            DeadlineExceeded（剩余时间不够再等一次退避）
+        """
+        estimated_tokens = estimate_request_tokens(request)
+        
+        for attempt in range(LLM_MAX_RETRIES + 1):
+            cooldown = self.key_pool.cooldown_wait()
+            if cooldown > 0:
+                await _sleep_before_retry(cooldown * random.uniform(1.0, 1.2))
+            
+            backoff = False
+            async with self.rate_limiter.slot(estimated_tokens) as slot, self.key_pool.lease() as key:
+                try:
+                    started = time.monotonic()
+                    if send is not None:
+                        response = await send(key.client)
+                    else:
+                        response = await key.client.chat.completions.create(
+                            **request, timeout=request_timeout(LLM_REQUEST_TIMEOUT)
+                        )
+                    if self.hedge_policy is not None:
+                        self.hedge_policy.record_latency(time.monotonic() - started)
+                    usage = extract_usage(getattr(response, 'usage', None))
+                    key.record_success(usage)
+                    slot.success(usage['prompt_tokens'] + usage['completion_tokens'] or None)
+                    return response
+                except RateLimitError as e:
+                    raise_if_expired(e)
+                    self.key_pool.cool_down(key, _retry_after_seconds(e))
+                    if not self.key_pool.has_available_key():
+                        slot.throttled()
+                    if attempt == LLM_MAX_RETRIES:
+                        raise
+                except APITimeoutError as e:
+                    # 超时是因为截止时间缩短了请求超时，不是服务端拥塞，不收缩并发
+                    raise_if_expired(e)
+                    slot.throttled()
+                    backoff = True
+                    if attempt == LLM_MAX_RETRIES:
+                        raise
+                except (InternalServerError, APIConnectionError):
+                    key.record_error()
+                    backoff = True
+                    if attempt == LLM_MAX_RETRIES:
+                        raise
+            
+            # 退避在释放名额之后进行
+            if backoff:
+                delay = min(LLM_RETRY_MAX_DELAY, LLM_RETRY_BASE_DELAY * 2 ** attempt)
+                await _sleep_before_retry(delay * random.uniform(0.8, 1.2))
+    
+    async def _stream_request(self, client, request, early_dispatch):
+        """
+        流式调用：边接收边解析第一个 tool call 的参数
+        
+        决定性参数完整时交给 early_dispatch 提前执行函数；必填参数都已完整时可以停止生成。
+        函数已经提前执行后，流中途出错也不再重试，按已收到的参数继续。
+        
+        Returns:
+            _StreamedResponse: message 为规范化的消息字典，usage 为用量（停止生成时为估算值），
+                                complete 表示是否为完整生成的回答
+        """
+        stream = await client.chat.completions.create(
+            **request, stream=True, stream_options={"include_usage": True},
+            timeout=request_timeout(LLM_REQUEST_TIMEOUT)
+        )
+        
+        content = []
+        tool_calls = {}
+        first_index = None
+        parser = IncrementalArgumentParser()
+        usage = None
+        chunks = 0
+        aborted = False
+        
+        try:
+            async for chunk in stream:
+                if getattr(chunk, 'usage', None):
+                    usage = chunk.usage
+                if not chunk.choices:
+                    continue
+                chunks += 1
+                delta = chunk.choices[0].delta
+                if delta.content:
+                    content.append(delta.content)
+                
+                for tool_delta in delta.tool_calls or []:
+                    entry = tool_calls.setdefault(tool_delta.index, {'id': None, 'name': '', 'arguments': ''})
+                    if first_index is None:
+                        first_index = tool_delta.index
+                    if tool_delta.id:
+                        entry['id'] = tool_delta.id
+                    if tool_delta.function is None:
+                        continue
+                    if tool_delta.function.name:
+                        entry['name'] += tool_delta.function.name
+                    if tool_delta.function.arguments:
+                        entry['arguments'] += tool_delta.function.arguments
+                        if tool_delta.index == first_index:
+                            parser.feed(tool_delta.function.arguments)
+                
+                if first_index is not None:
+                    function_name = tool_calls[first_index]['name']
+                    early_dispatch.maybe_dispatch(function_name, parser)
+                    if early_dispatch.can_abort(function_name, parser):
+                        aborted = True
+                        break
+        except Exception:
+            if early_dispatch.task is None:
+                raise
+            aborted = True
+        finally:
+            if aborted:
+                await stream.close()
+        
+        calls = [
+            {
+                'id': entry['id'],
+                'type': 'function',
+                'function': {'name': entry['name'], 'arguments': entry['arguments']}
+            }
+            for _, entry in sorted(tool_calls.items())
+        ]
+        if aborted:
+            # 只保留已经执行的调用，参数取已经完整的字段
+            calls = calls[:1]
+            calls[0]['function']['arguments'] = json.dumps(parser.values, ensure_ascii=False)
+            if usage is None:
+                usage = {
+                    'prompt_tokens': estimate_request_tokens(request, output_reserve=0),
+                    'completion_tokens': chunks
+                }
+        
+        message = {'role': 'assistant', 'content': ''.join(content) or None}
+        if calls:
+            message['tool_calls'] = calls
+        complete = not aborted or early_dispatch.fully_parsed(calls[0]['function']['name'], parser)
+        return _StreamedResponse(message, usage, complete=complete)
+    
+    async def call_function_standard(self, messages, tools, available_functions, temperature=0,
+                                     final_answer=None, tool_choice="auto", tier=None):
         """
-        标准 Function Calling 流程（两次调用，返回更新后的对话历史）
+        标准 Function Calling 流程（返回更新后的对话历史）
+        
+        默认只调用一次模型：执行函数后立即返回，final_answer 为 None。
+        final_answer=True 时启用原来的两次调用流程，让模型基于函数结果再生成一次回答。
         
         Args:
             messages: 消息列表
             tools: 函数定义列表
             available_functions: 可执行的函数字典 {函数名: 函数对象}
             temperature: 温度参数
+            final_answer: 是否进行第二次调用生成最终回答（None 时使用 config.FUNCTION_CALL_FINAL_ANSWER）
+            tool_choice: "auto"，或函数名（强制模型调用该函数）
+            tier: model_router.ModelTier，决定模型和生成参数（None 时使用默认分级）；
+                  本次调用的耗时和是否有效记入该分级的统计
         
         Returns:
             dict: {
                 success, result, function_name, arguments, 
                 final_answer, updated_messages
             }
+        
+        Raises:
+            DeadlineExceeded: 超过当前材料 / 轮次的截止时间（其他错误通过 success=False 返回）
         """
+        if tier is None:
+            tier = get_model_router().default_tier
+        
+        started = time.monotonic()
+        result = await self._call_function_standard(
+            messages, tools, available_functions, temperature, final_answer, tool_choice, tier
+        )
+        
+        # 有效：模型调用了函数，且函数接受了模型给出的参数
+        function_result = result.get('result')
+        valid = result['success'] and not (
+            isinstance(function_result, dict) and function_result.get('success') is False
+        )
+        tier.record((time.monotonic() - started) * 1000, valid)
+        return result
+    
+    async def _call_function_standard(self, messages, tools, available_functions, temperature,
+                                      final_answer, tool_choice, tier):
+        """call_function_standard 的主体（tier 决定模型和生成参数）"""
         try:
+            # 指定函数名时强制模型调用该函数
+            if tool_choice != "auto":
+                tool_choice = {"type": "function", "function": {"name": tool_choice}}
+            
+            # 流式调用时，决定性参数一到就在线程池中执行函数
+            early_dispatch = _EarlyDispatch(tools, available_functions) if self.streaming else None
+            
             # ===== 第一次调用：让模型决定调用什么函数 =====
-            first_response = self.client.chat.completions.create(
-                model="deepseek-chat",
+            first_message = await self._create_completion(
+                early_dispatch=early_dispatch,
+                model=tier.model,
                 messages=messages,
                 tools=tools,
-                tool_choice="auto",
-                temperature=temperature
+                tool_choice=tool_choice,
+                **{'temperature': temperature, **tier.params}
             )
             
-            first_message = first_response.choices[0].message
-            
             # 检查是否调用了函数
-            if not first_message.tool_calls:
+            if not first_message.get('tool_calls'):
                 return {
                     'success': False,
                     'error': '模型未调用函数',
-                    'raw_response': first_message.content,
+                    'raw_response': first_message['content'],
                     'updated_messages': messages
                 }
             
             # 提取函数调用信息
-            tool_call = first_message.tool_calls[0]
-            function_name = tool_call.function.name
-            function_args = json.loads(tool_call.function.arguments)
+            tool_call = first_message['tool_calls'][0]
+            function_name = tool_call['function']['name']
+            try:
+                function_args = json.loads(tool_call['function']['arguments'])
+            except json.JSONDecodeError:
+                # 函数已经按决定性参数提前执行时，以执行时的参数为准
+                if early_dispatch is None or early_dispatch.task is None:
+                    raise
+                function_args = dict(early_dispatch.arguments)
+            # schema 的长度限制不被强制执行：capped 模式下在这里截断理由
+            function_args = cap_reasoning(function_args)
             
             # ===== 执行真实的 Python 函数 =====
             if function_name not in available_functions:
@@ -64,8 +406,15 @@ class FunctionCallHandler:
                     'updated_messages': messages
                 }
             
-            function_to_call = available_functions[function_name]
-            function_result = function_to_call(**function_args)
+            if early_dispatch is not None and early_dispatch.task is not None:
+                function_result = await early_dispatch.task
+                # 提前执行时 reasoning 还没生成完，用完整参数中的 reasoning 补上
+                if isinstance(function_result, dict) and 'reasoning' in function_result \
+                        and function_args.get('reasoning'):
+                    function_result['reasoning'] = function_args['reasoning']
+            else:
+                function_to_call = available_functions[function_name]
+                function_result = await asyncio.to_thread(function_to_call, **function_args)
             
             # ===== 将函数结果追加到消息历史 =====
             updated_messages = messages.copy()
@@ -73,18 +422,31 @@ class FunctionCallHandler:
             updated_messages.append({
                 "role": "tool",
                 "content": json.dumps(function_result, ensure_ascii=False),
-                "tool_call_id": tool_call.id
+                "tool_call_id": tool_call['id']
             })
             
-            # ===== 第二次调用：让模型基于函数结果生成最终答案 =====
-            second_response = self.client.chat.completions.create(
-                model="deepseek-chat",
+            if final_answer is None:
+                final_answer = FUNCTION_CALL_FINAL_ANSWER
+            
+            # ===== 单次调用模式：执行完函数直接返回 =====
+            if not final_answer:
+                return {
+                    'success': True,
+                    'result': function_result,
+                    'function_name': function_name,
+                    'arguments': function_args,
+                    'final_answer': None,
+                    'updated_messages': updated_messages,
+                    'raw_response': first_message
+                }
+            
+            # ===== 第二次调用（可选）：让模型基于函数结果生成最终答案 =====
+            final_message = await self._create_completion(
+                model=tier.model,
                 messages=updated_messages,
-                temperature=temperature
+                **{'temperature': temperature, **tier.params}
             )
             
-            final_message = second_response.choices[0].message
-            
             # 将最终回答也加入历史
             updated_messages.append(final_message)
             
@@ -93,14 +455,182 @@ class FunctionCallHandler:
                 'result': function_result,
                 'function_name': function_name,
                 'arguments': function_args,
-                'final_answer': final_message.content,
+                'final_answer': final_message['content'],
                 'updated_messages': updated_messages,
                 'raw_response': final_message
             }
-            
+        
+        except DeadlineExceeded:
+            raise
         except Exception as e:
             return {
                 'success': False,
                 'error': str(e),
                 'updated_messages': messages
-            }
\ No newline at end of file
+            }
+    
+    async def execute_function(self, function_name, available_functions, arguments, messages=None):
+        """
+        不经过模型，直接执行确定性函数（参数由程序给出）
+        
+        Args:
+            function_name: 函数名
+            available_functions: 可执行的函数字典 {函数名: 函数对象}
+            arguments: 函数参数
+            messages: 消息列表（原样返回，保持与 call_function_standard 一致）
+        
+        Returns:
+            dict: 与 call_function_standard 相同的结构
+        """
+        messages = messages or []
+        
+        if function_name not in available_functions:
+            return {
+                'success': False,
+                'error': f'函数 {function_name} 不可用',
+                'updated_messages': messages
+            }
+        
+        try:
+            function_result = await asyncio.to_thread(
+                available_functions[function_name], **arguments
+            )
+        except DeadlineExceeded:
+            raise
+        except Exception as e:
+            return {
+                'success': False,
+                'error': str(e),
+                'updated_messages': messages
+            }
+        
+        return {
+            'success': True,
+            'result': function_result,
+            'function_name': function_name,
+            'arguments': arguments,
+            'final_answer': None,
+            'updated_messages': messages,
+            'raw_response': None
+        }
+
+
+class _EarlyDispatch:
+    """流式调用中的提前执行：决定性参数完整时立即在线程池中执行函数（每次调用最多一次）"""
+    
+    def __init__(self, tools, available_functions):
+        self.available_functions = available_functions
+        self.required = {
+            tool['function']['name']: set(tool['function'].get('parameters', {}).get('required', []))
+            for tool in tools or []
+        }
+        self.properties = {
+            tool['function']['name']: set(tool['function'].get('parameters', {}).get('properties', {}))
+            for tool in tools or []
+        }
+        self.function_name = None
+        self.arguments = None
+        self.task = None
+    
+    def maybe_dispatch(self, function_name, parser):
+        """函数可用且决定性参数（LLM_STREAM_DECISIVE_ARGS）都已完整时开始执行"""
+        if self.task is not None or function_name not in self.available_functions:
+            return
+        decisive_args = LLM_STREAM_DECISIVE_ARGS.get(function_name)
+        if not decisive_args or not parser.complete(decisive_args):
+            return
+        self.function_name = function_name
+        self.arguments = dict(parser.values)
+        self.task = asyncio.create_task(asyncio.to_thread(
+            self.available_functions[function_name], **self.arguments
+        ))
+    
+    def can_abort(self, function_name, parser):
+        """函数已经执行、且必填参数都已完整时，可以停止生成"""
+        return (
+            LLM_STREAM_ABORT_WHEN_COMPLETE
+            and self.task is not None
+            and parser.complete(self.required.get(function_name, ()))
+        )
+    
+    def fully_parsed(self, function_name, parser):
+        """函数的全部参数（包括可选参数）都已完整：停止生成也没有丢失模型的输出"""
+        return parser.complete(self.properties.get(function_name, ()))
+
+
+class _StreamedResponse:
+    """流式调用的结果（与 SDK 响应一样带 usage，供限流器和用量统计使用）"""
+    
+    def __init__(self, message, usage, complete=True):
+        self.message = message
+        self.usage = usage
+        # False 表示中途停止生成（或流出错），message 只含已完整的字段
+        self.complete = complete
+
+
+def _called_function_name(message, request):
+    """本次调用返回的函数名；没有函数调用时取强制的 tool_choice，再没有返回 None"""
+    tool_calls = message.get('tool_calls')
+    if tool_calls:
+        return tool_calls[0]['function']['name']
+    tool_choice = request.get('tool_choice')
+    if isinstance(tool_choice, dict):
+        return tool_choice['function']['name']
+    return None
+
+
+_hedging_warned = False
+
+
+def _warn_hedging_disabled():
+    """同时启用了流式调用和对冲时提示一次：流式调用不发出对冲请求"""
+    global _hedging_warned
+    if _hedging_warned:
+        return
+    _hedging_warned = True
+    print("⚠️  LLM_HEDGE_ENABLED 已启用，但流式调用（LLM_STREAMING_ENABLED）不发出对冲请求；"
+          "需要对冲时请关闭流式调用")
+
+
+async def _sleep_before_retry(delay):
+    """
+    重试前等待 delay 秒
+    
+    Raises:
+        DeadlineExceeded: 剩余时间不够等待
+    """
+    remaining = remaining_time()
+    if remaining is not None and remaining <= delay:
+        raise DeadlineExceeded(f"剩余 {max(remaining, 0):.1f} 秒，不足以等待 {delay:.1f} 秒后重试")
+    await asyncio.sleep(delay)
+
+
+def _retry_after_seconds(error):
+    """从 429 响应的 Retry-After 头读取等待秒数，没有则返回 None"""
+    response = getattr(error, 'response', None)
+    if response is None:
+        return None
+    try:
+        return float(response.headers.get('retry-after'))
+    except (TypeError, ValueError):
+        return None
+
+
+def _normalize_message(message):
+    """把 SDK 返回的 ChatCompletionMessage 转为可缓存、可重新发送的字典"""
+    tool_calls = [
+        {
+            'id': tool_call.id,
+            'type': 'function',
+            'function': {
+                'name': tool_call.function.name,
+                'arguments': tool_call.function.arguments
+            }
+        }
+        for tool_call in (message.tool_calls or [])
+    ]
+    
+    normalized = {'role': 'assistant', 'content': message.content}
+    if tool_calls:
+        normalized['tool_calls'] = tool_calls
+    return normalized
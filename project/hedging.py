@@ -0,0 +1,84 @@
+"""
+对冲请求模块 - 降低 LLM 调用的长尾延迟
+
+一次调用超过最近延迟的某个分位数仍未返回时，再发一个相同的请求，
+先返回的结果生效，另一个被取消。对冲比例有上限，避免放大负载。
+"""
+from collections import deque
+from config import (
+    LLM_HEDGE_ENABLED, LLM_HEDGE_PERCENTILE, LLM_HEDGE_MIN_SAMPLES,
+    LLM_HEDGE_DEFAULT_DELAY, LLM_HEDGE_MAX_RATE, LLM_HEDGE_WINDOW
+)
+
+
+class HedgePolicy:
+    """记录最近的调用延迟，决定对冲等待时间和是否还允许对冲"""
+    
+    def __init__(self, percentile=LLM_HEDGE_PERCENTILE, min_samples=LLM_HEDGE_MIN_SAMPLES,
+                 default_delay=LLM_HEDGE_DEFAULT_DELAY, max_rate=LLM_HEDGE_MAX_RATE,
+                 window=LLM_HEDGE_WINDOW):
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.default_delay = default_delay
+        self.max_rate = max_rate
+        self.latencies = deque(maxlen=window)
+        self.requests = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+    
+    def record_latency(self, seconds):
+        """记录一次成功调用的耗时（秒）"""
+        self.latencies.append(seconds)
+    
+    def hedge_delay(self):
+        """
+        发出对冲请求前的等待时间（秒）
+        
+        样本不足时使用 default_delay，否则取最近延迟的 percentile 分位数。
+        """
+        if len(self.latencies) < self.min_samples:
+            return self.default_delay
+        ordered = sorted(self.latencies)
+        index = min(len(ordered) - 1, int(len(ordered) * self.percentile))
+        return ordered[index]
+    
+    def record_request(self):
+        self.requests += 1
+    
+    def try_hedge(self):
+        """对冲比例未超过 max_rate 时占用一次对冲名额并返回 True"""
+        if self.hedges + 1 > self.max_rate * max(self.requests, 1):
+            return False
+        self.hedges += 1
+        return True
+    
+    def record_hedge_win(self):
+        self.hedge_wins += 1
+    
+    def stats(self):
+        """返回对冲统计 {requests, hedges, hedge_wins, hedge_rate, delay}"""
+        return {
+            'requests': self.requests,
+            'hedges': self.hedges,
+            'hedge_wins': self.hedge_wins,
+            'hedge_rate': self.hedges / self.requests if self.requests else 0.0,
+            'delay': self.hedge_delay()
+        }
+
+
+_shared_policy = None
+
+
+def get_shared_hedge_policy():
+    """
+    获取进程内共享的对冲策略
+    
+    Returns:
+        HedgePolicy: 未启用（LLM_HEDGE_ENABLED=False）时返回 None
+    """
+    global _shared_policy
+    if not LLM_HEDGE_ENABLED:
+        return None
+    if _shared_policy is None:
+        _shared_policy = HedgePolicy()
+    return _shared_policy
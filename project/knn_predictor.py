@@ -0,0 +1,184 @@
+"""
+kNN 路径预测模块 - 按成分与已挂载的材料比较，预测完整的分类路径和目标Entity
+
+每个已挂载的 Material 节点都保存了成分（data）和所属 Entity，Entity 的父链即分类路径。
+新材料与所有样本计算成分余弦相似度，取最相似的 K 个邻居按相似度加权投票：
+最近邻足够相似、且多数邻居指向同一 Entity 时给出预测，否则交给LLM逐层导航。
+本次运行中新挂载的材料也会加入样本，图越满，需要调用LLM的材料越少。
+"""
+import heapq
+import threading
+from config import (
+    ROOT_ELEMENT_ID,
+    KNN_PREDICTOR_ENABLED, KNN_K, KNN_MIN_SIMILARITY, KNN_MIN_CONFIDENCE,
+    KNN_MIN_AGREEING, KNN_MAX_SAMPLES
+)
+
+
+def composition_vector(material_data):
+    """
+    成分比重 → 单位向量 {元素: 分量}
+    
+    Returns:
+        dict: 没有有效成分时返回 None
+    """
+    composition = material_data.get('data', material_data).get('成分比重', {})
+    values = {
+        element: float(value) for element, value in composition.items()
+        if isinstance(value, (int, float)) and value > 0
+    }
+    norm = sum(v * v for v in values.values()) ** 0.5
+    if norm == 0:
+        return None
+    return {element: value / norm for element, value in values.items()}
+
+
+def cosine(vec1, vec2):
+    """两个单位向量的余弦相似度"""
+    if len(vec1) > len(vec2):
+        vec1, vec2 = vec2, vec1
+    return sum(value * vec2.get(element, 0.0) for element, value in vec1.items())
+
+
+class KnnPathPredictor:
+    """已挂载材料的成分样本 + kNN 投票"""
+    
+    def __init__(self, k=KNN_K, min_similarity=KNN_MIN_SIMILARITY,
+                 min_confidence=KNN_MIN_CONFIDENCE, min_agreeing=KNN_MIN_AGREEING):
+        self.k = k
+        self.min_similarity = min_similarity
+        self.min_confidence = min_confidence
+        self.min_agreeing = min_agreeing
+        # [(向量, entity, path)]
+        self.samples = []
+        self.loaded = False
+        self.load_error = None
+        self.predictions = 0
+        self.abstentions = 0
+        self._lock = threading.Lock()
+    
+    def load(self, neo4j_conn, limit=KNN_MAX_SAMPLES):
+        """
+        从图中读取已挂载的材料（整次运行只读取一次）
+        
+        在 process_all_materials 开始处理材料之前调用，不受任何材料的截止时间限制。
+        读取失败也记为已读取（load_error 记录原因），本次运行不再重试全量查询，
+        只使用运行中新挂载的样本。
+        """
+        with self._lock:
+            if self.loaded:
+                return len(self.samples)
+            try:
+                for material in neo4j_conn.get_mounted_materials(ROOT_ELEMENT_ID, limit=limit):
+                    self._add(material['data'], material['path'], material['entity'])
+            except Exception as e:
+                self.load_error = str(e)
+            self.loaded = True
+            return len(self.samples)
+    
+    def add(self, material_data, classification_path, entity):
+        """
+        加入一条新挂载的材料
+        
+        Args:
+            material_data: 材料数据
+            classification_path: 分类路径 [{name, elementId}, ...]（到叶子Class节点为止）
+            entity: 挂载目标 {name, elementId}
+        """
+        with self._lock:
+            self._add(material_data, classification_path, entity)
+    
+    def _add(self, material_data, classification_path, entity):
+        vector = composition_vector(material_data)
+        if vector is None or not classification_path:
+            return
+        self.samples.append((
+            vector,
+            {'name': entity['name'], 'elementId': entity['elementId']},
+            [{'name': node['name'], 'elementId': node['elementId']} for node in classification_path]
+        ))
+    
+    def predict(self, material_data):
+        """
+        预测分类路径和目标Entity
+        
+        Returns:
+            dict: {
+                'classification_path': [...], 'target_element_id', 'target_name',
+                'confidence', 'top_similarity', 'agreeing', 'neighbors': [{name, similarity}]
+            }；邻居不一致或相似度不足时返回 None
+        """
+        vector = composition_vector(material_data)
+        if vector is None:
+            return None
+        
+        with self._lock:
+            samples = list(self.samples)
+        
+        neighbors = heapq.nlargest(
+            self.k,
+            ((cosine(vector, sample_vector), entity, path) for sample_vector, entity, path in samples),
+            key=lambda item: item[0]
+        )
+        
+        if not neighbors or neighbors[0][0] < self.min_similarity:
+            self.abstentions += 1
+            return None
+        
+        # 按目标Entity加权投票
+        votes = {}
+        for similarity, entity, path in neighbors:
+            vote = votes.setdefault(
+                entity['elementId'], {'weight': 0.0, 'count': 0, 'entity': entity, 'path': path}
+            )
+            vote['weight'] += similarity
+            vote['count'] += 1
+        
+        winner = max(votes.values(), key=lambda vote: vote['weight'])
+        total_weight = sum(vote['weight'] for vote in votes.values())
+        confidence = winner['weight'] / total_weight if total_weight > 0 else 0.0
+        agreeing = winner['count']
+        
+        if confidence < self.min_confidence or agreeing < self.min_agreeing:
+            self.abstentions += 1
+            return None
+        
+        self.predictions += 1
+        return {
+            'classification_path': [dict(node) for node in winner['path']],
+            'target_element_id': winner['entity']['elementId'],
+            'target_name': winner['entity']['name'],
+            'confidence': confidence,
+            'top_similarity': neighbors[0][0],
+            'agreeing': agreeing,
+            'neighbors': [
+                {'name': entity['name'], 'similarity': round(similarity, 4)}
+                for similarity, entity, _ in neighbors
+            ]
+        }
+    
+    def stats(self):
+        """返回 {samples, predictions, abstentions}"""
+        return {
+            'samples': len(self.samples),
+            'predictions': self.predictions,
+            'abstentions': self.abstentions
+        }
+
+
+_shared_predictor = None
+
+
+def get_knn_predictor():
+    """
+    获取进程内共享的 kNN 预测器（样本由 process_all_materials 在处理材料前 load）
+    
+    Returns:
+        KnnPathPredictor: 未启用（KNN_PREDICTOR_ENABLED=False）时返回 None
+    """
+    global _shared_predictor
+    if not KNN_PREDICTOR_ENABLED:
+        return None
+    if _shared_predictor is None:
+        _shared_predictor = KnnPathPredictor()
+    return _shared_predictor
@@ -0,0 +1,186 @@
+"""
+LLM 调用缓存模块 - 基于 SQLite 的内容寻址缓存
+
+缓存键是发送给 API 的全部请求参数（model / temperature / messages / tools / tool_choice，
+以及模型分级的 max_tokens 等生成参数；不含 stream 等传输方式参数）的 SHA-256，
+缓存值是规范化后的模型消息 {role, content, tool_calls}。
+所有调用都使用 temperature=0，相同的请求可以直接复用上一次的回答。
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from config import (
+    LLM_CACHE_ENABLED, LLM_CACHE_PATH,
+    LLM_CACHE_MAX_ENTRIES, LLM_CACHE_MAX_AGE_DAYS
+)
+
+
+# 只影响传输方式、不影响回答内容的参数，不计入缓存键
+_TRANSPORT_PARAMS = ('stream', 'stream_options', 'timeout')
+
+
+class CompletionCache:
+    """LLM 回答的持久化缓存（支持条目数 / 时间淘汰，记录命中统计）"""
+    
+    def __init__(self, path=LLM_CACHE_PATH, max_entries=LLM_CACHE_MAX_ENTRIES,
+                 max_age_days=LLM_CACHE_MAX_AGE_DAYS):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age_seconds = max_age_days * 24 * 3600 if max_age_days else None
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+        
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS completions (
+                key TEXT PRIMARY KEY,
+                response TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL,
+                hit_count INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_completions_last_access ON completions(last_access)"
+        )
+        self._conn.commit()
+    
+    @staticmethod
+    def make_key(request):
+        """
+        计算请求的缓存键
+        
+        Args:
+            request: chat.completions.create 的参数字典
+                     （除 _TRANSPORT_PARAMS 外全部计入：不同分级的 max_tokens 等参数不共用回答）
+        
+        Returns:
+            str: SHA-256 十六进制摘要
+        """
+        payload = {
+            key: value for key, value in request.items()
+            if key not in _TRANSPORT_PARAMS
+        }
+        encoded = json.dumps(payload, ensure_ascii=False, sort_keys=True, default=_to_jsonable)
+        return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+    
+    def get(self, key):
+        """
+        读取缓存
+        
+        Returns:
+            dict: 缓存的模型消息；未命中或已过期返回 None
+        """
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, created_at FROM completions WHERE key = ?", (key,)
+            ).fetchone()
+            
+            if row is None or self._expired(row[1], now):
+                self.misses += 1
+                return None
+            
+            self._conn.execute(
+                "UPDATE completions SET last_access = ?, hit_count = hit_count + 1 WHERE key = ?",
+                (now, key)
+            )
+            self._conn.commit()
+            self.hits += 1
+        
+        return json.loads(row[0])
+    
+    def put(self, key, message):
+        """写入缓存，并按时间 / 条目数淘汰旧记录"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO completions (key, response, created_at, last_access) "
+                "VALUES (?, ?, ?, ?)",
+                (key, json.dumps(message, ensure_ascii=False), now, now)
+            )
+            self.writes += 1
+            self._evict(now)
+            self._conn.commit()
+    
+    def stats(self):
+        """返回缓存统计 {hits, misses, hit_rate, writes, evictions, entries}"""
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM completions").fetchone()[0]
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+            'writes': self.writes,
+            'evictions': self.evictions,
+            'entries': entries
+        }
+    
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._conn.execute("DELETE FROM completions")
+            self._conn.commit()
+    
+    def close(self):
+        """关闭数据库连接"""
+        with self._lock:
+            self._conn.close()
+    
+    def _expired(self, created_at, now):
+        return self.max_age_seconds is not None and now - created_at > self.max_age_seconds
+    
+    def _evict(self, now):
+        """淘汰过期记录；超过条目上限时按最近访问时间淘汰最旧的记录"""
+        if self.max_age_seconds is not None:
+            cursor = self._conn.execute(
+                "DELETE FROM completions WHERE created_at < ?", (now - self.max_age_seconds,)
+            )
+            self.evictions += cursor.rowcount
+        
+        if self.max_entries:
+            count = self._conn.execute("SELECT COUNT(*) FROM completions").fetchone()[0]
+            overflow = count - self.max_entries
+            if overflow > 0:
+                cursor = self._conn.execute(
+                    "DELETE FROM completions WHERE key IN ("
+                    "SELECT key FROM completions ORDER BY last_access ASC LIMIT ?)",
+                    (overflow,)
+                )
+                self.evictions += cursor.rowcount
+
+
+def _to_jsonable(obj):
+    """把 OpenAI SDK 对象转换为可序列化的字典"""
+    if hasattr(obj, 'model_dump'):
+        return obj.model_dump(exclude_none=True)
+    raise TypeError(f"无法序列化类型 {type(obj).__name__}")
+
+
+_shared_cache = None
+
+
+def get_completion_cache():
+    """
+    获取进程内共享的缓存实例
+    
+    Returns:
+        CompletionCache: 未启用缓存（LLM_CACHE_ENABLED=False）时返回 None
+    """
+    global _shared_cache
+    if not LLM_CACHE_ENABLED:
+        return None
+    if _shared_cache is None:
+        _shared_cache = CompletionCache()
+    return _shared_cache
@@ -0,0 +1,225 @@
+"""
+LLM 客户端模块 - 整次运行共享的 AsyncOpenAI 客户端、HTTP 连接池与 API Key 池
+
+所有材料共用客户端，长连接在材料之间复用，
+避免每条材料都重新建立 TLS 连接和预热连接池。
+安装了 h2 时启用 HTTP/2，多个并发请求复用同一条连接。
+
+配置了多个 API Key（DEEPSEEK_API_KEYS）时每个 Key 一个客户端，
+请求分配给未完成请求数最少的可用 Key；遇到 429 的 Key 冷却一段时间，
+其间请求转到其他 Key，整体吞吐不再受单个账号的限流约束。
+"""
+import time
+from contextlib import asynccontextmanager
+from urllib.parse import urlparse
+import httpx
+from openai import AsyncOpenAI
+from config import (
+    DEEPSEEK_API_KEY, DEEPSEEK_BASE_URL, DEEPSEEK_API_KEYS, LLM_KEY_COOLDOWN, LLM_REQUEST_TIMEOUT,
+    LLM_HTTP_MAX_CONNECTIONS, LLM_HTTP_MAX_KEEPALIVE, LLM_HTTP_KEEPALIVE_EXPIRY, LLM_HTTP2
+)
+
+
+def http2_available():
+    """是否可以启用 HTTP/2（需要安装 h2）"""
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def create_client(api_key=DEEPSEEK_API_KEY, base_url=DEEPSEEK_BASE_URL,
+                  max_connections=LLM_HTTP_MAX_CONNECTIONS,
+                  max_keepalive=LLM_HTTP_MAX_KEEPALIVE,
+                  keepalive_expiry=LLM_HTTP_KEEPALIVE_EXPIRY,
+                  http2=LLM_HTTP2):
+    """
+    创建带连接池的 AsyncOpenAI 客户端
+    
+    Args:
+        api_key: DeepSeek API Key
+        base_url: API 地址
+        max_connections: 连接总数上限
+        max_keepalive: 保持空闲的长连接数
+        keepalive_expiry: 空闲长连接的保留时间（秒）
+        http2: 是否尝试使用 HTTP/2（未安装 h2 时自动退回 HTTP/1.1）
+    
+    Returns:
+        AsyncOpenAI
+    """
+    if not api_key:
+        raise ValueError("未找到 DEEPSEEK_API_KEY 环境变量")
+    
+    http_client = httpx.AsyncClient(
+        http2=http2 and http2_available(),
+        limits=httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive,
+            keepalive_expiry=keepalive_expiry
+        ),
+        timeout=LLM_REQUEST_TIMEOUT
+    )
+    # 重试由 FunctionCallHandler 配合限流器完成，关闭 SDK 自带的重试
+    return AsyncOpenAI(
+        api_key=api_key, base_url=base_url,
+        max_retries=0, timeout=LLM_REQUEST_TIMEOUT,
+        http_client=http_client
+    )
+
+
+def parse_api_keys(items=DEEPSEEK_API_KEYS, default_base_url=DEEPSEEK_BASE_URL):
+    """
+    解析 Key 池配置
+    
+    Args:
+        items: ["key", "key@base_url", ...]
+        default_base_url: 未写地址的 Key 使用的 API 地址
+    
+    Returns:
+        list: [(api_key, base_url), ...]
+    """
+    keys = []
+    for item in items:
+        api_key, _, base_url = item.partition('@')
+        keys.append((api_key.strip(), base_url.strip() or default_base_url))
+    return keys
+
+
+class ApiKey:
+    """Key 池中的一个 Key：客户端 + 健康状态 + 用量计数"""
+    
+    def __init__(self, label, client):
+        # 日志和统计中只出现标签（池中序号 + 地址），不包含 Key 的任何部分
+        self.label = label
+        self.client = client
+        self.outstanding = 0
+        self.cooldown_until = 0.0
+        self.requests = 0
+        self.throttled = 0
+        self.errors = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+    
+    def available(self, now):
+        return self.cooldown_until <= now
+    
+    def record_success(self, usage):
+        """记录一次成功的请求（usage 为 extract_usage 的结果）"""
+        self.prompt_tokens += usage['prompt_tokens']
+        self.completion_tokens += usage['completion_tokens']
+    
+    def record_error(self):
+        """记录一次 5xx / 连接错误"""
+        self.errors += 1
+    
+    def stats(self):
+        return {
+            'requests': self.requests,
+            'throttled': self.throttled,
+            'errors': self.errors,
+            'prompt_tokens': self.prompt_tokens,
+            'completion_tokens': self.completion_tokens,
+            'outstanding': self.outstanding,
+            'cooling_down': not self.available(time.monotonic())
+        }
+
+
+class ApiKeyPool:
+    """按未完成请求数最少分配 Key；429 的 Key 冷却后再参与分配"""
+    
+    def __init__(self, keys, cooldown=LLM_KEY_COOLDOWN):
+        if not keys:
+            raise ValueError("未找到 DEEPSEEK_API_KEY / DEEPSEEK_API_KEYS 环境变量")
+        self.keys = keys
+        self.cooldown = cooldown
+    
+    @classmethod
+    def from_config(cls, items=DEEPSEEK_API_KEYS):
+        """按配置为每个 Key 创建带连接池的客户端"""
+        return cls([
+            ApiKey(
+                f"key#{index}@{urlparse(base_url).netloc or base_url}",
+                create_client(api_key=api_key, base_url=base_url)
+            )
+            for index, (api_key, base_url) in enumerate(parse_api_keys(items))
+        ])
+    
+    @classmethod
+    def from_client(cls, client, label='client'):
+        """只包含一个现成客户端的池（测试或自定义客户端时使用）"""
+        return cls([ApiKey(label, client)])
+    
+    @asynccontextmanager
+    async def lease(self):
+        """
+        取出一个 Key 发请求（退出时归还）
+        
+        用法:
+            async with pool.lease() as key:
+                await key.client.chat.completions.create(...)
+        
+        不等待冷却：所有 Key 都在冷却时取最早结束冷却的那个。调用方应在占用限流名额之前
+        按 cooldown_wait() 等待，避免占着名额等冷却。
+        """
+        key = self._choose()
+        key.outstanding += 1
+        key.requests += 1
+        try:
+            yield key
+        finally:
+            key.outstanding -= 1
+    
+    def _choose(self):
+        now = time.monotonic()
+        available = [key for key in self.keys if key.available(now)]
+        if not available:
+            return min(self.keys, key=lambda key: key.cooldown_until)
+        return min(available, key=lambda key: (key.outstanding, key.requests))
+    
+    def cool_down(self, key, seconds=None):
+        """Key 遇到 429：冷却 seconds 秒（None 时使用 LLM_KEY_COOLDOWN）"""
+        key.throttled += 1
+        key.cooldown_until = max(key.cooldown_until, time.monotonic() + (seconds or self.cooldown))
+    
+    def cooldown_wait(self):
+        """距离最早有 Key 结束冷却的秒数；有可用的 Key 时为 0"""
+        now = time.monotonic()
+        return max(0.0, min(key.cooldown_until for key in self.keys) - now)
+    
+    def has_available_key(self):
+        """是否还有不在冷却中的 Key"""
+        now = time.monotonic()
+        return any(key.available(now) for key in self.keys)
+    
+    def stats(self):
+        """返回 {Key 标签: 用量计数}"""
+        return {key.label: key.stats() for key in self.keys}
+    
+    async def close(self):
+        for key in self.keys:
+            await key.client.close()
+
+
+_shared_pool = None
+
+
+def get_shared_key_pool():
+    """
+    获取进程内共享的 API Key 池（首次调用时按配置创建各 Key 的客户端）
+    
+    连接池绑定在创建它的事件循环上，应在 asyncio.run 内部获取，
+    并在运行结束前调用 close_shared_key_pool。
+    """
+    global _shared_pool
+    if _shared_pool is None:
+        _shared_pool = ApiKeyPool.from_config()
+    return _shared_pool
+
+
+async def close_shared_key_pool():
+    """关闭共享 Key 池中所有客户端及其连接池"""
+    global _shared_pool
+    if _shared_pool is not None:
+        await _shared_pool.close()
+        _shared_pool = None
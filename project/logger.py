@@ -86,4 +86,32 @@ class MountLogger:
     
     def log_error_record(self, material_index, error_message):
         """记录错误"""
-        self.logger.error(f"【处理失败】材料索引 {material_index}: {error_message}")
\ No newline at end of file
+        self.logger.error(f"【处理失败】材料索引 {material_index}: {error_message}")
+    
+    def bind(self, material_index):
+        """返回带材料索引前缀的日志记录器（并发处理时区分各材料的日志）"""
+        return MaterialLogger(self, material_index)
+
+
+class MaterialLogger:
+    """单条材料的日志记录器，每行加上 [#索引] 前缀"""
+    
+    def __init__(self, mount_logger, material_index):
+        self.mount_logger = mount_logger
+        self.prefix = f"[#{material_index}] "
+    
+    def info(self, message):
+        """记录信息"""
+        self.mount_logger.info(self.prefix + message)
+    
+    def debug(self, message):
+        """记录调试信息"""
+        self.mount_logger.debug(self.prefix + message)
+    
+    def warning(self, message):
+        """记录警告"""
+        self.mount_logger.warning(self.prefix + message)
+    
+    def error(self, message):
+        """记录错误"""
+        self.mount_logger.error(self.prefix + message)
\ No newline at end of file
@@ -1,53 +1,456 @@
 """
 主程序 - 材料知识图谱自动挂载系统（无历史记录版本）
 """
+import asyncio
+import json
 from config import (
     NEO4J_URI, NEO4J_USER, NEO4J_PASSWORD,
     DATA_FILE_PATH, ROOT_ELEMENT_ID, ROOT_NAME,
-    MAX_CONVERSATION_ROUNDS, ENTITY_SIMILARITY_THRESHOLD
+    MAX_CONVERSATION_ROUNDS, ENTITY_SIMILARITY_THRESHOLD,
+    MANDATED_TOOL_POLICY, TOOL_ARGUMENT_MAX_REPROMPTS,
+    AUTO_MOUNT_ENABLED, AUTO_MOUNT_MIN_SIMILARITY, AUTO_MOUNT_MIN_MARGIN,
+    MAX_CONCURRENT_MATERIALS, BATCH_CLASSIFICATION_ENABLED,
+    MATERIAL_DEADLINE_SECONDS, ROUND_DEADLINE_SECONDS,
+    ONE_SHOT_LEAF_ENABLED, ONE_SHOT_MAX_LEAVES, ONE_SHOT_MAX_DEPTH,
+    RUN_BUDGET_THROTTLE_CONCURRENCY, NEO4J_CACHE_ENABLED
 )
 from data_loader import load_all_materials, format_material_for_prompt
 from neo4j_connector import Neo4jConnector
+from neo4j_cache import CachedNeo4jConnector
 from classifier import (
     build_tools_for_class_node,
+    build_tools_for_subtree,
     build_tools_for_entity_selection
 )
 from function_call_handler import FunctionCallHandler
+from argument_repair import record_reprompt, repair_stats
+from llm_client import close_shared_key_pool
+from llm_cache import get_completion_cache
+from single_flight import get_single_flight
+from rate_limiter import get_shared_rate_limiter
+from hedging import get_shared_hedge_policy
+from usage_tracker import start_material_stats, current_material_stats, get_run_usage
+from deadline import DeadlineExceeded, set_deadline, current_deadline, with_deadline
+from model_router import get_model_router
+from routing_memo import get_routing_memo, composition_signature
+from pre_router import get_pre_router
+from knn_predictor import get_knn_predictor
+from batch_navigator import navigate_in_batches
 from logger import MountLogger
 from result_writer import ResultWriter
 
 
-def process_single_material(material_data, material_index, neo4j_conn, logger):
+async def call_mandated_function(handler, messages, tools, available_functions,
+                           function_name, direct_arguments=None, depth=None, node_name=None):
+    """
+    执行当前步骤唯一允许的函数（按 MANDATED_TOOL_POLICY）
+    
+    Args:
+        handler: FunctionCallHandler
+        messages: 消息列表
+        tools: 函数定义列表
+        available_functions: 可执行的函数字典
+        function_name: 当前步骤要求调用的函数名
+        direct_arguments: 确定性函数的参数；为 None 表示必须由模型给出参数
+        depth: 当前节点的深度（根节点为 0），用于选择模型分级
+        node_name: 当前节点名称，用于选择模型分级
+    
+    Returns:
+        dict: 与 call_function_standard 相同的结构
+    
+    模型给出的参数不在可用选项中（函数返回 valid_options）时，把错误和可选项反馈给模型，
+    只重新提示这一轮（最多 TOOL_ARGUMENT_MAX_REPROMPTS 次），不让整条材料失败。
+    """
+    if MANDATED_TOOL_POLICY == 'direct' and direct_arguments is not None:
+        return await handler.execute_function(
+            function_name, available_functions, direct_arguments, messages
+        )
+    
+    tool_choice = "auto" if MANDATED_TOOL_POLICY == 'auto' else function_name
+    tier = get_model_router().select(function_name, depth, node_name)
+    result = await handler.call_function_standard(
+        messages, tools, available_functions, temperature=0, tool_choice=tool_choice, tier=tier
+    )
+    
+    for _ in range(TOOL_ARGUMENT_MAX_REPROMPTS):
+        func_result = result.get('result')
+        if not result['success'] or not isinstance(func_result, dict) \
+                or func_result.get('success', True) or 'valid_options' not in func_result:
+            break
+        
+        record_reprompt()
+        # 模型的函数调用和返回的错误已在 updated_messages 中，再补充一条明确的要求
+        messages = result['updated_messages'] + [{
+            "role": "user",
+            "content": (
+                f"上一次调用 {result['function_name']} 的参数无效：{func_result['error']}。"
+                f"可选项：{json.dumps(func_result['valid_options'], ensure_ascii=False)}。"
+                f"请从可选项中选择，重新调用 {function_name}。"
+            )
+        }]
+        result = await handler.call_function_standard(
+            messages, tools, available_functions, temperature=0, tool_choice=tool_choice, tier=tier
+        )
+    
+    return result
+
+
+def build_round_messages(node_prompt, material_text, label="材料信息"):
+    """
+    按前缀缓存友好的顺序组装一轮的消息
+    
+    节点相关的静态说明放在 system 消息中，随材料变化的内容放在最后的 user 消息中。
+    同一节点上所有材料的 tools + system 消息逐字节相同，DeepSeek 可以复用缓存的前缀。
+    
+    Args:
+        node_prompt: 只依赖当前节点的说明文字（不能包含材料相关内容）
+        material_text: 材料信息（或其他随材料变化的内容）
+        label: material_text 前的标题；None 表示不加标题
+    
+    Returns:
+        list: [system 消息, user 消息]
+    """
+    user_content = f"{label}：\n{material_text}" if label else material_text
+    return [
+        {"role": "system", "content": node_prompt},
+        {"role": "user", "content": user_content}
+    ]
+
+
+def log_prefix_cache(logger, stats):
+    """逐轮输出本条材料 LLM 调用的前缀缓存命中（prompt_cache_hit_tokens）"""
+    for detail in stats.round_details:
+        if detail['from_cache'] or not detail['prompt_tokens']:
+            continue
+        hit_rate = detail['cached_tokens'] / detail['prompt_tokens']
+        logger.info(
+            f"    轮次 {detail['round']} {detail['node']} {detail['function']}: "
+            f"前缀缓存 {detail['cached_tokens']}/{detail['prompt_tokens']} tokens ({hit_rate:.0%})"
+        )
+
+
+def check_auto_mount(candidates):
+    """
+    判断相似度排序结果是否足够明确，可以跳过 mount_to_entity 的LLM调用
+    
+    Args:
+        candidates: 按相似度降序排列的候选 [{name, elementId, similarity}, ...]
+    
+    Returns:
+        dict: 自动挂载决策 {mode, target_element_id, target_name, top1_similarity, ...}；
+              不满足条件返回 None
+    """
+    if not AUTO_MOUNT_ENABLED or not candidates:
+        return None
+    
+    top1 = candidates[0]
+    top1_similarity = top1.get('similarity', 0)
+    runner_up_similarity = candidates[1].get('similarity', 0) if len(candidates) > 1 else 0
+    margin = top1_similarity - runner_up_similarity
+    
+    if top1_similarity < AUTO_MOUNT_MIN_SIMILARITY or margin < AUTO_MOUNT_MIN_MARGIN:
+        return None
+    
+    return {
+        'mode': 'auto',
+        'target_element_id': top1['elementId'],
+        'target_name': top1['name'],
+        'top1_similarity': top1_similarity,
+        'runner_up_similarity': runner_up_similarity,
+        'margin': margin,
+        'min_similarity': AUTO_MOUNT_MIN_SIMILARITY,
+        'min_margin': AUTO_MOUNT_MIN_MARGIN
+    }
+
+
+def select_subtree_leaf_paths(current_element_id, neo4j_conn, logger):
+    """
+    判断是否可以"一次选到叶子"，可以时返回子树的叶子路径
+    
+    叶子数超过 ONE_SHOT_MAX_LEAVES、深度超过 ONE_SHOT_MAX_DEPTH，
+    或子树只有一层（与逐层导航相同）时返回 None，改为逐层导航。
+    
+    Returns:
+        list: [[{name, elementId}, ...], ...] 或 None
+    """
+    if not ONE_SHOT_LEAF_ENABLED:
+        return None
+    
+    leaf_paths = neo4j_conn.get_subtree_leaf_paths(
+        current_element_id, max_depth=ONE_SHOT_MAX_DEPTH, limit=ONE_SHOT_MAX_LEAVES + 1
+    )
+    if len(leaf_paths) > ONE_SHOT_MAX_LEAVES:
+        logger.debug(f"  子树叶子数超过 {ONE_SHOT_MAX_LEAVES}，逐层导航")
+        return None
+    if any(len(path) > ONE_SHOT_MAX_DEPTH for path in leaf_paths):
+        logger.debug(f"  子树深度超过 {ONE_SHOT_MAX_DEPTH}，逐层导航")
+        return None
+    if all(len(path) == 1 for path in leaf_paths):
+        return None
+    return leaf_paths
+
+
+async def knn_mount_material(material_data, neo4j_conn, logger, handler, start_path=None):
+    """
+    kNN 路径预测：邻居一致且足够相似时直接挂载到预测的Entity，不调用LLM
+    
+    Args:
+        material_data: 材料数据字典
+        neo4j_conn: Neo4j连接器
+        logger: 日志记录器
+        handler: FunctionCallHandler
+        start_path: 已确定的分类路径前缀；预测路径与之不一致时不使用预测
+    
+    Returns:
+        tuple: (mount_to_entity 的返回值, decision, classification_path)；
+               未给出预测或挂载失败时返回 None（继续逐层导航）
+    """
+    predictor = get_knn_predictor()
+    if predictor is None or not predictor.loaded:
+        return None
+    
+    prediction = await asyncio.to_thread(predictor.predict, material_data)
+    if prediction is None:
+        logger.debug("  kNN 未给出预测（邻居不一致或相似度不足）")
+        return None
+    
+    path = prediction['classification_path']
+    if start_path and [n['elementId'] for n in path[:len(start_path)]] != [n['elementId'] for n in start_path]:
+        logger.debug("  kNN 预测路径与已确定的路径不一致，不使用预测")
+        return None
+    
+    logger.info(
+        f"  🔮 kNN 预测: {' → '.join(n['name'] for n in path)} → {prediction['target_name']} "
+        f"(置信度: {prediction['confidence']:.2f}, 最近邻相似度: {prediction['top_similarity']:.4f}, "
+        f"{prediction['agreeing']} 个邻居一致)"
+    )
+    
+    current_material_stats().classification_path = [dict(node) for node in path]
+    _, funcs_mount = build_tools_for_entity_selection(
+        [{'name': prediction['target_name'], 'elementId': prediction['target_element_id']}],
+        False, path[-1]['elementId'], material_data, neo4j_conn
+    )
+    result_mount = await handler.execute_function(
+        'mount_to_entity', funcs_mount,
+        {
+            'target_element_id': prediction['target_element_id'],
+            'reasoning': (
+                f"kNN 预测：{prediction['agreeing']} 个邻居一致，置信度 {prediction['confidence']:.2f}，"
+                f"最近邻相似度 {prediction['top_similarity']:.4f}"
+            )
+        }
+    )
+    
+    func_result_mount = result_mount.get('result') or {}
+    if not result_mount['success'] or func_result_mount.get('action') != 'mount':
+        error = result_mount.get('error') or func_result_mount.get('error')
+        logger.warning(f"  ⚠️  kNN 预测挂载失败，改为逐层导航: {error}")
+        return None
+    
+    decision = {
+        'mode': 'knn',
+        'confidence': prediction['confidence'],
+        'top_similarity': prediction['top_similarity'],
+        'agreeing': prediction['agreeing'],
+        'neighbors': prediction['neighbors']
+    }
+    return func_result_mount, decision, [dict(node) for node in path]
+
+
+def _finish_mount(func_result_mount, decision, classification_path, material_data,
+                  routing_memo, signature, logger):
+    """
+    挂载成功后的公共处理：记录日志、路由备忘和 kNN 样本
+    
+    Returns:
+        dict: {success, classification_path, mount_info}
+    """
+    logger.info(f"  ✅ 挂载成功！")
+    logger.info(f"  新节点: {func_result_mount['mounted_node_name']}")
+    logger.info(f"  目标: {func_result_mount['target_name']}")
+    
+    mount_info = {
+        'success': True,
+        'node_id': func_result_mount['mounted_node_id'],
+        'node_name': func_result_mount['mounted_node_name'],
+        'mounted_at': func_result_mount['mounted_at'],
+        'target_name': func_result_mount['target_name'],
+        'target_id': func_result_mount['target_element_id'],
+        'decision': decision
+    }
+    
+    # 记录完整路径
+    path_names = [node['name'] for node in classification_path]
+    logger.info(f"  分类路径: {' → '.join(path_names)}")
+    
+    if routing_memo is not None:
+        routing_memo.record_path(classification_path, signature)
+    
+    # 新挂载的材料加入 kNN 样本（路径截止到 Entity 之上的 Class 节点）
+    predictor = get_knn_predictor()
+    if predictor is not None:
+        class_path = [
+            node for node in classification_path
+            if node['elementId'] != func_result_mount['target_element_id']
+        ]
+        predictor.add(
+            material_data, class_path,
+            {'name': func_result_mount['target_name'], 'elementId': func_result_mount['target_element_id']}
+        )
+    
+    return {
+        'success': True,
+        'classification_path': classification_path,
+        'mount_info': mount_info
+    }
+
+
+async def pre_route_material(material_data, neo4j_conn, logger):
+    """
+    规则预路由：命中规则时返回规则落点的分类路径，否则返回 None
+    
+    Args:
+        material_data: 材料数据字典
+        neo4j_conn: Neo4j连接器
+        logger: 日志记录器
+    
+    Returns:
+        list: classification_path [{name, elementId}, ...] 或 None
+    """
+    pre_router = get_pre_router()
+    if pre_router is None:
+        return None
+    
+    rule_name, path = await asyncio.to_thread(pre_router.route, material_data, neo4j_conn)
+    if path is None:
+        logger.debug("  预路由未命中任何规则")
+        return None
+    
+    logger.info(f"  🧭 预路由命中规则 '{rule_name}': {' → '.join(node['name'] for node in path)}")
+    return path
+
+
+async def process_single_material(material_data, material_index, neo4j_conn, logger,
+                                  start_path=None, handler=None):
     """
     处理单条材料数据 - 每次调用都是新对话
     
+    Neo4j 查询在线程池中执行，不阻塞事件循环，多条材料可以并发处理。
+    
     Args:
         material_data: 材料数据字典
         material_index: 材料索引
         neo4j_conn: Neo4j连接器
         logger: 日志记录器
+        start_path: 已确定的分类路径前缀 [{name, elementId}, ...]，从其最后一个节点继续；
+                    None 表示从根节点开始
+        handler: FunctionCallHandler，可在并发的材料之间共用；None 时使用共享客户端新建一个
+    
+    超过 MATERIAL_DEADLINE_SECONDS（或某一轮超过 ROUND_DEADLINE_SECONDS）时取消进行中的请求，
+    返回 error_type='timeout' 的失败结果。
     
     Returns:
-        dict: {success, classification_path, mount_info, error}
+        dict: {success, classification_path, mount_info, error, error_type, stats}
     """
+    # 本条材料的 token / 耗时统计（FunctionCallHandler 和 Neo4jConnector 自动记录到这里）
+    stats = start_material_stats()
+    if handler is None:
+        handler = FunctionCallHandler()
+    
+    # 材料的截止时间：超过后取消进行中的LLM请求和Neo4j查询
+    set_deadline(MATERIAL_DEADLINE_SECONDS)
+    try:
+        result = await with_deadline(_classify_and_mount(
+            material_data, material_index, neo4j_conn, logger, handler, start_path
+        ))
+    except DeadlineExceeded as e:
+        result = await _finish_pending_mount(material_data, stats, logger)
+        if result is None:
+            logger.error(f"  ⏱️  超过截止时间（轮次 {stats.rounds}，节点 '{stats.current_node}'）: {e}")
+            result = {'success': False, 'error': f"超时: {e}", 'error_type': 'timeout'}
+    
+    result['stats'] = stats.to_dict()
+    logger.info(
+        f"  用量: {stats.rounds} 轮 / {stats.llm_calls} 次LLM调用, "
+        f"tokens {stats.prompt_tokens}+{stats.completion_tokens} (缓存 {stats.cached_tokens}), "
+        f"LLM {stats.llm_ms:.0f} ms, Neo4j {stats.neo4j_ms:.0f} ms"
+    )
+    log_prefix_cache(logger, stats)
+    return result
+
+
+async def _finish_pending_mount(material_data, stats, logger):
+    """
+    截止时间取消了 asyncio 一侧时，已经开始的挂载写入仍在线程中执行
+    
+    等待写入结束（受事务超时限制）：写入成功则按挂载成功记录，避免材料被记为超时后重复挂载。
+    
+    Returns:
+        dict: {success, classification_path, mount_info}；没有已开始的写入或写入未成功时返回 None
+    """
+    if stats.pending_mount is None:
+        return None
+    func_result_mount = await asyncio.wrap_future(stats.pending_mount)
+    if not func_result_mount.get('success'):
+        return None
+    
+    logger.warning("  ⏱️  超过截止时间，但挂载写入已经开始并完成，按挂载成功记录")
+    return _finish_mount(
+        func_result_mount, {'mode': 'completed_after_deadline'}, stats.classification_path or [],
+        material_data, get_routing_memo(), composition_signature(material_data), logger
+    )
+
+
+async def _classify_and_mount(material_data, material_index, neo4j_conn, logger, handler,
+                              start_path=None):
+    """从根节点（或 start_path 的末端）开始逐层导航并挂载单条材料（process_single_material 的主体）"""
     logger.info(f"\n{'='*70}")
     logger.info(f"开始处理材料 #{material_index}")
     logger.info(f"{'='*70}")
     
-    # 初始化
-    current_element_id = ROOT_ELEMENT_ID
-    current_name = ROOT_NAME
-    classification_path = [{'name': ROOT_NAME, 'elementId': ROOT_ELEMENT_ID}]
-    handler = FunctionCallHandler()
+    # 路由备忘：成分签名相同的材料在同一 Class 节点上复用历史选择
+    routing_memo = get_routing_memo()
+    signature = composition_signature(material_data)
     
-    # 格式化材料信息
-    material_str = format_material_for_prompt(material_data)
+    # kNN 路径预测：与已挂载材料的邻居一致且足够相似时直接挂载
+    knn_outcome = await knn_mount_material(material_data, neo4j_conn, logger, handler, start_path)
+    if knn_outcome is not None:
+        func_result_mount, decision, predicted_path = knn_outcome
+        return _finish_mount(
+            func_result_mount, decision, predicted_path, material_data,
+            routing_memo, signature, logger
+        )
+    
+    # 初始化：没有给出路径前缀时先尝试规则预路由
+    if not start_path:
+        start_path = await pre_route_material(material_data, neo4j_conn, logger)
+    classification_path = (
+        [dict(node) for node in start_path] if start_path
+        else [{'name': ROOT_NAME, 'elementId': ROOT_ELEMENT_ID}]
+    )
+    current_element_id = classification_path[-1]['elementId']
+    current_name = classification_path[-1]['name']
+    current_material_stats().classification_path = classification_path
+    
+    if len(classification_path) > 1:
+        logger.info(f"  从已确定的路径继续: {' → '.join(n['name'] for n in classification_path)}")
+    
+    # 格式化材料信息（按轮次类型只保留影响决策的字段）
+    material_str = format_material_for_prompt(material_data, 'navigation')
+    similarity_material_str = format_material_for_prompt(material_data, 'similarity')
+    mount_material_str = format_material_for_prompt(material_data, 'mount')
+    
+    stats = current_material_stats()
+    material_deadline = current_deadline()
     
     for round_num in range(1, MAX_CONVERSATION_ROUNDS + 1):
         logger.info(f"\n【轮次 {round_num}】当前节点: {current_name}")
+        stats.begin_round(round_num, current_name)
+        # 每轮重新计时（不晚于材料的截止时间），本轮的LLM请求和Neo4j查询都受其限制
+        set_deadline(ROUND_DEADLINE_SECONDS, parent=material_deadline)
         
         try:
-            labels = neo4j_conn.get_node_labels(current_element_id)
+            labels = await asyncio.to_thread(neo4j_conn.get_node_labels, current_element_id)
             
             if not labels:
                 error_msg = f"无法获取节点 '{current_name}' 的labels"
@@ -56,15 +459,56 @@ def process_single_material(material_data, material_index, neo4j_conn, logger):
             
             if 'Class' in labels:
                 logger.debug("当前在Class节点，构建导航工具")
-                tools, available_functions, helper_data = build_tools_for_class_node(
-                    current_element_id, current_name, neo4j_conn
+                tools, available_functions, helper_data = await asyncio.to_thread(
+                    build_tools_for_class_node, current_element_id, current_name, neo4j_conn
                 )
                 
                 # 获取是否有出边节点
                 outbound_nodes = helper_data.get('outbound_nodes', [])
                 
+                # 命中路由备忘时直接移动，不调用LLM
+                memo_node = (
+                    routing_memo.lookup(current_element_id, signature, outbound_nodes)
+                    if routing_memo is not None and outbound_nodes else None
+                )
+                if memo_node:
+                    logger.info(f"  📒 路由备忘命中: {current_name} → {memo_node['name']}")
+                    current_element_id = memo_node['elementId']
+                    current_name = memo_node['name']
+                    classification_path.append({'name': current_name, 'elementId': current_element_id})
+                    continue
+                
+                # 子树足够小时展开为叶子路径列表，一轮直接选到叶子
+                leaf_paths = (
+                    await asyncio.to_thread(select_subtree_leaf_paths, current_element_id, neo4j_conn, logger)
+                    if outbound_nodes else None
+                )
+                
                 # 根据是否有子分类，构建不同的 system_prompt
-                if outbound_nodes:
+                if leaf_paths:
+                    # 情况0：剩余子树较小，直接选择叶子分类
+                    tools, available_functions, helper_data = await asyncio.to_thread(
+                        build_tools_for_subtree, current_element_id, current_name, neo4j_conn, leaf_paths
+                    )
+                    logger.debug(f"子树共 {len(leaf_paths)} 个叶子分类，提示LLM使用 navigate_to_leaf")
+                    
+                    system_prompt = f"""你是材料知识图谱的导航助手。
+
+当前位置：{current_name}
+状态：🌲 **剩余子树共有 {len(leaf_paths)} 个叶子分类，可以一次选到底**
+
+任务：
+1. 仔细阅读每条分类路径后的【例子】
+2. 根据材料特征，选择最匹配的完整路径
+3. 调用 navigate_to_leaf 直接移动到该叶子分类
+
+请调用 navigate_to_leaf 函数。"""
+                    mandated_function = 'navigate_to_leaf'
+                    direct_arguments = None
+                    
+                    if isinstance(neo4j_conn, CachedNeo4jConnector):
+                        neo4j_conn.start_prefetch(helper_data['leaf_nodes'])
+                elif outbound_nodes:
                     # 情况1：还有子分类可选
                     logger.debug(f"发现 {len(outbound_nodes)} 个子分类，提示LLM使用 navigate_outbound")
                     
@@ -80,10 +524,13 @@ def process_single_material(material_data, material_index, neo4j_conn, logger):
 2. 根据材料特征，选择最匹配的子分类
 3. 调用 navigate_outbound 移动到该子分类
 
-材料信息：
-{material_str}
-
 请调用 navigate_outbound 函数。"""
+                    mandated_function = 'navigate_outbound'
+                    direct_arguments = None
+                    
+                    # LLM选择期间在后台预取每个候选下一轮需要的数据
+                    if isinstance(neo4j_conn, CachedNeo4jConnector):
+                        neo4j_conn.start_prefetch(outbound_nodes)
                 else:
                     # 情况2：已到达叶子节点，没有子分类
                     logger.debug("当前节点是叶子节点（无子分类），提示LLM使用 navigate_inbound")
@@ -100,13 +547,12 @@ def process_single_material(material_data, material_index, neo4j_conn, logger):
 2. 系统会返回可用的Entity节点列表
 3. 如果数量较多，会提供相似度搜索功能
 
-材料信息：
-{material_str}
-
 请调用 navigate_inbound 函数。"""
+                    mandated_function = 'navigate_inbound'
+                    direct_arguments = {'reasoning': f"'{current_name}' 是叶子节点，查看其下的Entity节点"}
                 
-                messages = [{"role": "user", "content": system_prompt}]
-                
+                messages = build_round_messages(system_prompt, material_str)
+            
             elif 'Entity' in labels:
                 # 在Entity节点（理论上不应该到这里）
                 logger.debug("当前在Entity节点，只能挂载")
@@ -121,21 +567,27 @@ def process_single_material(material_data, material_index, neo4j_conn, logger):
                 system_prompt = f"""直接挂载材料到当前Entity节点。
 
 目标节点：{current_name}
-材料信息：{material_str}
 
 调用 mount_to_entity 完成挂载。"""
-
-                messages = [{"role": "user", "content": system_prompt}]
+                
+                messages = build_round_messages(system_prompt, mount_material_str)
+                mandated_function = 'mount_to_entity'
+                direct_arguments = {
+                    'target_element_id': current_element_id,
+                    'reasoning': f"当前已位于Entity节点 '{current_name}'，直接挂载"
+                }
             
             else:
                 error_msg = f"节点 '{current_name}' 的labels异常: {labels}"
                 logger.error(error_msg)
                 return {'success': False, 'error': error_msg}
             
-            # 调用LLM（每次都是新对话）
-            logger.debug(f"调用LLM，可用函数: {list(available_functions.keys())}")
-            result = handler.call_function_standard(
-                messages, tools, available_functions, temperature=0
+            # 调用LLM（每次都是新对话），确定性函数按策略直接执行
+            logger.debug(f"执行 {mandated_function}，可用函数: {list(available_functions.keys())}")
+            result = await call_mandated_function(
+                handler, messages, tools, available_functions,
+                mandated_function, direct_arguments,
+                depth=len(classification_path) - 1, node_name=current_name
             )
             
             if not result['success']:
@@ -170,12 +622,32 @@ def process_single_material(material_data, material_index, neo4j_conn, logger):
                 # 继续下一轮
                 continue
             
+            elif action == 'jump':
+                # 一次跳到子树中的叶子节点
+                jumped_path = func_result['path']
+                logger.info(f"  跳转: {current_name} → {' → '.join(n['name'] for n in jumped_path)}")
+                logger.debug(f"  理由: {func_result.get('reasoning', '')}")
+                
+                classification_path.extend(jumped_path)
+                current_element_id = func_result['new_element_id']
+                current_name = func_result['to_node']
+                continue
+            
+            elif action == 'mount':
+                # 在Entity节点上直接挂载
+                return _finish_mount(
+                    func_result, {'mode': 'direct'}, classification_path, material_data,
+                    routing_memo, signature, logger
+                )
+            
             elif action == 'no_entities':
                 # 当前节点下没有Entity
                 logger.warning(f"  ⚠️  节点 '{current_name}' 下没有Entity节点")
                 
                 # 检查是否有出边Class节点
-                outbound_nodes = neo4j_conn.get_outbound_class_nodes(current_element_id)
+                outbound_nodes = await asyncio.to_thread(
+                    neo4j_conn.get_outbound_class_nodes, current_element_id
+                )
                 
                 if outbound_nodes:
                     # 有出边但LLM没看到 - 说明是代码逻辑问题
@@ -214,14 +686,15 @@ def process_single_material(material_data, material_index, neo4j_conn, logger):
                     # 调用相似度搜索
                     system_prompt_sim = f"""从 {entity_count} 个Entity中筛选top5最相似的材料。
 
-材料信息：{material_str}
-
 调用 get_similar_materials 筛选。"""
                     
-                    messages_sim = [{"role": "user", "content": system_prompt_sim}]
+                    messages_sim = build_round_messages(system_prompt_sim, similarity_material_str)
                     
-                    result_sim = handler.call_function_standard(
-                        messages_sim, tools_entity, funcs_entity, temperature=0
+                    result_sim = await call_mandated_function(
+                        handler, messages_sim, tools_entity, funcs_entity,
+                        'get_similar_materials',
+                        {'reasoning': f"Entity数量 {entity_count} 较多，按成分相似度筛选"},
+                        depth=len(classification_path) - 1, node_name=current_name
                     )
                     
                     if result_sim['success']:
@@ -241,27 +714,49 @@ def process_single_material(material_data, material_index, neo4j_conn, logger):
                     entities, False, current_element_id, material_data, neo4j_conn
                 )
                 
-                # 构建Entity选择提示
-                entity_list = "\n".join([
-                    f"{i}. {e['name']} (ID: {e['elementId']})" + 
-                    (f" - 相似度: {e.get('similarity', 0):.4f}" if 'similarity' in e else "")
-                    for i, e in enumerate(entities[:10], 1)
-                ])
+                # top1 相似度足够高且明显领先时直接挂载，不再调用LLM
+                decision = check_auto_mount(entities) if 'similarity' in entities[0] else None
                 
-                system_prompt_mount = f"""选择最合适的Entity节点进行挂载。
-
-可选Entity节点：
-{entity_list}
-
-材料信息：{material_str}
+                if decision:
+                    logger.info(
+                        f"  🤖 自动挂载: {decision['target_name']} "
+                        f"(相似度: {decision['top1_similarity']:.4f}, 领先: {decision['margin']:.4f})"
+                    )
+                    result_mount = await handler.execute_function(
+                        'mount_to_entity', funcs_mount,
+                        {
+                            'target_element_id': decision['target_element_id'],
+                            'reasoning': (
+                                f"自动挂载：top1 相似度 {decision['top1_similarity']:.4f}，"
+                                f"领先第二名 {decision['margin']:.4f}"
+                            )
+                        }
+                    )
+                else:
+                    decision = {'mode': 'llm'}
+                    
+                    # 构建Entity选择提示
+                    entity_list = "\n".join([
+                        f"{i}. {e['name']} (ID: {e['elementId']})" + 
+                        (f" - 相似度: {e.get('similarity', 0):.4f}" if 'similarity' in e else "")
+                        for i, e in enumerate(entities[:10], 1)
+                    ])
+                    
+                    system_prompt_mount = """选择最合适的Entity节点进行挂载。
 
 调用 mount_to_entity 完成挂载。请选择最匹配的Entity的elementId。"""
-                
-                messages_mount = [{"role": "user", "content": system_prompt_mount}]
-                
-                result_mount = handler.call_function_standard(
-                    messages_mount, tools_mount, funcs_mount, temperature=0
-                )
+                    
+                    # 候选列表（含相似度）随材料变化，和材料信息一起放在 user 消息中
+                    messages_mount = build_round_messages(
+                        system_prompt_mount,
+                        f"可选Entity节点：\n{entity_list}\n\n材料信息：\n{mount_material_str}",
+                        label=None
+                    )
+                    
+                    result_mount = await call_mandated_function(
+                        handler, messages_mount, tools_mount, funcs_mount, 'mount_to_entity',
+                        depth=len(classification_path) - 1, node_name=current_name
+                    )
                 
                 if not result_mount['success']:
                     error_msg = f"挂载失败: {result_mount.get('error')}"
@@ -271,29 +766,10 @@ def process_single_material(material_data, material_index, neo4j_conn, logger):
                 func_result_mount = result_mount['result']
                 
                 if func_result_mount.get('action') == 'mount':
-                    # 挂载成功！
-                    logger.info(f"  ✅ 挂载成功！")
-                    logger.info(f"  新节点: {func_result_mount['mounted_node_name']}")
-                    logger.info(f"  目标: {func_result_mount['target_name']}")
-                    
-                    mount_info = {
-                        'success': True,
-                        'node_id': func_result_mount['mounted_node_id'],
-                        'node_name': func_result_mount['mounted_node_name'],
-                        'mounted_at': func_result_mount['mounted_at'],
-                        'target_name': func_result_mount['target_name'],
-                        'target_id': func_result_mount['target_element_id']
-                    }
-                    
-                    # 记录完整路径
-                    path_names = [node['name'] for node in classification_path]
-                    logger.info(f"  分类路径: {' → '.join(path_names)}")
-                    
-                    return {
-                        'success': True,
-                        'classification_path': classification_path,
-                        'mount_info': mount_info
-                    }
+                    return _finish_mount(
+                        func_result_mount, decision, classification_path, material_data,
+                        routing_memo, signature, logger
+                    )
                 else:
                     error_msg = "挂载操作未返回mount action"
                     logger.error(error_msg)
@@ -304,6 +780,8 @@ def process_single_material(material_data, material_index, neo4j_conn, logger):
                 logger.error(error_msg)
                 return {'success': False, 'error': error_msg}
         
+        except DeadlineExceeded:
+            raise
         except Exception as e:
             error_msg = f"轮次 {round_num} 异常: {str(e)}"
             logger.error(error_msg)
@@ -317,6 +795,109 @@ def process_single_material(material_data, material_index, neo4j_conn, logger):
     return {'success': False, 'error': error_msg}
 
 
+async def process_all_materials(all_materials, neo4j_conn, logger, result_writer,
+                                max_concurrency=MAX_CONCURRENT_MATERIALS):
+    """
+    并发处理所有材料（最多 max_concurrency 条同时进行）
+    
+    Args:
+        all_materials: 材料数据列表
+        neo4j_conn: Neo4j连接器
+        logger: 日志记录器
+        result_writer: 结果记录器
+        max_concurrency: 同时处理的材料数上限
+    """
+    # 整次运行共用一个 handler（及其 Key 池和 HTTP 连接池），运行结束时关闭
+    handler = FunctionCallHandler()
+    try:
+        await _process_all_materials(
+            all_materials, neo4j_conn, logger, result_writer, handler, max_concurrency
+        )
+    finally:
+        key_stats = handler.key_pool.stats()
+        if len(key_stats) > 1:
+            for label, stats in key_stats.items():
+                logger.info(
+                    f"  API Key {label}: 请求 {stats['requests']} 次, 429 {stats['throttled']} 次, "
+                    f"错误 {stats['errors']} 次, tokens {stats['prompt_tokens']}+{stats['completion_tokens']}"
+                )
+        await close_shared_key_pool()
+
+
+async def _process_all_materials(all_materials, neo4j_conn, logger, result_writer, handler,
+                                 max_concurrency):
+    """process_all_materials 的主体：批量导航（可选）后并发处理每条材料"""
+    # kNN 样本在所有材料开始之前读取一次（不受任何材料的截止时间限制，失败也不再重试）
+    predictor = get_knn_predictor()
+    if predictor is not None:
+        sample_count = await asyncio.to_thread(predictor.load, neo4j_conn)
+        if predictor.load_error:
+            logger.warning(f"⚠️  kNN 样本读取失败，本次运行只使用新挂载的样本: {predictor.load_error}")
+        else:
+            logger.info(f"🔮 kNN 样本: {sample_count} 条已挂载材料")
+    
+    start_paths = {}
+    if BATCH_CLASSIFICATION_ENABLED:
+        # 先按Class节点分组批量向下导航，再逐条完成叶子节点的Entity选择和挂载
+        # 命中预路由规则的材料从规则落点开始批量导航
+        routed_paths = {}
+        for idx, material_data in enumerate(all_materials):
+            path = await pre_route_material(material_data, neo4j_conn, logger.bind(idx))
+            if path:
+                routed_paths[idx] = path
+        start_paths = await navigate_in_batches(
+            all_materials, neo4j_conn, logger, handler, start_paths=routed_paths
+        )
+    
+    semaphore = asyncio.Semaphore(max_concurrency)
+    run_usage = get_run_usage()
+    budget_throttled = False
+    
+    async def worker(idx, material_data):
+        nonlocal budget_throttled
+        async with semaphore:
+            # 运行预算：stop 时不再开始新的材料，throttle 时收紧LLM并发
+            if run_usage.exceeded():
+                if run_usage.action == 'stop':
+                    error_msg = "运行预算已用完，跳过该材料"
+                    result_writer.add_error_record(idx, material_data, error_msg)
+                    logger.log_error_record(idx, error_msg)
+                    return
+                if not budget_throttled:
+                    budget_throttled = True
+                    get_shared_rate_limiter().set_max_concurrency(RUN_BUDGET_THROTTLE_CONCURRENCY)
+                    logger.warning(
+                        f"⚠️  运行预算已用完，LLM并发收紧到 {RUN_BUDGET_THROTTLE_CONCURRENCY}"
+                    )
+            
+            material_logger = logger.bind(idx)
+            try:
+                result = await process_single_material(
+                    material_data, idx, neo4j_conn, material_logger,
+                    start_path=start_paths.get(idx), handler=handler
+                )
+            except Exception as e:
+                result = {'success': False, 'error': f"未捕获的异常: {str(e)}"}
+        
+        if result['success']:
+            result_writer.add_success_record(
+                idx, material_data,
+                result['classification_path'],
+                result['mount_info'],
+                stats=result.get('stats')
+            )
+        else:
+            result_writer.add_error_record(
+                idx, material_data, result['error'], stats=result.get('stats'),
+                error_type=result.get('error_type')
+            )
+            logger.log_error_record(idx, result['error'])
+    
+    await asyncio.gather(*(
+        worker(idx, material_data) for idx, material_data in enumerate(all_materials)
+    ))
+
+
 def main():
     """主函数 - 批量处理"""
     
@@ -348,21 +929,17 @@ def main():
         logger.error("无法连接Neo4j，程序终止")
         return
     
+    # 分类树结构查询走短期缓存，并在LLM选择期间预取候选节点
+    if NEO4J_CACHE_ENABLED:
+        neo4j_conn = CachedNeo4jConnector(neo4j_conn)
+    
     # 批量处理
-    logger.info(f"\n开始批量处理 {len(all_materials)} 条材料数据\n")
+    logger.info(
+        f"\n开始批量处理 {len(all_materials)} 条材料数据"
+        f"（并发上限: {MAX_CONCURRENT_MATERIALS}）\n"
+    )
     
-    for idx, material_data in enumerate(all_materials):
-        result = process_single_material(material_data, idx, neo4j_conn, logger)
-        
-        if result['success']:
-            result_writer.add_success_record(
-                idx, material_data,
-                result['classification_path'],
-                result['mount_info']
-            )
-        else:
-            result_writer.add_error_record(idx, material_data, result['error'])
-            logger.log_error_record(idx, result['error'])
+    asyncio.run(process_all_materials(all_materials, neo4j_conn, logger, result_writer))
     
     # 关闭连接
     neo4j_conn.close()
@@ -371,16 +948,106 @@ def main():
     logger.info("\n保存结果文件")
     result_writer.save()
     
+    routing_memo = get_routing_memo()
+    if routing_memo is not None:
+        routing_memo.save()
+    
     # 统计
     total = len(all_materials)
     success = sum(1 for r in result_writer.results if r['status'] == 'success')
     failed = total - success
+    timeouts = sum(1 for r in result_writer.results if r.get('error_type') == 'timeout')
     
     logger.info(f"\n{'='*70}")
     logger.info(f"处理完成！")
     logger.info(f"  总计: {total} 条")
     logger.info(f"  成功: {success} 条")
-    logger.info(f"  失败: {failed} 条")
+    logger.info(f"  失败: {failed} 条（超时 {timeouts} 条）")
+    
+    knn_predictor = get_knn_predictor()
+    if knn_predictor is not None:
+        knn_stats = knn_predictor.stats()
+        logger.info(
+            f"  kNN 预测: 直接挂载 {knn_stats['predictions']} / 未预测 {knn_stats['abstentions']} "
+            f"(样本 {knn_stats['samples']})"
+        )
+    
+    pre_router = get_pre_router()
+    if pre_router is not None:
+        router_stats = pre_router.stats()
+        hits = ", ".join(f"{name} {count}" for name, count in router_stats['hits'].items()) or "0"
+        logger.info(f"  预路由: 命中 {hits} / 未命中 {router_stats['misses']}")
+    
+    if routing_memo is not None:
+        memo_stats = routing_memo.stats()
+        logger.info(
+            f"  路由备忘: 命中 {memo_stats['hits']} / 未命中 {memo_stats['misses']} "
+            f"(备忘项 {memo_stats['entries']})"
+        )
+    
+    usage_summary = get_run_usage().summary()
+    logger.info(
+        f"  LLM用量: {usage_summary['calls']} 次调用, "
+        f"tokens {usage_summary['prompt_tokens']}+{usage_summary['completion_tokens']} "
+        f"(缓存 {usage_summary['cached_tokens']}), 估算费用 {usage_summary['cost']:.4f} 元"
+    )
+    for node_name, node_usage in usage_summary['top_nodes'].items():
+        logger.info(
+            f"    {node_name}: {node_usage['calls']} 次, "
+            f"tokens {node_usage['prompt_tokens']}+{node_usage['completion_tokens']} "
+            f"(前缀缓存 {node_usage['cached_tokens']})"
+        )
+    
+    limiter_stats = get_shared_rate_limiter().snapshot()
+    logger.info(
+        f"  LLM限流: 请求 {limiter_stats['requests']} 次, 限流 {limiter_stats['throttled']} 次, "
+        f"并发上限 {limiter_stats['limit']}, 累计等待 {limiter_stats['wait_seconds']:.1f} 秒"
+    )
+    
+    for tier_name, tier_stats in get_model_router().stats().items():
+        valid_rate = tier_stats['valid_rate']
+        logger.info(
+            f"  模型分级 {tier_name} ({tier_stats['model']}): {tier_stats['calls']} 次, "
+            f"平均 {tier_stats['avg_ms']:.0f} ms, 有效率 {valid_rate:.1%}"
+        )
+    
+    hedge_policy = get_shared_hedge_policy()
+    if hedge_policy is not None:
+        hedge_stats = hedge_policy.stats()
+        logger.info(
+            f"  对冲请求: {hedge_stats['hedges']} / {hedge_stats['requests']} "
+            f"(对冲胜出 {hedge_stats['hedge_wins']} 次, 当前等待 {hedge_stats['delay']:.1f} 秒)"
+        )
+    
+    cache = get_completion_cache()
+    if cache is not None:
+        cache_stats = cache.stats()
+        logger.info(
+            f"  LLM缓存: 命中 {cache_stats['hits']} / 未命中 {cache_stats['misses']} "
+            f"(命中率 {cache_stats['hit_rate']:.1%}, 条目 {cache_stats['entries']}, "
+            f"淘汰 {cache_stats['evictions']})"
+        )
+    
+    single_flight = get_single_flight()
+    if single_flight is not None:
+        logger.info(
+            f"  请求合并: 上游请求 {single_flight.stats['leaders']} 次, "
+            f"合并 {single_flight.stats['coalesced']} 次"
+        )
+    
+    argument_stats = repair_stats()
+    if argument_stats['repaired'] or argument_stats['reprompted']:
+        logger.info(
+            f"  参数修复: 修复 {argument_stats['repaired']} 次, "
+            f"重新提示 {argument_stats['reprompted']} 次"
+        )
+    
+    if isinstance(neo4j_conn, CachedNeo4jConnector):
+        neo4j_stats = neo4j_conn.cache_stats()
+        logger.info(
+            f"  Neo4j缓存: 命中 {neo4j_stats['hits']} / 未命中 {neo4j_stats['misses']} "
+            f"(预取候选 {neo4j_stats['prefetched']} 个, 条目 {neo4j_stats['entries']})"
+        )
     logger.info(f"{'='*70}")
     logger.info(f"\n日志文件: {logger.log_file_path}")
     logger.info(f"结果文件: {result_writer.result_file_path}")
@@ -2,6 +2,10 @@
 真实的函数实现 - 供 Function Call 调用（修改版）
 """
 import json
+from concurrent.futures import Future
+from argument_repair import match_option
+from deadline import raise_if_expired
+from usage_tracker import timed_neo4j, current_material_stats
 
 
 def calculate_composition_similarity(material_data, entity_data):
@@ -49,14 +53,14 @@ def calculate_composition_similarity(material_data, entity_data):
 
 
 # ===== 函数1：导航到出边Class节点 =====
-def navigate_outbound(next_node_name, reasoning, current_element_id, current_name, 
-                      available_nodes, neo4j_conn):
+def navigate_outbound(next_node_name, current_element_id, current_name,
+                      available_nodes, neo4j_conn, reasoning=''):
     """
     函数1：选择一个出边Class节点并移动
     
     参数由LLM提供：
         next_node_name: 选择的下一个节点名称
-        reasoning: 选择理由
+        reasoning: 选择理由（REASONING_MODE 不要求时为空字符串）
     
     预先绑定的参数：
         current_element_id: 当前节点的elementId
@@ -73,39 +77,151 @@ def navigate_outbound(next_node_name, reasoning, current_element_id, current_nam
             'new_element_id': '...',
             'reasoning': '...'
         }
+    
+    名称与选项有细微差别（空格、全角、附带说明、序号）但能唯一确定时，
+    按对应的选项执行，并在返回值中加上 'repaired' 说明。
     """
-    # 验证选择是否有效
-    valid_node = None
-    for node in available_nodes:
-        if node['name'] == next_node_name:
-            valid_node = node
-            break
-    
-    if not valid_node:
+    # 验证选择是否有效（近似的名称对应到唯一的选项）
+    names = [node['name'] for node in available_nodes]
+    node_name, repaired = match_option(next_node_name, names)
+    
+    if node_name is None:
         return {
             'success': False,
             'error': f"节点 '{next_node_name}' 不在可用选项中",
-            'valid_options': [n['name'] for n in available_nodes]
+            'valid_options': names
         }
     
-    return {
+    valid_node = available_nodes[names.index(node_name)]
+    move = {
         'success': True,
         'action': 'move',
         'from_node': current_name,
-        'to_node': next_node_name,
+        'to_node': node_name,
         'new_element_id': valid_node['elementId'],
         'reasoning': reasoning,
-        'path_update': f"{current_name} → {next_node_name}"
+        'path_update': f"{current_name} → {node_name}"
     }
+    if repaired:
+        move['repaired'] = repaired
+    return move
+
+
+# ===== 函数1（批量）：为一批材料选择出边Class节点 =====
+def navigate_outbound_batch(decisions, current_element_id, current_name,
+                            available_nodes, material_ids, neo4j_conn):
+    """
+    函数1的批量版本：一次为多条材料选择出边Class节点
+    
+    参数由LLM提供：
+        decisions: [{'material_id': 0, 'next_node_name': '...', 'reasoning': '...'}, ...]
+    
+    预先绑定的参数：
+        current_element_id: 当前节点的elementId
+        current_name: 当前节点名称
+        available_nodes: 可用的出边节点列表
+        material_ids: 本批材料编号列表
+        neo4j_conn: Neo4j连接器
+    
+    Returns:
+        dict: {
+            'success': True,
+            'action': 'batch_move',
+            'moves': {0: {navigate_outbound 的返回值}, ...},
+            'missing': [没有得到有效选择的材料编号]
+        }
+    """
+    moves = {}
+    for decision in decisions:
+        # 模型有时把编号写成字符串 "0"
+        material_id, _ = match_option(decision.get('material_id'), material_ids,
+                                      allow_index=False)
+        if material_id is None or material_id in moves:
+            continue
+        
+        move = navigate_outbound(
+            decision.get('next_node_name'), current_element_id, current_name,
+            available_nodes, neo4j_conn, reasoning=decision.get('reasoning', '')
+        )
+        if move['success']:
+            moves[material_id] = move
+    
+    return {
+        'success': True,
+        'action': 'batch_move',
+        'moves': moves,
+        'missing': [material_id for material_id in material_ids if material_id not in moves]
+    }
+
+
+# ===== 函数1（子树）：从展开的子树中直接选择叶子节点 =====
+def navigate_to_leaf(leaf_path, current_element_id, current_name, available_paths,
+                     neo4j_conn, reasoning=''):
+    """
+    函数1的子树版本：一次选择子树中的叶子Class节点，跳过中间各层
+    
+    参数由LLM提供：
+        leaf_path: 选择的路径字符串（"A → B → 叶子"）
+        reasoning: 选择理由（REASONING_MODE 不要求时为空字符串）
+    
+    预先绑定的参数：
+        current_element_id: 当前节点的elementId
+        current_name: 当前节点名称
+        available_paths: {路径字符串: [{name, elementId}, ...]}
+        neo4j_conn: Neo4j连接器
+    
+    Returns:
+        dict: {
+            'success': True,
+            'action': 'jump',
+            'from_node': '金属材料',
+            'to_node': '高熵合金',
+            'new_element_id': '...',
+            'path': [{'name': ..., 'elementId': ...}, ...],
+            'reasoning': '...',
+            'path_update': '金属材料 → 合金 → 高熵合金'
+        }
+    
+    只给出叶子名称（且唯一）或路径写法有细微差别时，按对应的路径执行。
+    """
+    # 叶子名称 → 路径（叶子名称重复时不作为别名）
+    leaf_names = {}
+    for path_str, nodes in available_paths.items():
+        leaf_names.setdefault(nodes[-1]['name'], []).append(path_str)
+    aliases = {name: paths[0] for name, paths in leaf_names.items() if len(paths) == 1}
+    
+    path_str, repaired = match_option(leaf_path, list(available_paths), aliases=aliases)
+    
+    if path_str is None:
+        return {
+            'success': False,
+            'error': f"路径 '{leaf_path}' 不在可用选项中",
+            'valid_options': list(available_paths)
+        }
+    
+    path = available_paths[path_str]
+    jump = {
+        'success': True,
+        'action': 'jump',
+        'from_node': current_name,
+        'to_node': path[-1]['name'],
+        'new_element_id': path[-1]['elementId'],
+        'path': [dict(node) for node in path],
+        'reasoning': reasoning,
+        'path_update': f"{current_name} → {path_str}"
+    }
+    if repaired:
+        jump['repaired'] = repaired
+    return jump
 
 
 # ===== 函数2：查看入边Entity节点 =====
-def navigate_inbound(reasoning, current_element_id, current_name, neo4j_conn):
+def navigate_inbound(current_element_id, current_name, neo4j_conn, reasoning=''):
     """
     函数2：查看入边指向的Entity节点
     
     参数由LLM提供：
-        reasoning: 为什么要查看Entity节点
+        reasoning: 为什么要查看Entity节点（可为空）
     
     预先绑定的参数：
         current_element_id: 当前节点的elementId
@@ -164,12 +280,12 @@ def navigate_inbound(reasoning, current_element_id, current_name, neo4j_conn):
 
 
 # ===== 函数3：获取top5相似Entity =====
-def get_similar_materials(reasoning, current_element_id, material_data, neo4j_conn):
+def get_similar_materials(current_element_id, material_data, neo4j_conn, reasoning=''):
     """
     函数3：从大量Entity中筛选top5相似的材料
     
     参数由LLM提供：
-        reasoning: 为什么需要筛选
+        reasoning: 为什么需要筛选（可为空）
     
     预先绑定的参数：
         current_element_id: 当前Class节点的elementId
@@ -221,17 +337,21 @@ def get_similar_materials(reasoning, current_element_id, material_data, neo4j_co
 
 
 # ===== 函数4：挂载材料 =====
-def mount_to_entity(target_element_id, reasoning, material_data, neo4j_conn):
+@timed_neo4j
+def mount_to_entity(target_element_id, material_data, neo4j_conn, reasoning='',
+                    candidates=None):
     """
     函数4：将材料挂载到选定的Entity节点
     
     参数由LLM提供：
         target_element_id: 选择的Entity节点的elementId
-        reasoning: 为什么选择这个Entity
+        reasoning: 为什么选择这个Entity（可为空）
     
     预先绑定的参数：
         material_data: 待挂载的材料数据
         neo4j_conn: Neo4j连接器
+        candidates: 本轮展示给模型的Entity列表 [{name, elementId}, ...]；
+                    给出时先校验 target_element_id（Entity名称、列表序号也可以对应到 elementId）
     
     Returns:
         dict: {
@@ -242,36 +362,67 @@ def mount_to_entity(target_element_id, reasoning, material_data, neo4j_conn):
             'target_element_id': '...',
             'reasoning': '...'
         }
+    
+    写入前已超过截止时间时抛出 DeadlineExceeded，不开始写入；写入开始后把结果登记到
+    当前材料的 pending_mount，截止时间取消了 asyncio 一侧时由主程序等待并按实际结果记录。
     """
     import uuid
     from datetime import datetime
     
+    repaired = None
+    if candidates is not None:
+        ids = [entity['elementId'] for entity in candidates]
+        names = {}
+        for entity in candidates:
+            names.setdefault(entity['name'], []).append(entity['elementId'])
+        aliases = {name: found[0] for name, found in names.items() if len(found) == 1}
+        
+        element_id, repaired = match_option(target_element_id, ids, aliases=aliases)
+        if element_id is None:
+            return {
+                'success': False,
+                'error': f"elementId '{target_element_id}' 不在候选Entity中",
+                'valid_options': [f"{e['name']} (ID: {e['elementId']})" for e in candidates]
+            }
+        target_element_id = element_id
+    
     if neo4j_conn.driver is None:
         return {
             'success': False,
             'error': '数据库未连接'
         }
     
-    with neo4j_conn.driver.session() as session:
-        try:
-            # 生成节点名称和时间
-            node_name = f"Material_{uuid.uuid4().hex[:12]}"
-            mounted_at = datetime.now().isoformat()
-            data_json = json.dumps(material_data, ensure_ascii=False)
-            
-# 创建节点并建立关系
-            query = """
-            MATCH (target)
-            WHERE elementId(target) = $target_id
-            CREATE (new_material:Material {
-                name: $name,
-                mounted_at: $mounted_at,
-                data: $data
-            })
-            CREATE (new_material)-[:isBelongTo]->(target)
-            RETURN elementId(new_material) as new_node_id, target.name as target_name
-            """
-            
+    # 生成节点名称和时间
+    node_name = f"Material_{uuid.uuid4().hex[:12]}"
+    mounted_at = datetime.now().isoformat()
+    data_json = json.dumps(material_data, ensure_ascii=False)
+    
+    # 创建节点并建立关系
+    query = """
+    MATCH (target)
+    WHERE elementId(target) = $target_id
+    CREATE (new_material:Material {
+        name: $name,
+        mounted_at: $mounted_at,
+        data: $data
+    })
+    CREATE (new_material)-[:isBelongTo]->(target)
+    RETURN elementId(new_material) as new_node_id, target.name as target_name
+    """
+    # 带事务超时；已超过截止时间时在这里抛出 DeadlineExceeded，不开始写入
+    query = neo4j_conn._query(query)
+    
+    pending = Future()
+    stats = current_material_stats()
+    if stats is not None:
+        stats.pending_mount = pending
+    
+    mount = {
+        'success': False,
+        'error': '挂载失败：未返回结果'
+    }
+    try:
+        with neo4j_conn.driver.session() as session:
             result = session.run(
                 query,
                 target_id=target_element_id,
@@ -280,26 +431,29 @@ def mount_to_entity(target_element_id, reasoning, material_data, neo4j_conn):
                 data=data_json
             )
             record = result.single()
-            
-            if record:
-                return {
-                    'success': True,
-                    'action': 'mount',
-                    'mounted_node_id': record['new_node_id'],
-                    'mounted_node_name': node_name,
-                    'mounted_at': mounted_at,
-                    'target_element_id': target_element_id,
-                    'target_name': record['target_name'],
-                    'reasoning': reasoning
-                }
-            else:
-                return {
-                    'success': False,
-                    'error': '挂载失败：未返回结果'
-                }
-                
-        except Exception as e:
-            return {
-                'success': False,
-                'error': f'挂载节点时出错: {str(e)}'
-            }
\ No newline at end of file
+        
+        if record:
+            mount = {
+                'success': True,
+                'action': 'mount',
+                'mounted_node_id': record['new_node_id'],
+                'mounted_node_name': node_name,
+                'mounted_at': mounted_at,
+                'target_element_id': target_element_id,
+                'target_name': record['target_name'],
+                'reasoning': reasoning
+            }
+            if repaired:
+                mount['repaired'] = repaired
+        return mount
+    
+    except Exception as e:
+        mount = {
+            'success': False,
+            'error': f'挂载节点时出错: {str(e)}'
+        }
+        # 事务因截止时间被终止：没有写入，按超时处理
+        raise_if_expired(e)
+        return mount
+    finally:
+        pending.set_result(mount)
@@ -0,0 +1,400 @@
+"""
+本地 LLM 替身 - OpenAI 兼容的 chat.completions 服务（离线压测用）
+
+回答是确定性的：
+1. 先按脚本规则（MOCK_LLM_SCRIPT_PATH）匹配提示词中的子串；
+2. 否则按简单规则生成 tool call：
+   - 有 tool_choice 时调用指定函数，否则优先 navigate_outbound，再取第一个函数；
+   - enum 参数选与提示词字符重合最多的选项（并列取第一个）；
+   - target_element_id 取提示词中第一个 "(ID: ...)"（列表已按相似度排序）；
+   - 数组参数（批量导航）为每个 material_id 生成一个选择。
+
+支持可配置的延迟分布、429/5xx 注入和 token 计数（含模拟的前缀缓存命中）。
+请求带 stream=true 时以 SSE 分块返回（延迟作为首个分块前的等待，之后按分块间隔逐段输出）。
+
+用法：
+    python mock_llm_server.py [端口]
+    export DEEPSEEK_BASE_URL=http://127.0.0.1:8765
+    export DEEPSEEK_API_KEY=mock
+"""
+import hashlib
+import json
+import math
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from config import (
+    MOCK_LLM_HOST, MOCK_LLM_PORT, MOCK_LLM_SEED,
+    MOCK_LLM_LATENCY, MOCK_LLM_ERROR_RATES,
+    MOCK_LLM_SCRIPT_PATH, MOCK_LLM_REASONING_CHARS,
+    MOCK_LLM_STREAM_CHUNK_CHARS, MOCK_LLM_STREAM_CHUNK_DELAY_MS
+)
+
+
+# 模拟前缀缓存的块大小（字符）
+PREFIX_BLOCK_CHARS = 256
+
+
+class MockLLMState:
+    """替身服务的共享状态：随机数、前缀缓存、请求统计"""
+    
+    def __init__(self, seed=MOCK_LLM_SEED, latency=MOCK_LLM_LATENCY,
+                 error_rates=MOCK_LLM_ERROR_RATES, script_path=MOCK_LLM_SCRIPT_PATH,
+                 reasoning_chars=MOCK_LLM_REASONING_CHARS):
+        self.rng = random.Random(seed)
+        self.latency = latency
+        self.error_rates = error_rates
+        self.reasoning_chars = reasoning_chars
+        self.script = load_script(script_path)
+        self.seen_prefixes = set()
+        self.stats = {
+            'requests': 0, 'errors': {}, 'prompt_tokens': 0, 'completion_tokens': 0,
+            'stream_aborts': 0
+        }
+        self._lock = threading.Lock()
+    
+    def sample_latency(self):
+        """按配置的分布采样一次延迟（秒）"""
+        spec = self.latency
+        kind = spec.get('type', 'fixed')
+        with self._lock:
+            if kind == 'uniform':
+                ms = self.rng.uniform(spec['min_ms'], spec['max_ms'])
+            elif kind == 'lognormal':
+                ms = self.rng.lognormvariate(math.log(spec['median_ms']), spec.get('sigma', 0.5))
+            else:
+                ms = spec.get('ms', 0)
+        return max(ms, 0) / 1000
+    
+    def sample_error(self):
+        """按配置的概率决定是否注入错误，返回 HTTP 状态码或 None"""
+        with self._lock:
+            roll = self.rng.random()
+        threshold = 0.0
+        for status, rate in sorted(self.error_rates.items()):
+            threshold += rate
+            if roll < threshold:
+                return int(status)
+        return None
+    
+    def count_cached_tokens(self, prompt_text):
+        """模拟前缀缓存：按块哈希，返回与历史请求共享的前缀 token 数"""
+        hit_chars = 0
+        digest = hashlib.sha256()
+        with self._lock:
+            for start in range(0, len(prompt_text) - PREFIX_BLOCK_CHARS + 1, PREFIX_BLOCK_CHARS):
+                digest.update(prompt_text[start:start + PREFIX_BLOCK_CHARS].encode('utf-8'))
+                key = digest.hexdigest()
+                if key in self.seen_prefixes and hit_chars == start:
+                    hit_chars = start + PREFIX_BLOCK_CHARS
+                self.seen_prefixes.add(key)
+        return estimate_tokens(prompt_text[:hit_chars])
+    
+    def record(self, status=None, prompt_tokens=0, completion_tokens=0):
+        with self._lock:
+            self.stats['requests'] += 1
+            if status:
+                self.stats['errors'][status] = self.stats['errors'].get(status, 0) + 1
+            self.stats['prompt_tokens'] += prompt_tokens
+            self.stats['completion_tokens'] += completion_tokens
+    
+    def record_abort(self):
+        """客户端在流式返回中途断开（提前停止生成）"""
+        with self._lock:
+            self.stats['stream_aborts'] += 1
+
+
+def load_script(script_path):
+    """
+    读取脚本规则文件
+    
+    格式: [{"match": "子串", "tool": "函数名", "arguments": {...}}, ...]
+    """
+    if not script_path:
+        return []
+    try:
+        with open(script_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"❌ 读取脚本规则失败: {e}")
+        return []
+
+
+def estimate_tokens(text):
+    """粗略估算 token 数（中文约 1 字 1 token，ASCII 约 4 字符 1 token）"""
+    ascii_chars = sum(1 for ch in text if ord(ch) < 128)
+    return (len(text) - ascii_chars) + math.ceil(ascii_chars / 4)
+
+
+def _message_text(message):
+    content = message.get('content') or ''
+    return content if isinstance(content, str) else json.dumps(content, ensure_ascii=False)
+
+
+def _score_option(option, text):
+    """选项名中出现在提示词里的字符数（用于确定性地挑选 enum 选项）"""
+    return sum(1 for ch in set(str(option)) if ch in text)
+
+
+def _pick_option(options, text):
+    return max(options, key=lambda option: _score_option(option, text))
+
+
+def _build_arguments(parameters, text, reasoning):
+    """按规则为一个函数生成参数"""
+    arguments = {}
+    for name, spec in parameters.get('properties', {}).items():
+        if 'enum' in spec:
+            arguments[name] = _pick_option(spec['enum'], text)
+        elif name == 'target_element_id':
+            match = re.search(r'\(ID: ([^)\s]+)\)', text)
+            arguments[name] = match.group(1) if match else ''
+        elif spec.get('type') == 'array':
+            item_spec = spec.get('items', {})
+            ids = item_spec.get('properties', {}).get('material_id', {}).get('enum', [])
+            arguments[name] = [
+                dict(_build_arguments(item_spec, text, reasoning), material_id=material_id)
+                for material_id in ids
+            ]
+        elif spec.get('type') == 'integer':
+            arguments[name] = 0
+        else:
+            arguments[name] = reasoning
+    return arguments
+
+
+def decide_tool_call(request, state):
+    """
+    为一次请求生成确定性的 tool call
+    
+    Returns:
+        tuple: (函数名, 参数字典)；没有 tools 时返回 (None, None)
+    """
+    tools = request.get('tools') or []
+    if not tools:
+        return None, None
+    
+    messages = request.get('messages', [])
+    user_text = "\n".join(_message_text(m) for m in messages if m.get('role') in ('user', 'system'))
+    
+    # 1. 脚本规则
+    for rule in state.script:
+        if rule.get('match', '') in user_text:
+            return rule['tool'], rule.get('arguments', {})
+    
+    # 2. 选择函数
+    by_name = {tool['function']['name']: tool['function'] for tool in tools}
+    tool_choice = request.get('tool_choice')
+    if isinstance(tool_choice, dict):
+        name = tool_choice['function']['name']
+    elif 'navigate_outbound' in by_name:
+        name = 'navigate_outbound'
+    else:
+        name = tools[0]['function']['name']
+    
+    reasoning = ("根据材料成分与选项例子判断。" * 20)[:state.reasoning_chars]
+    return name, _build_arguments(by_name[name].get('parameters', {}), user_text, reasoning)
+
+
+def build_completion(request, state):
+    """生成 chat.completion 响应体"""
+    prompt_text = json.dumps(
+        {'tools': request.get('tools'), 'messages': request.get('messages')},
+        ensure_ascii=False, sort_keys=True
+    )
+    prompt_tokens = estimate_tokens(prompt_text)
+    cached_tokens = min(state.count_cached_tokens(prompt_text), prompt_tokens)
+    
+    name, arguments = decide_tool_call(request, state)
+    if name:
+        arguments_json = json.dumps(arguments, ensure_ascii=False)
+        message = {
+            'role': 'assistant',
+            'content': None,
+            'tool_calls': [{
+                'id': f"call_{uuid.uuid4().hex[:24]}",
+                'type': 'function',
+                'function': {'name': name, 'arguments': arguments_json}
+            }]
+        }
+        completion_tokens = estimate_tokens(arguments_json)
+        finish_reason = 'tool_calls'
+    else:
+        content = "已完成。"
+        message = {'role': 'assistant', 'content': content}
+        completion_tokens = estimate_tokens(content)
+        finish_reason = 'stop'
+    
+    return {
+        'id': f"chatcmpl-{uuid.uuid4().hex}",
+        'object': 'chat.completion',
+        'created': int(time.time()),
+        'model': request.get('model', 'mock'),
+        'choices': [{'index': 0, 'message': message, 'finish_reason': finish_reason}],
+        'usage': {
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': completion_tokens,
+            'total_tokens': prompt_tokens + completion_tokens,
+            'prompt_cache_hit_tokens': cached_tokens,
+            'prompt_cache_miss_tokens': prompt_tokens - cached_tokens,
+            'prompt_tokens_details': {'cached_tokens': cached_tokens}
+        }
+    }
+
+
+def build_stream_chunks(body, include_usage=False, chunk_chars=MOCK_LLM_STREAM_CHUNK_CHARS):
+    """
+    把 chat.completion 响应体拆成 chat.completion.chunk 列表
+    
+    tool call 的 arguments 按 chunk_chars 个字符一段输出；include_usage 时最后追加只含 usage 的分块。
+    """
+    message = body['choices'][0]['message']
+    
+    def chunk(delta, finish_reason=None):
+        return {
+            'id': body['id'],
+            'object': 'chat.completion.chunk',
+            'created': body['created'],
+            'model': body['model'],
+            'choices': [{'index': 0, 'delta': delta, 'finish_reason': finish_reason}]
+        }
+    
+    chunks = [chunk({'role': 'assistant', 'content': ''})]
+    for index, tool_call in enumerate(message.get('tool_calls') or []):
+        chunks.append(chunk({'tool_calls': [{
+            'index': index, 'id': tool_call['id'], 'type': 'function',
+            'function': {'name': tool_call['function']['name'], 'arguments': ''}
+        }]}))
+        arguments = tool_call['function']['arguments']
+        for start in range(0, len(arguments), chunk_chars):
+            chunks.append(chunk({'tool_calls': [{
+                'index': index,
+                'function': {'arguments': arguments[start:start + chunk_chars]}
+            }]}))
+    content = message.get('content')
+    if content:
+        for start in range(0, len(content), chunk_chars):
+            chunks.append(chunk({'content': content[start:start + chunk_chars]}))
+    chunks.append(chunk({}, body['choices'][0]['finish_reason']))
+    
+    if include_usage:
+        usage_chunk = chunk({})
+        usage_chunk['choices'] = []
+        usage_chunk['usage'] = body['usage']
+        chunks.append(usage_chunk)
+    return chunks
+
+
+class MockLLMRequestHandler(BaseHTTPRequestHandler):
+    """处理 /chat/completions 与 /v1/chat/completions"""
+    
+    state = None
+    
+    def log_message(self, format, *args):
+        # 压测时不在控制台输出每个请求
+        pass
+    
+    def _send_json(self, status, body, headers=None):
+        payload = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(payload)
+    
+    def _send_stream(self, body, include_usage):
+        """以 SSE 逐块发送；客户端提前断开（停止生成）时直接结束"""
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        try:
+            for index, chunk in enumerate(build_stream_chunks(body, include_usage)):
+                if index:
+                    time.sleep(MOCK_LLM_STREAM_CHUNK_DELAY_MS / 1000)
+                data = json.dumps(chunk, ensure_ascii=False)
+                self.wfile.write(f"data: {data}\n\n".encode('utf-8'))
+                self.wfile.flush()
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            self.state.record_abort()
+    
+    def do_GET(self):
+        if self.path.rstrip('/') in ('/models', '/v1/models'):
+            self._send_json(200, {'object': 'list', 'data': [{'id': 'deepseek-chat', 'object': 'model'}]})
+        elif self.path.rstrip('/') == '/stats':
+            self._send_json(200, self.state.stats)
+        else:
+            self._send_json(404, {'error': {'message': 'not found'}})
+    
+    def do_POST(self):
+        if self.path.rstrip('/') not in ('/chat/completions', '/v1/chat/completions'):
+            self._send_json(404, {'error': {'message': 'not found'}})
+            return
+        
+        length = int(self.headers.get('Content-Length', 0))
+        request = json.loads(self.rfile.read(length) or b'{}')
+        
+        time.sleep(self.state.sample_latency())
+        
+        status = self.state.sample_error()
+        if status:
+            self.state.record(status=status)
+            headers = {'Retry-After': '1'} if status == 429 else None
+            self._send_json(status, {
+                'error': {'message': f'mock injected {status}', 'type': 'mock_error', 'code': status}
+            }, headers)
+            return
+        
+        body = build_completion(request, self.state)
+        self.state.record(
+            prompt_tokens=body['usage']['prompt_tokens'],
+            completion_tokens=body['usage']['completion_tokens']
+        )
+        if request.get('stream'):
+            include_usage = (request.get('stream_options') or {}).get('include_usage', False)
+            self._send_stream(body, include_usage)
+        else:
+            self._send_json(200, body)
+
+
+def start_mock_server(host=MOCK_LLM_HOST, port=MOCK_LLM_PORT, state=None):
+    """
+    在后台线程启动替身服务（进程内压测用）
+    
+    Args:
+        host: 监听地址
+        port: 端口（0 表示随机端口）
+        state: MockLLMState，None 时按 config 创建
+    
+    Returns:
+        tuple: (server, base_url)；用 server.shutdown() 停止
+    """
+    handler_class = type('BoundMockLLMRequestHandler', (MockLLMRequestHandler,), {
+        'state': state or MockLLMState()
+    })
+    server = ThreadingHTTPServer((host, port), handler_class)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+if __name__ == "__main__":
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else MOCK_LLM_PORT
+    server, base_url = start_mock_server(port=port)
+    print(f"✅ 本地 LLM 替身已启动: {base_url}")
+    print(f"   export DEEPSEEK_BASE_URL={base_url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+        print("🔌 本地 LLM 替身已停止")
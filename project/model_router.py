@@ -0,0 +1,108 @@
+"""
+模型分级模块 - 按轮次类型 / 分类深度 / 节点选择模型和生成参数
+
+上层分类（材料 → 金属材料）选项少、差别明显，叶子Entity的选择最难。
+config.LLM_MODEL_TIERS 按顺序列出分级规则，第一条匹配的规则决定本轮使用的模型和参数，
+都不匹配时使用 LLM_DEFAULT_MODEL。每个分级分别统计调用次数、耗时和有效率，
+便于确认便宜 / 快速的模型没有降低该层的选择质量。
+"""
+from config import LLM_DEFAULT_MODEL, LLM_MODEL_TIERS
+
+
+class ModelTier:
+    """一个模型分级：模型名 + 生成参数 + 统计"""
+    
+    def __init__(self, name, model, params=None, functions=None,
+                 min_depth=None, max_depth=None, nodes=None):
+        self.name = name
+        self.model = model
+        self.params = dict(params or {})
+        self.functions = set(functions) if functions else None
+        self.min_depth = min_depth
+        self.max_depth = max_depth
+        self.nodes = set(nodes) if nodes else None
+        self.calls = 0
+        self.invalid = 0
+        self.total_ms = 0.0
+    
+    def matches(self, function_name, depth, node_name):
+        """规则中给出的条件都满足时匹配；未给出的条件不限制"""
+        if self.functions is not None and function_name not in self.functions:
+            return False
+        if self.nodes is not None and node_name not in self.nodes:
+            return False
+        if depth is not None:
+            if self.min_depth is not None and depth < self.min_depth:
+                return False
+            if self.max_depth is not None and depth > self.max_depth:
+                return False
+        elif self.min_depth is not None or self.max_depth is not None:
+            return False
+        return True
+    
+    def record(self, elapsed_ms, valid):
+        """
+        记录一次调用
+        
+        Args:
+            elapsed_ms: 从请求到函数执行完成的耗时（毫秒）
+            valid: 模型是否调用了函数且函数执行成功（选项有效）
+        """
+        self.calls += 1
+        self.total_ms += elapsed_ms
+        if not valid:
+            self.invalid += 1
+    
+    def stats(self):
+        """返回 {model, calls, avg_ms, invalid, valid_rate}"""
+        return {
+            'model': self.model,
+            'calls': self.calls,
+            'avg_ms': round(self.total_ms / self.calls, 1) if self.calls else 0.0,
+            'invalid': self.invalid,
+            'valid_rate': round(1 - self.invalid / self.calls, 4) if self.calls else None
+        }
+
+
+class ModelRouter:
+    """按分级规则为每一轮选择模型"""
+    
+    def __init__(self, tiers=LLM_MODEL_TIERS, default_model=LLM_DEFAULT_MODEL):
+        self.tiers = [ModelTier(**tier) for tier in tiers]
+        self.default_tier = ModelTier('default', default_model)
+    
+    def select(self, function_name=None, depth=None, node_name=None):
+        """
+        选择本轮使用的模型分级
+        
+        Args:
+            function_name: 本轮要求调用的函数名（轮次类型）
+            depth: 当前节点在分类树中的深度（根节点为 0），未知时为 None
+            node_name: 当前节点名称
+        
+        Returns:
+            ModelTier: 第一条匹配的分级；都不匹配时为默认分级
+        """
+        for tier in self.tiers:
+            if tier.matches(function_name, depth, node_name):
+                return tier
+        return self.default_tier
+    
+    def stats(self):
+        """返回 {分级名: 统计}（只包含有调用的分级）"""
+        return {
+            tier.name: tier.stats()
+            for tier in self.tiers + [self.default_tier]
+            if tier.calls
+        }
+
+
+_shared_router = None
+
+
+def get_model_router():
+    """获取进程内共享的模型分级路由"""
+    global _shared_router
+    if _shared_router is None:
+        _shared_router = ModelRouter()
+    return _shared_router
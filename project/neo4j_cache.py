@@ -0,0 +1,168 @@
+"""
+Neo4j 缓存模块 - 带短期缓存和推测预取的连接器包装
+
+1. 缓存：节点 labels、出边Class节点、子树叶子路径、节点例子、入边Entity数量和列表，
+   在 NEO4J_CACHE_TTL 秒内所有材料共用；同一个键正在查询时，其他调用等待同一结果。
+2. 推测预取：LLM 在若干子分类中做选择时，先在后台把每个候选下一轮要用的数据查好，
+   选择返回后下一轮的 labels 和 tools 直接从缓存构建，Neo4j 延迟不再位于关键路径上。
+
+预取在专用线程池中执行，不占用主流程 asyncio.to_thread 的线程，
+其查询也不计入材料的 Neo4j 用量统计（不在关键路径上）。
+"""
+import asyncio
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from config import (
+    NEO4J_CACHE_TTL, NEO4J_CACHE_MAX_ENTRIES,
+    NEO4J_PREFETCH_ENABLED, NEO4J_PREFETCH_WORKERS
+)
+from deadline import DeadlineExceeded, request_timeout
+
+
+# 发起查询的一方超过截止时间时交给等待者的标记（等待者各自重新查询）
+_OWNER_DEADLINE = object()
+
+
+class CachedNeo4jConnector:
+    """
+    Neo4jConnector 的缓存包装，接口与 Neo4jConnector 相同
+    
+    只缓存读取分类树结构的方法；其他属性和方法（driver、close 等）直接转发。
+    """
+    
+    CACHED_METHODS = (
+        'get_node_labels', 'get_outbound_class_nodes', 'get_node_examples',
+        'count_inbound_entities', 'get_inbound_entity_nodes', 'get_subtree_leaf_paths'
+    )
+    
+    def __init__(self, connector, ttl=NEO4J_CACHE_TTL, max_entries=NEO4J_CACHE_MAX_ENTRIES,
+                 prefetch_enabled=NEO4J_PREFETCH_ENABLED, prefetch_workers=NEO4J_PREFETCH_WORKERS):
+        self.connector = connector
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.prefetch_enabled = prefetch_enabled
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(
+            max_workers=prefetch_workers, thread_name_prefix='neo4j-prefetch'
+        )
+        self._tasks = set()
+        self.stats = {'hits': 0, 'misses': 0, 'prefetched': 0}
+    
+    def __getattr__(self, name):
+        if name in self.CACHED_METHODS:
+            method = getattr(self.connector, name)
+            return lambda *args, **kwargs: self._cached(name, method, *args, **kwargs)
+        return getattr(self.connector, name)
+    
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self.connector.close()
+    
+    def _cached(self, name, method, *args, **kwargs):
+        """按 (方法名, 参数) 缓存；同一键正在查询时等待该查询的结果"""
+        key = (name, args, tuple(sorted(kwargs.items())))
+        now = time.monotonic()
+        
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self.stats['hits'] += 1
+                future = entry[1]
+                owner = False
+            else:
+                self.stats['misses'] += 1
+                future = Future()
+                self._entries[key] = (now + self.ttl, future)
+                self._evict(now)
+                owner = True
+        
+        if not owner:
+            # 等待其他调用的查询时同样受当前截止时间限制
+            try:
+                value = future.result(timeout=request_timeout(None))
+            except FutureTimeoutError as e:
+                raise DeadlineExceeded("等待缓存中的 Neo4j 查询超过截止时间") from e
+            if value is _OWNER_DEADLINE:
+                # 发起查询的一方超过了它自己的截止时间：按当前调用的截止时间重新查询
+                return self._cached(name, method, *args, **kwargs)
+            return value
+        
+        try:
+            value = method(*args, **kwargs)
+        except Exception as e:
+            # 查询异常不缓存
+            with self._lock:
+                if self._entries.get(key, (None, None))[1] is future:
+                    del self._entries[key]
+            if isinstance(e, DeadlineExceeded):
+                # 截止时间属于发起方，不传给其他材料的等待者
+                future.set_result(_OWNER_DEADLINE)
+            else:
+                future.set_exception(e)
+            raise
+        future.set_result(value)
+        return value
+    
+    def _evict(self, now):
+        """超过条目上限时先删除过期项，仍超过则删除最早到期的项"""
+        if len(self._entries) <= self.max_entries:
+            return
+        for key in [key for key, (expires_at, _) in self._entries.items() if expires_at <= now]:
+            del self._entries[key]
+        overflow = len(self._entries) - self.max_entries
+        if overflow > 0:
+            oldest = sorted(self._entries, key=lambda key: self._entries[key][0])[:overflow]
+            for key in oldest:
+                del self._entries[key]
+    
+    def start_prefetch(self, candidate_nodes):
+        """
+        在后台预取每个候选子节点下一轮需要的数据（不等待完成）
+        
+        Args:
+            candidate_nodes: build_tools_for_class_node 返回的 outbound_nodes [{name, elementId}]
+        """
+        if not self.prefetch_enabled or not candidate_nodes:
+            return
+        task = asyncio.get_running_loop().create_task(self._prefetch(candidate_nodes))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+    
+    async def _prefetch(self, candidate_nodes):
+        loop = asyncio.get_running_loop()
+        
+        def run(name, *args, **kwargs):
+            return loop.run_in_executor(self._executor, lambda: getattr(self, name)(*args, **kwargs))
+        
+        element_ids = [node['elementId'] for node in candidate_nodes]
+        
+        # 1. 每个候选的 labels、子分类、入边Entity数量
+        results = await asyncio.gather(*(
+            asyncio.gather(
+                run('get_node_labels', element_id),
+                run('get_outbound_class_nodes', element_id),
+                run('count_inbound_entities', element_id)
+            )
+            for element_id in element_ids
+        ), return_exceptions=True)
+        
+        # 2. 下一轮工具描述中的例子；叶子候选则取其Entity列表（navigate_inbound 使用）
+        follow_ups = []
+        for element_id, result in zip(element_ids, results):
+            if isinstance(result, Exception):
+                continue
+            _, children, entity_count = result
+            if children:
+                follow_ups.extend(run('get_node_examples', child['elementId']) for child in children)
+            elif entity_count:
+                follow_ups.append(run('get_inbound_entity_nodes', element_id, limit=100))
+        await asyncio.gather(*follow_ups, return_exceptions=True)
+        
+        self.stats['prefetched'] += len(element_ids)
+    
+    def cache_stats(self):
+        """返回 {hits, misses, prefetched, entries}"""
+        with self._lock:
+            return dict(self.stats, entries=len(self._entries))
@@ -1,8 +1,10 @@
 """
 Neo4j数据库连接器 - 负责所有数据库操作（修改版）
 """
-from neo4j import GraphDatabase
+from neo4j import GraphDatabase, Query
 import json
+from usage_tracker import timed_neo4j
+from deadline import request_timeout, raise_if_expired
 
 
 class Neo4jConnector:
@@ -23,7 +25,16 @@ class Neo4jConnector:
         if self.driver is not None:
             self.driver.close()
             print("🔌 Neo4j 数据库连接已关闭。")
+    
+    def _query(self, text):
+        """
+        带事务超时的查询：超时取当前材料 / 轮次截止时间的剩余时间
+        
+        超时后服务器终止事务，查询方法捕获异常后由 raise_if_expired 改为抛出 DeadlineExceeded。
+        """
+        return Query(text, timeout=request_timeout(None))
 
+    @timed_neo4j
     def get_node_labels(self, element_id):
         """
         获取节点的labels
@@ -41,16 +52,18 @@ class Neo4jConnector:
                 WHERE elementId(n) = $element_id
                 RETURN labels(n) as labels
                 """
-                result = session.run(query, element_id=element_id)
+                result = session.run(self._query(query), element_id=element_id)
                 record = result.single()
                 
                 if record:
                     return record['labels']
                 return []
             except Exception as e:
+                raise_if_expired(e)
                 print(f"❌ 获取节点labels时出错: {e}")
                 return []
 
+    @timed_neo4j
     def get_outbound_class_nodes(self, element_id):
         """
         获取出边指向的Class节点
@@ -67,18 +80,57 @@ class Neo4jConnector:
                 MATCH (a)-[r]->(b:Class)
                 WHERE elementId(a) = $element_id
                 RETURN b.name as name, elementId(b) as elementId
+                ORDER BY name, elementId
                 LIMIT 20
                 """
-                result = session.run(query, element_id=element_id)
+                result = session.run(self._query(query), element_id=element_id)
                 nodes = [
                     {"name": record["name"], "elementId": record["elementId"]} 
                     for record in result
                 ]
                 return nodes
             except Exception as e:
+                raise_if_expired(e)
                 print(f"❌ 获取出边Class节点时出错: {e}")
                 return []
 
+    @timed_neo4j
+    def get_subtree_leaf_paths(self, element_id, max_depth=6, limit=31):
+        """
+        用一次变长查询获取子树中所有叶子Class节点的路径
+        
+        Args:
+            element_id: 子树根节点的elementId
+            max_depth: 最大深度；子树更深时最后一项的路径长度为 max_depth + 1
+            limit: 最多返回的路径数
+        
+        Returns:
+            list: [[{'name': '金属材料', 'elementId': '...'}, ..., {叶子节点}], ...]
+                  （不含子树根节点本身）
+        """
+        if self.driver is None:
+            return []
+        
+        with self.driver.session() as session:
+            try:
+                # 多查一层：出现长度为 max_depth + 1 的路径说明子树超过了最大深度
+                query = f"""
+                MATCH p = (a)-[*1..{int(max_depth) + 1}]->(b:Class)
+                WHERE elementId(a) = $element_id
+                  AND all(n IN nodes(p)[1..] WHERE n:Class)
+                  AND (length(p) > {int(max_depth)} OR NOT (b)-->(:Class))
+                RETURN [n IN nodes(p)[1..] | {{name: n.name, elementId: elementId(n)}}] as path
+                ORDER BY length(p) DESC, [n IN nodes(p) | n.name]
+                LIMIT $limit
+                """
+                result = session.run(self._query(query), element_id=element_id, limit=limit)
+                return [[dict(node) for node in record['path']] for record in result]
+            except Exception as e:
+                raise_if_expired(e)
+                print(f"❌ 获取子树叶子路径时出错: {e}")
+                return []
+
+    @timed_neo4j
     def get_inbound_entity_nodes(self, element_id, limit=100):
         """
         获取入边指向的Material节点
@@ -100,7 +152,7 @@ class Neo4jConnector:
                 WHERE elementId(b) = $element_id
                 RETURN count(a) as total
                 """
-                count_result = session.run(count_query, element_id=element_id)
+                count_result = session.run(self._query(count_query), element_id=element_id)
                 total = count_result.single()['total']
                 
                 # 查询具体节点（限制数量）
@@ -110,7 +162,7 @@ class Neo4jConnector:
                 RETURN a.name as name, elementId(a) as elementId, a.data as data
                 LIMIT $limit
                 """
-                result = session.run(query, element_id=element_id, limit=limit)
+                result = session.run(self._query(query), element_id=element_id, limit=limit)
                 
                 entities = []
                 for record in result:
@@ -132,9 +184,88 @@ class Neo4jConnector:
                     'entities': entities
                 }
             except Exception as e:
+                raise_if_expired(e)
                 print(f"❌ 获取入边Material节点时出错: {e}")
                 return {'count': 0, 'entities': []}
 
+    @timed_neo4j
+    def count_inbound_entities(self, element_id):
+        """
+        统计入边指向的Material节点数量（不取节点数据）
+        
+        Returns:
+            int: 数量，出错时为 0
+        """
+        if self.driver is None:
+            return 0
+        
+        with self.driver.session() as session:
+            try:
+                query = """
+                MATCH (a:Material)-[r]->(b)
+                WHERE elementId(b) = $element_id
+                RETURN count(a) as total
+                """
+                result = session.run(self._query(query), element_id=element_id)
+                return result.single()['total']
+            except Exception as e:
+                raise_if_expired(e)
+                print(f"❌ 统计入边Material节点时出错: {e}")
+                return 0
+
+    @timed_neo4j
+    def get_mounted_materials(self, root_element_id, limit=50000):
+        """
+        获取已挂载的Material节点及其完整分类路径（kNN 路径预测用）
+        
+        Returns:
+            list: [{
+                'node_id': '...',
+                'data': {...},
+                'entity': {'name': '...', 'elementId': '...'},
+                'path': [{'name': '材料', 'elementId': '...'}, ...]
+            }]
+        """
+        if self.driver is None:
+            return []
+        
+        with self.driver.session() as session:
+            try:
+                query = """
+                MATCH (m:Material)-[:isBelongTo]->(e)-->(leaf:Class)
+                MATCH p = (root)-[*0..20]->(leaf)
+                WHERE elementId(root) = $root_id AND all(n IN nodes(p) WHERE n:Class)
+                WITH m, e, p ORDER BY length(p)
+                WITH m, e, collect(p)[0] AS p
+                RETURN elementId(m) as node_id, m.data as data,
+                       e.name as entity_name, elementId(e) as entity_id,
+                       [n IN nodes(p) | {name: n.name, elementId: elementId(n)}] as path
+                LIMIT $limit
+                """
+                result = session.run(self._query(query), root_id=root_element_id, limit=limit)
+                
+                materials = []
+                for record in result:
+                    try:
+                        data = json.loads(record['data']) if record['data'] else None
+                    except:
+                        data = None
+                    if not data:
+                        continue
+                    
+                    materials.append({
+                        'node_id': record['node_id'],
+                        'data': data,
+                        'entity': {'name': record['entity_name'], 'elementId': record['entity_id']},
+                        'path': [dict(node) for node in record['path']]
+                    })
+                return materials
+            except Exception as e:
+                raise_if_expired(e)
+                print(f"❌ 获取已挂载Material节点时出错: {e}")
+                return []
+
+    @timed_neo4j
     def get_entity_data_by_element_id(self, element_id):
         """
         获取Material节点的完整数据
@@ -152,7 +283,7 @@ class Neo4jConnector:
                 WHERE elementId(n) = $element_id
                 RETURN n.data as data
                 """
-                result = session.run(query, element_id=element_id)
+                result = session.run(self._query(query), element_id=element_id)
                 record = result.single()
                 
                 if record and record['data']:
@@ -162,9 +293,11 @@ class Neo4jConnector:
                         return None
                 return None
             except Exception as e:
+                raise_if_expired(e)
                 print(f"❌ 获取Material数据时出错: {e}")
                 return None
 
+    @timed_neo4j
     def get_node_examples(self, element_id, limit=5):
         """
         获取一个节点的例子（最多5个）
@@ -183,9 +316,10 @@ class Neo4jConnector:
                 MATCH (a)-[:include]->(b:Class)
                 WHERE elementId(a) = $element_id
                 RETURN b.name as name
+                ORDER BY name
                 LIMIT $limit
                 """
-                result = session.run(query_class, element_id=element_id, limit=limit)
+                result = session.run(self._query(query_class), element_id=element_id, limit=limit)
                 examples = [record["name"] for record in result]
                 
                 if examples:
@@ -197,12 +331,14 @@ class Neo4jConnector:
                 MATCH (b:Material)-[:include]->(a)
                 WHERE elementId(a) = $element_id
                 RETURN b.name as name
+                ORDER BY name
                 LIMIT $limit
                 """
-                result = session.run(query_entity, element_id=element_id, limit=limit)
+                result = session.run(self._query(query_entity), element_id=element_id, limit=limit)
                 examples = [record["name"] for record in result]
                 
                 return examples
             except Exception as e:
+                raise_if_expired(e)
                 print(f"❌ 获取节点例子时出错: {e}")
                 return []
\ No newline at end of file
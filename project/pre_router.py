@@ -0,0 +1,159 @@
+"""
+规则预路由模块 - 按成分 / 元数据把材料直接送到已知的分类路径前缀
+
+规则写在 config.PRE_ROUTER_RULES 中（声明式），命中后材料从规则的落点节点开始导航，
+落点以上的各层不再调用LLM。路径按节点名称从根节点逐层解析为 elementId，结果缓存。
+"""
+import threading
+from config import (
+    ROOT_ELEMENT_ID, ROOT_NAME, SPECIAL_NODES,
+    PRE_ROUTER_ENABLED, PRE_ROUTER_RULES
+)
+
+
+def count_principal_elements(material_data, principal_fraction):
+    """摩尔分数不低于 principal_fraction 的元素个数"""
+    composition = material_data.get('data', {}).get('成分比重', {})
+    values = [v for v in composition.values() if isinstance(v, (int, float)) and v > 0]
+    total = sum(values)
+    if total <= 0:
+        return 0
+    return sum(1 for v in values if v / total >= principal_fraction)
+
+
+def contains_keyword(material_data, keywords, fields):
+    """fields 中任一字段是否包含任一关键词（不区分大小写）"""
+    data = material_data.get('data', {})
+    for field in fields:
+        value = data.get(field)
+        if value is None:
+            continue
+        text = value if isinstance(value, str) else str(value)
+        text = text.lower()
+        if any(keyword.lower() in text for keyword in keywords):
+            return True
+    return False
+
+
+def rule_matches(rule, material_data):
+    """
+    判断材料是否满足一条规则的全部条件
+    
+    Returns:
+        bool
+    """
+    min_principal = rule.get('min_principal_elements')
+    if min_principal is not None:
+        fraction = rule.get('principal_fraction', 0.05)
+        if count_principal_elements(material_data, fraction) < min_principal:
+            return False
+    
+    keywords = rule.get('keywords')
+    if keywords:
+        fields = rule.get('keyword_fields') or list(material_data.get('data', {}))
+        if not contains_keyword(material_data, keywords, fields):
+            return False
+    
+    return True
+
+
+class PreRouter:
+    """按顺序匹配规则，把命中的材料送到规则落点"""
+    
+    def __init__(self, rules=PRE_ROUTER_RULES, special_nodes=SPECIAL_NODES):
+        # 只启用落点在 SPECIAL_NODES 中的规则
+        self.rules = [rule for rule in rules if rule['path'] and rule['path'][-1] in special_nodes]
+        # {规则名: [{name, elementId}, ...]}；确定无法解析的为 None
+        self._resolved = {}
+        self.hits = {}
+        self.misses = 0
+        # route 在多个线程中并发执行：_resolve_lock 保证每条规则只解析一次，_stats_lock 保护计数
+        self._resolve_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+    
+    def match(self, material_data):
+        """返回第一条命中的规则，没有则返回 None"""
+        for rule in self.rules:
+            if rule_matches(rule, material_data):
+                return rule
+        return None
+    
+    def resolve_path(self, rule, neo4j_conn):
+        """
+        把规则的节点名称路径逐层解析为 [{name, elementId}, ...]（结果缓存）
+        
+        Returns:
+            list: 分类路径；第一个名称不是根节点或某层找不到对应子节点时返回 None
+        
+        get_outbound_class_nodes 查询出错时返回 []，与没有子节点无法区分：
+        某层子节点为空时只本次返回 None、不缓存，下一条材料重新解析，
+        避免一次临时的查询失败让规则在整次运行中失效。
+        """
+        with self._resolve_lock:
+            if rule['name'] in self._resolved:
+                return self._resolved[rule['name']]
+            return self._resolve(rule, neo4j_conn)
+    
+    def _resolve(self, rule, neo4j_conn):
+        """resolve_path 的主体（持有 _resolve_lock 时调用）"""
+        names = rule['path']
+        path = None
+        if names[0] == ROOT_NAME:
+            path = [{'name': ROOT_NAME, 'elementId': ROOT_ELEMENT_ID}]
+            for name in names[1:]:
+                children = neo4j_conn.get_outbound_class_nodes(path[-1]['elementId'])
+                if not children:
+                    return None
+                child = next((node for node in children if node['name'] == name), None)
+                if child is None:
+                    print(f"⚠️  预路由规则 '{rule['name']}' 的路径无法解析: '{path[-1]['name']}' 下没有 '{name}'")
+                    path = None
+                    break
+                path.append({'name': child['name'], 'elementId': child['elementId']})
+        
+        self._resolved[rule['name']] = path
+        return path
+    
+    def route(self, material_data, neo4j_conn):
+        """
+        为材料查找预路由路径
+        
+        Returns:
+            tuple: (规则名, classification_path)；未命中（或路径无法解析）时为 (None, None)
+        """
+        rule = self.match(material_data)
+        path = self.resolve_path(rule, neo4j_conn) if rule is not None else None
+        
+        with self._stats_lock:
+            if path is None:
+                self.misses += 1
+                return None, None
+            self.hits[rule['name']] = self.hits.get(rule['name'], 0) + 1
+        return rule['name'], [dict(node) for node in path]
+    
+    def stats(self):
+        """返回 {hits: {规则名: 次数}, misses, rules}"""
+        with self._stats_lock:
+            return {
+                'hits': dict(self.hits),
+                'misses': self.misses,
+                'rules': [rule['name'] for rule in self.rules]
+            }
+
+
+_shared_router = None
+
+
+def get_pre_router():
+    """
+    获取进程内共享的预路由器
+    
+    Returns:
+        PreRouter: 未启用（PRE_ROUTER_ENABLED=False）时返回 None
+    """
+    global _shared_router
+    if not PRE_ROUTER_ENABLED:
+        return None
+    if _shared_router is None:
+        _shared_router = PreRouter()
+    return _shared_router
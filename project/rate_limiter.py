@@ -0,0 +1,204 @@
+"""
+限流模块 - 所有 FunctionCallHandler 共享的 DeepSeek 调用限流器
+
+1. 令牌桶：请求数 / 分钟 与 token 数 / 分钟；
+2. AIMD 并发控制：遇到 429 / 超时时并发上限乘性减小，成功时加性恢复。
+
+突发的 429 只会让整体变慢，而不会让整批材料失败。
+"""
+import asyncio
+import json
+import time
+from contextlib import asynccontextmanager
+from config import (
+    LLM_RATE_LIMIT_RPM, LLM_RATE_LIMIT_TPM,
+    LLM_CONCURRENCY_INITIAL, LLM_CONCURRENCY_MIN, LLM_CONCURRENCY_MAX,
+    LLM_AIMD_DECREASE_FACTOR, LLM_AIMD_DECREASE_COOLDOWN, DEEPSEEK_API_KEYS
+)
+
+
+# 估算请求 token 数时为输出预留的 token 数
+OUTPUT_TOKEN_RESERVE = 500
+
+
+def estimate_request_tokens(request, output_reserve=OUTPUT_TOKEN_RESERVE):
+    """
+    粗略估算一次请求的 token 数（按字符数的一半，外加输出预留）
+    
+    Args:
+        request: chat.completions.create 的参数
+        output_reserve: 输出预留的 token 数；只估算输入时传 0
+    """
+    text = json.dumps(
+        {'messages': request.get('messages'), 'tools': request.get('tools')},
+        ensure_ascii=False, default=str
+    )
+    return len(text) // 2 + output_reserve
+
+
+class TokenBucket:
+    """按分钟补充的令牌桶"""
+    
+    def __init__(self, per_minute):
+        self.capacity = per_minute
+        self.tokens = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.updated_at = time.monotonic()
+    
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+    
+    def wait_time(self, amount):
+        """取出 amount 个令牌还需要等待的秒数（0 表示可以立即取出）"""
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+    
+    def take(self, amount):
+        self._refill()
+        self.tokens -= amount
+    
+    def refund(self, amount):
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class AdaptiveRateLimiter:
+    """令牌桶 + AIMD 并发上限"""
+    
+    def __init__(self, rpm=LLM_RATE_LIMIT_RPM, tpm=LLM_RATE_LIMIT_TPM,
+                 initial_concurrency=LLM_CONCURRENCY_INITIAL,
+                 min_concurrency=LLM_CONCURRENCY_MIN, max_concurrency=LLM_CONCURRENCY_MAX,
+                 decrease_factor=LLM_AIMD_DECREASE_FACTOR,
+                 decrease_cooldown=LLM_AIMD_DECREASE_COOLDOWN):
+        self.request_bucket = TokenBucket(rpm) if rpm else None
+        self.token_bucket = TokenBucket(tpm) if tpm else None
+        self.limit = float(initial_concurrency)
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.decrease_factor = decrease_factor
+        self.decrease_cooldown = decrease_cooldown
+        self.in_flight = 0
+        self.last_decrease_at = 0.0
+        self.stats = {'requests': 0, 'throttled': 0, 'decreases': 0, 'wait_seconds': 0.0}
+        self._condition = asyncio.Condition()
+    
+    @asynccontextmanager
+    async def slot(self, estimated_tokens=0):
+        """
+        获取一个调用名额（并发 + 令牌桶）
+        
+        用法:
+            async with limiter.slot(tokens) as slot:
+                ...
+                slot.throttled()            # 遇到 429 / 超时
+                slot.success(n)             # 调用成功，n 为实际消耗的 token 数
+        """
+        started = time.monotonic()
+        await self._acquire(estimated_tokens)
+        self.stats['wait_seconds'] += time.monotonic() - started
+        
+        slot = _Slot(estimated_tokens)
+        try:
+            yield slot
+        finally:
+            await self._release(slot)
+    
+    async def _acquire(self, estimated_tokens):
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+        
+        # 令牌桶的等待在条件锁之外进行，避免阻塞其他协程释放名额
+        while True:
+            wait = max(
+                self.request_bucket.wait_time(1) if self.request_bucket else 0.0,
+                self.token_bucket.wait_time(estimated_tokens) if self.token_bucket else 0.0
+            )
+            if wait <= 0:
+                break
+            await asyncio.sleep(wait)
+        
+        if self.request_bucket:
+            self.request_bucket.take(1)
+        if self.token_bucket:
+            self.token_bucket.take(estimated_tokens)
+        self.stats['requests'] += 1
+    
+    async def _release(self, slot):
+        # 按实际 token 数修正令牌桶
+        if self.token_bucket and slot.actual_tokens is not None:
+            difference = slot.estimated_tokens - slot.actual_tokens
+            if difference > 0:
+                self.token_bucket.refund(difference)
+            else:
+                self.token_bucket.take(-difference)
+        
+        async with self._condition:
+            self.in_flight -= 1
+            if slot.was_throttled:
+                self._decrease()
+            elif slot.succeeded:
+                # 加性增加：每完成约 limit 次成功调用，上限 +1
+                self.limit = min(self.max_concurrency, self.limit + 1.0 / self.limit)
+            self._condition.notify_all()
+    
+    def _decrease(self):
+        """乘性减小并发上限（冷却时间内只减一次，避免同一波 429 把上限压到底）"""
+        self.stats['throttled'] += 1
+        now = time.monotonic()
+        if now - self.last_decrease_at < self.decrease_cooldown:
+            return
+        self.last_decrease_at = now
+        self.limit = max(self.min_concurrency, self.limit * self.decrease_factor)
+        self.stats['decreases'] += 1
+    
+    def set_max_concurrency(self, max_concurrency):
+        """调整并发上限的最大值（例如预算限流时收紧到 1）"""
+        self.max_concurrency = max(self.min_concurrency, max_concurrency)
+        self.limit = min(self.limit, self.max_concurrency)
+    
+    def snapshot(self):
+        """返回当前状态 {limit, in_flight, requests, throttled, decreases, wait_seconds}"""
+        return dict(self.stats, limit=round(self.limit, 2), in_flight=self.in_flight)
+
+
+class _Slot:
+    """一次调用名额，记录结果供限流器调整"""
+    
+    def __init__(self, estimated_tokens):
+        self.estimated_tokens = estimated_tokens
+        self.actual_tokens = None
+        self.was_throttled = False
+        self.succeeded = False
+    
+    def throttled(self):
+        self.was_throttled = True
+    
+    def success(self, actual_tokens=None):
+        self.succeeded = True
+        self.actual_tokens = actual_tokens
+
+
+_shared_limiter = None
+
+
+def get_shared_rate_limiter():
+    """
+    获取进程内共享的限流器（所有 FunctionCallHandler 共用）
+    
+    配置的 RPM / TPM / 初始并发按单个 API Key 计，使用 Key 池时按 Key 数放大。
+    """
+    global _shared_limiter
+    if _shared_limiter is None:
+        keys = max(1, len(DEEPSEEK_API_KEYS))
+        _shared_limiter = AdaptiveRateLimiter(
+            rpm=LLM_RATE_LIMIT_RPM and LLM_RATE_LIMIT_RPM * keys,
+            tpm=LLM_RATE_LIMIT_TPM and LLM_RATE_LIMIT_TPM * keys,
+            initial_concurrency=min(LLM_CONCURRENCY_MAX, LLM_CONCURRENCY_INITIAL * keys)
+        )
+    return _shared_limiter
@@ -24,7 +24,7 @@ class ResultWriter:
         print(f"结果文件将保存到: {result_file}")
     
     def add_success_record(self, material_index, material_data, 
-                          classification_path, mount_info):
+                          classification_path, mount_info, stats=None):
         """
         添加成功记录
         
@@ -32,7 +32,8 @@ class ResultWriter:
             material_index: 材料索引
             material_data: 原始材料数据
             classification_path: 分类路径 [{name, elementId}, ...]
-            mount_info: 挂载信息 {node_id, node_name, mounted_at, ...}
+            mount_info: 挂载信息 {node_id, node_name, mounted_at, ..., decision}
+            stats: 用量统计（token / 耗时 / 轮次，可选）
         """
         record = {
             'status': 'success',
@@ -56,10 +57,19 @@ class ResultWriter:
                 'element_id': mount_info['target_id']
             }
         }
+        
+        # 挂载决策方式（llm / auto），便于审计自动挂载
+        if mount_info.get('decision'):
+            record['mount_decision'] = mount_info['decision']
+        
+        if stats:
+            record['stats'] = stats
+        
         self.results.append(record)
     
-    def add_error_record(self, material_index, material_data, error_message):
-        """添加错误记录"""
+    def add_error_record(self, material_index, material_data, error_message, stats=None,
+                         error_type=None):
+        """添加错误记录（stats 为用量统计，error_type 为错误类别如 'timeout'，均可选）"""
         record = {
             'status': 'error',
             'material_index': material_index,
@@ -67,15 +77,23 @@ class ResultWriter:
             'error': error_message,
             'material_data': material_data
         }
+        if error_type:
+            record['error_type'] = error_type
+        if stats:
+            record['stats'] = stats
         self.results.append(record)
     
     def save(self):
         """保存结果到文件"""
         try:
+            # 并发处理时记录按完成顺序追加，保存前按材料索引排序
+            self.results.sort(key=lambda r: r['material_index'])
+            
             summary = {
                 'total': len(self.results),
                 'success': sum(1 for r in self.results if r['status'] == 'success'),
                 'failed': sum(1 for r in self.results if r['status'] == 'error'),
+                'timeouts': sum(1 for r in self.results if r.get('error_type') == 'timeout'),
                 'generated_at': datetime.now().isoformat(),
                 'results': self.results
             }
@@ -0,0 +1,216 @@
+"""
+路由备忘模块 - 按 (Class节点, 成分签名) 记住已经做过的分类选择
+
+成分元素相同、比例接近的材料在同一个 Class 节点上会得到相同的选择，
+命中备忘时可以直接移动到子节点，不再调用LLM。
+备忘保存在 JSON 文件中，可以从历史 results/mount_result_*.json 初始化。
+"""
+import glob
+import json
+import os
+from datetime import datetime
+from config import (
+    RESULT_DIR, RESULT_FILE_PREFIX,
+    ROUTING_MEMO_ENABLED, ROUTING_MEMO_PATH, ROUTING_MEMO_RATIO_STEP,
+    ROUTING_MEMO_MIN_COUNT
+)
+
+
+def composition_signature(material_data, ratio_step=ROUTING_MEMO_RATIO_STEP):
+    """
+    计算材料的规范化成分签名
+    
+    成分比重先归一化为摩尔分数，再按 ratio_step 取整，元素按字母排序。
+    例如 {'Fe': 1, 'Ni': 1} → "Fe:0.50|Ni:0.50"
+    
+    Args:
+        material_data: 材料数据字典
+        ratio_step: 比例取整的步长
+    
+    Returns:
+        str: 成分签名；没有成分比重时返回 None
+    """
+    composition = material_data.get('data', {}).get('成分比重', {})
+    total = sum(v for v in composition.values() if isinstance(v, (int, float)) and v > 0)
+    
+    if not composition or total <= 0:
+        return None
+    
+    parts = []
+    for element in sorted(composition):
+        value = composition[element]
+        if not isinstance(value, (int, float)) or value <= 0:
+            continue
+        fraction = round(value / total / ratio_step) * ratio_step
+        parts.append(f"{element}:{fraction:.2f}")
+    
+    return "|".join(parts)
+
+
+class RoutingMemo:
+    """(Class elementId, 成分签名) → 选中子节点 的备忘表"""
+    
+    def __init__(self, path=ROUTING_MEMO_PATH, min_count=ROUTING_MEMO_MIN_COUNT):
+        self.path = path
+        self.min_count = min_count
+        # {"<class_id>|<signature>": {child_element_id: {'name': ..., 'count': n}}}
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+    
+    def load(self):
+        """从文件加载备忘，文件不存在返回 False"""
+        if not os.path.exists(self.path):
+            return False
+        
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self.entries = data.get('entries', {})
+            return True
+        except Exception as e:
+            print(f"❌ 读取路由备忘失败: {e}")
+            return False
+    
+    def save(self):
+        """保存备忘到文件"""
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            
+            with open(self.path, 'w', encoding='utf-8') as f:
+                json.dump({
+                    'updated_at': datetime.now().isoformat(),
+                    'entries': self.entries
+                }, f, ensure_ascii=False, indent=2)
+            return True
+        except Exception as e:
+            print(f"❌ 保存路由备忘失败: {e}")
+            return False
+    
+    def lookup(self, class_element_id, signature, options):
+        """
+        查询备忘的选择
+        
+        只有历史选择一致（没有冲突的其他子节点）、次数达到 min_count，
+        且该子节点仍在当前可选项中时才命中。
+        
+        Args:
+            class_element_id: 当前 Class 节点的 elementId
+            signature: 成分签名
+            options: 当前可选的子节点 [{name, elementId}, ...]
+        
+        Returns:
+            dict: 命中的子节点 {name, elementId}；未命中返回 None
+        """
+        choices = self.entries.get(f"{class_element_id}|{signature}") if signature else None
+        
+        if not choices or len(choices) != 1:
+            self.misses += 1
+            return None
+        
+        child_id, info = next(iter(choices.items()))
+        if info['count'] < self.min_count:
+            self.misses += 1
+            return None
+        
+        for node in options:
+            if node['elementId'] == child_id:
+                self.hits += 1
+                return node
+        
+        self.misses += 1
+        return None
+    
+    def record(self, class_element_id, signature, child):
+        """记录一次在 Class 节点上的选择"""
+        if not signature:
+            return
+        
+        choices = self.entries.setdefault(f"{class_element_id}|{signature}", {})
+        info = choices.setdefault(child['elementId'], {'name': child['name'], 'count': 0})
+        info['count'] += 1
+    
+    def record_path(self, classification_path, signature):
+        """
+        记录一条完整分类路径上的每一步选择
+        
+        Args:
+            classification_path: [{name, elementId}, ...]（result 文件中为 element_id）
+            signature: 成分签名
+        """
+        for parent, child in zip(classification_path, classification_path[1:]):
+            self.record(
+                parent.get('elementId') or parent.get('element_id'),
+                signature,
+                {
+                    'name': child['name'],
+                    'elementId': child.get('elementId') or child.get('element_id')
+                }
+            )
+    
+    def bootstrap_from_results(self, result_dir=RESULT_DIR, result_prefix=RESULT_FILE_PREFIX):
+        """
+        从历史挂载结果文件初始化备忘
+        
+        Returns:
+            int: 导入的成功记录数
+        """
+        imported = 0
+        pattern = os.path.join(result_dir, f"{result_prefix}_*.json")
+        
+        for result_file in sorted(glob.glob(pattern)):
+            try:
+                with open(result_file, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+            except Exception as e:
+                print(f"❌ 读取结果文件失败 {result_file}: {e}")
+                continue
+            
+            for record in data.get('results', []):
+                if record.get('status') != 'success':
+                    continue
+                
+                material_data = record.get('mounted_node', {}).get('data', {})
+                signature = composition_signature(material_data)
+                if not signature:
+                    continue
+                
+                self.record_path(record.get('classification_path', []), signature)
+                imported += 1
+        
+        return imported
+    
+    def stats(self):
+        """返回备忘统计 {hits, misses, entries}"""
+        return {'hits': self.hits, 'misses': self.misses, 'entries': len(self.entries)}
+
+
+_shared_memo = None
+
+
+def get_routing_memo():
+    """
+    获取进程内共享的路由备忘（首次使用时加载；文件不存在时从历史结果初始化）
+    
+    Returns:
+        RoutingMemo: 未启用（ROUTING_MEMO_ENABLED=False）时返回 None
+    """
+    global _shared_memo
+    if not ROUTING_MEMO_ENABLED:
+        return None
+    if _shared_memo is None:
+        _shared_memo = RoutingMemo()
+        if not _shared_memo.load():
+            imported = _shared_memo.bootstrap_from_results()
+            print(f"✅ 从历史结果初始化路由备忘：{imported} 条记录")
+    return _shared_memo
+
+
+if __name__ == "__main__":
+    # 重新从历史结果构建备忘文件
+    memo = RoutingMemo()
+    count = memo.bootstrap_from_results()
+    memo.save()
+    print(f"✅ 导入 {count} 条成功记录，共 {len(memo.entries)} 个备忘项，已保存到 {memo.path}")
@@ -0,0 +1,89 @@
+"""
+请求合并模块 - 相同的并发 LLM 请求只向上游发送一次
+
+并发处理时，成分相同的材料在同一节点会同时生成逐字节相同的请求。
+持久化缓存只在第一个回答返回后才起作用；这里让同时在途的相同请求
+共享同一次上游调用的结果（函数仍由每个调用方各自执行）。
+"""
+import asyncio
+import hashlib
+import json
+from config import LLM_SINGLE_FLIGHT_ENABLED
+from deadline import DeadlineExceeded
+
+
+def request_key(request):
+    """请求的合并键：chat.completions.create 全部参数的 SHA-256"""
+    encoded = json.dumps(request, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+
+class SingleFlight:
+    """同一键同时只有一个调用在途，其他调用等待并共享其结果"""
+    
+    def __init__(self):
+        # {键: Future[(ok, 结果或异常)]}
+        self._inflight = {}
+        self.stats = {'leaders': 0, 'coalesced': 0}
+    
+    async def run(self, key, factory):
+        """
+        执行 factory()，或等待正在执行的相同调用
+        
+        Args:
+            key: 合并键（request_key 的结果）
+            factory: 无参数的协程函数，发出真正的上游请求
+        
+        Returns:
+            tuple: (结果, shared)；shared 为 True 表示结果来自其他调用
+        
+        发起调用的一方被取消或超过截止时间时，等待者不跟着失败，而是重新发起请求。
+        """
+        while key in self._inflight:
+            # shield：等待者自己被取消时不影响共享的调用
+            ok, value = await asyncio.shield(self._inflight[key])
+            if ok:
+                self.stats['coalesced'] += 1
+                return value, True
+            if not isinstance(value, _LeaderGone):
+                raise value
+        
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        self.stats['leaders'] += 1
+        try:
+            result = await factory()
+        except (asyncio.CancelledError, DeadlineExceeded) as e:
+            future.set_result((False, _LeaderGone(e)))
+            raise
+        except Exception as e:
+            future.set_result((False, e))
+            raise
+        else:
+            future.set_result((True, result))
+            return result, False
+        finally:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+
+
+class _LeaderGone(Exception):
+    """发起调用的一方被取消 / 超时（不是请求本身失败）"""
+
+
+_shared_single_flight = None
+
+
+def get_single_flight():
+    """
+    获取进程内共享的请求合并器
+    
+    Returns:
+        SingleFlight: 未启用（LLM_SINGLE_FLIGHT_ENABLED=False）时返回 None
+    """
+    global _shared_single_flight
+    if not LLM_SINGLE_FLIGHT_ENABLED:
+        return None
+    if _shared_single_flight is None:
+        _shared_single_flight = SingleFlight()
+    return _shared_single_flight
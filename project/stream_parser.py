@@ -0,0 +1,105 @@
+"""
+流式 tool call 解析模块 - 增量解析 arguments JSON
+
+流式返回的 arguments 是逐段到达的 JSON 文本。这里逐字符扫描，
+顶层字段的值一旦完整（字符串的右引号、数字后的逗号、嵌套结构的右括号）
+就立即解析出来，不必等整个 JSON 结束。
+"""
+import json
+
+
+class IncrementalArgumentParser:
+    """
+    增量解析 tool call 的 arguments，记录已经完整的顶层字段
+    
+    用法:
+        parser = IncrementalArgumentParser()
+        parser.feed('{"next_node_name": "金属')
+        parser.feed('材料", "reasoning": "...')
+        parser.values   # {'next_node_name': '金属材料'}
+    """
+    
+    def __init__(self):
+        self.buffer = ''
+        self.values = {}
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._token_start = None
+        self._key = None
+        self._expect_value = False
+    
+    def feed(self, text):
+        """追加一段 arguments 文本，返回当前已完整的字段字典"""
+        start = len(self.buffer)
+        self.buffer += text
+        
+        for index in range(start, len(self.buffer)):
+            ch = self.buffer[index]
+            
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == '\\':
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._depth == 1:
+                        self._close_token(index + 1)
+                continue
+            
+            if ch == '"':
+                self._in_string = True
+                if self._depth == 1:
+                    self._token_start = index
+            elif ch in '{[':
+                self._depth += 1
+                if self._depth == 2:
+                    self._token_start = index
+            elif ch in '}]':
+                self._depth -= 1
+                if self._depth == 1:
+                    self._close_token(index + 1)
+                elif self._depth == 0:
+                    # 顶层对象结束：最后一个字段可能是数字 / true / false / null
+                    self._close_scalar(index)
+            elif self._depth == 1:
+                if ch == ':':
+                    self._expect_value = True
+                elif ch == ',':
+                    self._close_scalar(index)
+                elif not ch.isspace() and self._expect_value and self._token_start is None:
+                    self._token_start = index
+        
+        return self.values
+    
+    def complete(self, keys):
+        """keys 中的字段是否都已完整"""
+        return all(key in self.values for key in keys)
+    
+    def _close_token(self, end):
+        """字符串或嵌套结构结束：作为键或值保存"""
+        raw = self.buffer[self._token_start:end]
+        self._token_start = None
+        try:
+            token = json.loads(raw)
+        except json.JSONDecodeError:
+            return
+        
+        if self._expect_value:
+            self.values[self._key] = token
+            self._expect_value = False
+        else:
+            self._key = token
+    
+    def _close_scalar(self, end):
+        """数字 / true / false / null 在遇到逗号或右括号时结束"""
+        if self._token_start is None or not self._expect_value:
+            return
+        raw = self.buffer[self._token_start:end].strip()
+        self._token_start = None
+        self._expect_value = False
+        try:
+            self.values[self._key] = json.loads(raw)
+        except json.JSONDecodeError:
+            pass
@@ -0,0 +1,7 @@
+"""
+单元测试公共设置：project 下的模块按顶层模块导入（与 main.py 的运行方式一致）
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
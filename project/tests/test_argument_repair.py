@@ -0,0 +1,92 @@
+"""
+match_option 的单元测试：规范化、附带说明、别名、序号、布尔值
+"""
+import pytest
+import argument_repair
+from argument_repair import match_option, normalize_text
+
+
+OPTIONS = ['金属材料', '无机非金属材料', '高分子材料']
+
+
+def test_exact_match_is_not_a_repair():
+    assert match_option('金属材料', OPTIONS) == ('金属材料', None)
+
+
+@pytest.mark.parametrize('value', [
+    '金属材料 ', ' 金属 材料', '"金属材料"', '「金属材料」', '金属材料。',
+    '金属材料 (例子: 304不锈钢)', '金属材料（例子：钛合金）', '金属材料【常用】'
+])
+def test_near_miss_maps_to_option(value):
+    option, note = match_option(value, OPTIONS)
+    assert option == '金属材料'
+    assert note
+
+
+def test_full_width_and_case():
+    assert match_option('ＡＢＣ', ['abc'])[0] == 'abc'
+    assert normalize_text('A -> B') == normalize_text('a→b')
+
+
+def test_arrow_spelling_in_paths():
+    paths = ['金属材料 → 合金 → 高熵合金']
+    assert match_option('金属材料->合金->高熵合金', paths)[0] == paths[0]
+
+
+@pytest.mark.parametrize('value, expected', [('2', '无机非金属材料'), ('３', '高分子材料'), (1, '金属材料')])
+def test_one_based_index(value, expected):
+    assert match_option(value, OPTIONS)[0] == expected
+
+
+@pytest.mark.parametrize('value', ['0', '4', '-1'])
+def test_index_out_of_range(value):
+    assert match_option(value, OPTIONS) == (None, None)
+
+
+def test_index_can_be_disabled():
+    assert match_option('2', OPTIONS, allow_index=False) == (None, None)
+
+
+def test_string_id_matches_numeric_option_without_index():
+    assert match_option('0', [0, 1], allow_index=False)[0] == 0
+
+
+def test_alias_maps_name_to_id():
+    ids = ['4:x:1', '4:x:2']
+    aliases = {'E1': '4:x:1', 'E2': '4:x:2'}
+    assert match_option('E2', ids, aliases=aliases)[0] == '4:x:2'
+    assert match_option('E2 (相似度 0.98)', ids, aliases=aliases)[0] == '4:x:2'
+
+
+def test_ambiguous_normalization_is_rejected():
+    assert match_option('ab', ['a b', 'A B']) == (None, None)
+
+
+@pytest.mark.parametrize('value', [True, False])
+def test_booleans_are_rejected(value):
+    assert match_option(value, [0, 1], allow_index=False) == (None, None)
+    assert match_option(value, OPTIONS) == (None, None)
+
+
+@pytest.mark.parametrize('value', [None, {'name': '金属材料'}, ['金属材料']])
+def test_non_scalar_values_are_rejected(value):
+    assert match_option(value, OPTIONS) == (None, None)
+
+
+def test_unknown_value_is_rejected():
+    assert match_option('陶瓷', OPTIONS) == (None, None)
+
+
+def test_repair_can_be_disabled(monkeypatch):
+    monkeypatch.setattr(argument_repair, 'TOOL_ARGUMENT_REPAIR_ENABLED', False)
+    assert match_option('金属材料 ', OPTIONS) == (None, None)
+    assert match_option('金属材料', OPTIONS) == ('金属材料', None)
+
+
+def test_stats_count_repairs():
+    before = argument_repair.repair_stats()
+    match_option('金属材料 ', OPTIONS)
+    argument_repair.record_reprompt()
+    after = argument_repair.repair_stats()
+    assert after['repaired'] == before['repaired'] + 1
+    assert after['reprompted'] == before['reprompted'] + 1
@@ -0,0 +1,111 @@
+"""
+AdaptiveRateLimiter 的单元测试：并发上限、AIMD 调整、令牌桶修正
+"""
+import asyncio
+from rate_limiter import AdaptiveRateLimiter, TokenBucket, estimate_request_tokens
+
+
+def make_limiter(**kwargs):
+    options = dict(rpm=None, tpm=None, initial_concurrency=2, min_concurrency=1,
+                   max_concurrency=8, decrease_factor=0.5, decrease_cooldown=0)
+    options.update(kwargs)
+    return AdaptiveRateLimiter(**options)
+
+
+def test_in_flight_never_exceeds_limit():
+    limiter = make_limiter(initial_concurrency=3)
+    peak = 0
+    
+    async def call():
+        nonlocal peak
+        async with limiter.slot():
+            peak = max(peak, limiter.in_flight)
+            await asyncio.sleep(0.01)
+    
+    async def main():
+        await asyncio.gather(*(call() for _ in range(12)))
+    
+    asyncio.run(main())
+    assert peak == 3
+    assert limiter.in_flight == 0
+    assert limiter.snapshot()['requests'] == 12
+
+
+def test_throttle_halves_limit_and_success_adds_back():
+    limiter = make_limiter(initial_concurrency=8)
+    
+    async def main():
+        async with limiter.slot() as slot:
+            slot.throttled()
+        assert limiter.limit == 4
+        for _ in range(4):
+            async with limiter.slot() as slot:
+                slot.success()
+    
+    asyncio.run(main())
+    # 加性增加：每次成功 +1/limit，4 次成功约 +1
+    assert 4.9 < limiter.limit < 5.0
+    assert limiter.snapshot()['decreases'] == 1
+
+
+def test_decrease_cooldown_shrinks_once_per_burst():
+    limiter = make_limiter(initial_concurrency=8, decrease_cooldown=60)
+    limiter.last_decrease_at = float('-inf')
+    
+    async def main():
+        for _ in range(3):
+            async with limiter.slot() as slot:
+                slot.throttled()
+    
+    asyncio.run(main())
+    assert limiter.limit == 4
+    assert limiter.stats['throttled'] == 3
+    assert limiter.stats['decreases'] == 1
+
+
+def test_limit_stays_within_bounds():
+    limiter = make_limiter(initial_concurrency=2, max_concurrency=2)
+    
+    async def main():
+        for _ in range(5):
+            async with limiter.slot() as slot:
+                slot.throttled()
+        for _ in range(20):
+            async with limiter.slot() as slot:
+                slot.success()
+    
+    asyncio.run(main())
+    assert limiter.limit == 2
+
+
+def test_set_max_concurrency_tightens_limit():
+    limiter = make_limiter(initial_concurrency=8)
+    limiter.set_max_concurrency(1)
+    assert limiter.limit == 1
+    limiter.set_max_concurrency(0)
+    assert limiter.max_concurrency == limiter.min_concurrency
+
+
+def test_token_bucket_is_corrected_by_actual_usage():
+    limiter = make_limiter(tpm=6000)
+    
+    async def main():
+        async with limiter.slot(1000) as slot:
+            slot.success(200)
+    
+    asyncio.run(main())
+    # 预估 1000，实际 200：多扣的 800 退回
+    assert abs(limiter.token_bucket.tokens - 5800) < 5
+
+
+def test_token_bucket_wait_time():
+    bucket = TokenBucket(60)
+    bucket.take(60)
+    assert 0.9 < bucket.wait_time(1) <= 1.0
+    # 超过容量的请求按容量计算，不会永远等待
+    assert bucket.wait_time(1000) <= 60
+
+
+def test_estimate_request_tokens_output_reserve():
+    request = {'messages': [{'role': 'user', 'content': 'x' * 100}], 'tools': []}
+    assert estimate_request_tokens(request) - estimate_request_tokens(request, output_reserve=0) == 500
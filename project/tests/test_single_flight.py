@@ -0,0 +1,102 @@
+"""
+SingleFlight 的单元测试：合并在途请求、共享错误、发起方被取消 / 超时后等待者重新发起
+"""
+import asyncio
+import pytest
+from deadline import DeadlineExceeded
+from single_flight import SingleFlight, request_key
+
+
+def test_request_key_ignores_dict_order():
+    assert request_key({'a': 1, 'b': [1, 2]}) == request_key({'b': [1, 2], 'a': 1})
+    assert request_key({'a': 1}) != request_key({'a': 2})
+
+
+def test_concurrent_identical_calls_share_one_upstream_call():
+    flight = SingleFlight()
+    calls = 0
+    
+    async def factory():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return 'answer'
+    
+    async def main():
+        return await asyncio.gather(*(flight.run('k', factory) for _ in range(5)))
+    
+    results = asyncio.run(main())
+    assert calls == 1
+    assert [value for value, _ in results] == ['answer'] * 5
+    assert sorted(shared for _, shared in results) == [False] + [True] * 4
+    assert flight.stats == {'leaders': 1, 'coalesced': 4}
+    assert flight._inflight == {}
+
+
+def test_upstream_error_is_shared():
+    flight = SingleFlight()
+    
+    async def factory():
+        await asyncio.sleep(0.01)
+        raise ValueError('bad request')
+    
+    async def main():
+        return await asyncio.gather(
+            *(flight.run('k', factory) for _ in range(3)), return_exceptions=True
+        )
+    
+    results = asyncio.run(main())
+    assert all(isinstance(result, ValueError) for result in results)
+    assert flight.stats['leaders'] == 1
+
+
+@pytest.mark.parametrize('leader_failure', ['cancel', 'deadline'])
+def test_waiter_reissues_when_leader_is_gone(leader_failure):
+    flight = SingleFlight()
+    calls = []
+    
+    async def leader_factory():
+        calls.append('leader')
+        await asyncio.sleep(0.05)
+        if leader_failure == 'deadline':
+            raise DeadlineExceeded('leader deadline')
+        return 'leader answer'
+    
+    async def waiter_factory():
+        calls.append('waiter')
+        return 'waiter answer'
+    
+    async def main():
+        leader = asyncio.create_task(flight.run('k', leader_factory))
+        await asyncio.sleep(0.01)
+        waiter = asyncio.create_task(flight.run('k', waiter_factory))
+        await asyncio.sleep(0.01)
+        if leader_failure == 'cancel':
+            leader.cancel()
+        with pytest.raises((asyncio.CancelledError, DeadlineExceeded)):
+            await leader
+        return await waiter
+    
+    assert asyncio.run(main()) == ('waiter answer', False)
+    assert calls == ['leader', 'waiter']
+    assert flight.stats['leaders'] == 2
+
+
+def test_cancelled_waiter_does_not_cancel_leader():
+    flight = SingleFlight()
+    
+    async def factory():
+        await asyncio.sleep(0.03)
+        return 'answer'
+    
+    async def main():
+        leader = asyncio.create_task(flight.run('k', factory))
+        await asyncio.sleep(0.005)
+        waiter = asyncio.create_task(flight.run('k', factory))
+        await asyncio.sleep(0.005)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        return await leader
+    
+    assert asyncio.run(main()) == ('answer', False)
@@ -0,0 +1,89 @@
+"""
+IncrementalArgumentParser 的单元测试：分段边界、转义、标量结束、提前停止
+"""
+import json
+import pytest
+from stream_parser import IncrementalArgumentParser
+
+
+ARGUMENTS = {
+    'next_node_name': '金属材料',
+    'material_id': 12,
+    'ratio': -0.5,
+    'final': True,
+    'note': None,
+    'path': ['材料', '金属材料'],
+    'meta': {'a': [1, {'b': '}'}], 'c': '"quoted"'},
+    'reasoning': '含有 \\ 反斜杠、"引号" 和 {括号}'
+}
+
+
+def feed_chunks(text, size):
+    parser = IncrementalArgumentParser()
+    for start in range(0, len(text), size):
+        parser.feed(text[start:start + size])
+    return parser
+
+
+@pytest.mark.parametrize('size', [1, 2, 3, 7, 1000])
+def test_any_chunk_boundary_gives_full_arguments(size):
+    text = json.dumps(ARGUMENTS, ensure_ascii=False)
+    assert feed_chunks(text, size).values == ARGUMENTS
+
+
+@pytest.mark.parametrize('size', [1, 5])
+def test_ascii_escaped_json(size):
+    # ensure_ascii=True 时中文为 \uXXXX 转义，分段可能落在转义序列中间
+    text = json.dumps(ARGUMENTS, ensure_ascii=True)
+    assert feed_chunks(text, size).values == ARGUMENTS
+
+
+def test_string_value_available_before_json_ends():
+    parser = IncrementalArgumentParser()
+    parser.feed('{"next_node_name": "金属')
+    assert parser.values == {}
+    parser.feed('材料", "reasoning": "因为')
+    assert parser.values == {'next_node_name': '金属材料'}
+    assert parser.complete(['next_node_name'])
+    assert not parser.complete(['next_node_name', 'reasoning'])
+
+
+def test_escaped_quote_does_not_close_string():
+    parser = IncrementalArgumentParser()
+    parser.feed('{"leaf_path": "A \\"B')
+    assert parser.values == {}
+    parser.feed('\\" → C", ')
+    assert parser.values == {'leaf_path': 'A "B" → C'}
+
+
+def test_trailing_backslash_split_across_chunks():
+    parser = IncrementalArgumentParser()
+    parser.feed('{"x": "a\\')
+    parser.feed('\\", "y": 1}')
+    assert parser.values == {'x': 'a\\', 'y': 1}
+
+
+def test_scalar_completes_only_at_delimiter():
+    parser = IncrementalArgumentParser()
+    parser.feed('{"material_id": 1')
+    # 数字可能还没结束（例如 12），遇到逗号或右括号前不报告
+    assert 'material_id' not in parser.values
+    parser.feed('2, "flag": fal')
+    assert parser.values == {'material_id': 12}
+    parser.feed('se}')
+    assert parser.values == {'material_id': 12, 'flag': False}
+
+
+def test_nested_value_completes_at_closing_bracket():
+    parser = IncrementalArgumentParser()
+    parser.feed('{"decisions": [{"material_id": 0, "next_node_name": "A"}')
+    assert 'decisions' not in parser.values
+    parser.feed(', {"material_id": 1, "next_node_name": "B"}]')
+    assert parser.values['decisions'][1] == {'material_id': 1, 'next_node_name': 'B'}
+
+
+def test_truncated_stream_keeps_only_complete_fields():
+    # 提前停止生成：只保留已经完整的字段
+    parser = IncrementalArgumentParser()
+    parser.feed('{"target_element_id": "4:abc:12", "reasoning": "成分与 E1 最接近，且')
+    assert parser.values == {'target_element_id': '4:abc:12'}
@@ -0,0 +1,241 @@
+"""
+用量统计模块 - 每条材料 / 每轮的 token 与耗时统计，以及整次运行的预算
+
+当前材料的统计对象保存在 ContextVar 中：asyncio 任务和 asyncio.to_thread
+都会复制上下文，因此 FunctionCallHandler 和 Neo4jConnector 不需要显式传参
+就能把用量记到正确的材料上。
+"""
+import time
+from contextvars import ContextVar
+from functools import wraps
+from config import (
+    LLM_PRICE_INPUT_CACHE_HIT, LLM_PRICE_INPUT_CACHE_MISS, LLM_PRICE_OUTPUT,
+    RUN_TOKEN_BUDGET, RUN_COST_BUDGET, RUN_BUDGET_ACTION
+)
+
+
+_current_stats = ContextVar('material_stats', default=None)
+
+
+class MaterialStats:
+    """单条材料的用量统计"""
+    
+    def __init__(self):
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cached_tokens = 0
+        self.llm_calls = 0
+        self.llm_cache_hits = 0
+        self.llm_ms = 0.0
+        self.neo4j_queries = 0
+        self.neo4j_ms = 0.0
+        self.rounds = 0
+        self.current_node = None
+        self.round_details = []
+        # 当前分类路径（随导航追加），以及已开始的挂载写入（mount_to_entity 登记的 Future）
+        self.classification_path = None
+        self.pending_mount = None
+    
+    def begin_round(self, round_num, node_name):
+        """开始新的一轮（记录当前所在节点，之后的 LLM 调用归到该节点）"""
+        self.rounds = max(self.rounds, round_num)
+        self.current_node = node_name
+    
+    def to_dict(self):
+        return {
+            'prompt_tokens': self.prompt_tokens,
+            'completion_tokens': self.completion_tokens,
+            'cached_tokens': self.cached_tokens,
+            'llm_calls': self.llm_calls,
+            'llm_cache_hits': self.llm_cache_hits,
+            'llm_ms': round(self.llm_ms, 1),
+            'neo4j_queries': self.neo4j_queries,
+            'neo4j_ms': round(self.neo4j_ms, 1),
+            'rounds': self.rounds,
+            'round_details': self.round_details
+        }
+
+
+def start_material_stats():
+    """为当前任务创建并绑定一个新的 MaterialStats"""
+    stats = MaterialStats()
+    _current_stats.set(stats)
+    return stats
+
+
+def current_material_stats():
+    """当前任务绑定的 MaterialStats（没有时返回 None）"""
+    return _current_stats.get()
+
+
+def extract_usage(usage):
+    """
+    从 SDK 返回的 usage 中取出 token 数
+    
+    DeepSeek 使用 prompt_cache_hit_tokens，OpenAI 兼容接口使用 prompt_tokens_details.cached_tokens。
+    
+    Returns:
+        dict: {prompt_tokens, completion_tokens, cached_tokens}
+    """
+    if usage is None:
+        return {'prompt_tokens': 0, 'completion_tokens': 0, 'cached_tokens': 0}
+    
+    cached = _field(usage, 'prompt_cache_hit_tokens')
+    if cached is None:
+        cached = _field(_field(usage, 'prompt_tokens_details'), 'cached_tokens')
+    
+    return {
+        'prompt_tokens': _field(usage, 'prompt_tokens') or 0,
+        'completion_tokens': _field(usage, 'completion_tokens') or 0,
+        'cached_tokens': cached or 0
+    }
+
+
+def _field(obj, key):
+    """兼容字典和 SDK 对象的字段读取"""
+    if obj is None:
+        return None
+    if isinstance(obj, dict):
+        return obj.get(key)
+    return getattr(obj, key, None)
+
+
+def record_llm_call(function_name, usage, elapsed_ms, from_cache=False):
+    """
+    记录一次 LLM 调用（归到当前材料的当前节点，同时计入运行预算）
+    
+    Args:
+        function_name: 本次调用请求 / 返回的函数名
+        usage: extract_usage 的结果
+        elapsed_ms: 耗时（毫秒）
+        from_cache: 是否命中本地缓存
+    """
+    if not from_cache:
+        get_run_usage().add(usage, function_name)
+    
+    stats = _current_stats.get()
+    if stats is None:
+        return
+    
+    stats.llm_calls += 1
+    stats.llm_ms += elapsed_ms
+    stats.prompt_tokens += usage['prompt_tokens']
+    stats.completion_tokens += usage['completion_tokens']
+    stats.cached_tokens += usage['cached_tokens']
+    if from_cache:
+        stats.llm_cache_hits += 1
+    
+    stats.round_details.append({
+        'round': stats.rounds,
+        'node': stats.current_node,
+        'function': function_name,
+        'prompt_tokens': usage['prompt_tokens'],
+        'completion_tokens': usage['completion_tokens'],
+        'cached_tokens': usage['cached_tokens'],
+        'llm_ms': round(elapsed_ms, 1),
+        'from_cache': from_cache
+    })
+    
+    if not from_cache:
+        get_run_usage().add_node(stats.current_node, usage)
+
+
+def timed_neo4j(func):
+    """装饰器：把 Neo4j 查询的耗时记到当前材料上"""
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            stats = _current_stats.get()
+            if stats is not None:
+                stats.neo4j_queries += 1
+                stats.neo4j_ms += (time.perf_counter() - started) * 1000
+    return wrapper
+
+
+class RunUsage:
+    """整次运行的用量与预算（token 数 / 费用）"""
+    
+    def __init__(self, token_budget=RUN_TOKEN_BUDGET, cost_budget=RUN_COST_BUDGET,
+                 action=RUN_BUDGET_ACTION):
+        self.token_budget = token_budget
+        self.cost_budget = cost_budget
+        self.action = action
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cached_tokens = 0
+        self.calls = 0
+        self.by_node = {}
+        self.by_function = {}
+    
+    @property
+    def total_tokens(self):
+        return self.prompt_tokens + self.completion_tokens
+    
+    @property
+    def cost(self):
+        """按 config 中的单价（每百万 token）估算费用"""
+        cache_miss = self.prompt_tokens - self.cached_tokens
+        return (
+            self.cached_tokens * LLM_PRICE_INPUT_CACHE_HIT
+            + cache_miss * LLM_PRICE_INPUT_CACHE_MISS
+            + self.completion_tokens * LLM_PRICE_OUTPUT
+        ) / 1_000_000
+    
+    def add(self, usage, function_name=None):
+        self.calls += 1
+        self.prompt_tokens += usage['prompt_tokens']
+        self.completion_tokens += usage['completion_tokens']
+        self.cached_tokens += usage['cached_tokens']
+        if function_name:
+            _accumulate(self.by_function, function_name, usage)
+    
+    def add_node(self, node_name, usage):
+        if node_name:
+            _accumulate(self.by_node, node_name, usage)
+    
+    def exceeded(self):
+        """是否已经达到 token 或费用上限"""
+        if self.token_budget and self.total_tokens >= self.token_budget:
+            return True
+        if self.cost_budget and self.cost >= self.cost_budget:
+            return True
+        return False
+    
+    def summary(self, top_n=10):
+        """返回运行用量汇总（按 token 数排序的前 top_n 个节点）"""
+        top_nodes = sorted(
+            self.by_node.items(),
+            key=lambda item: item[1]['prompt_tokens'] + item[1]['completion_tokens'],
+            reverse=True
+        )[:top_n]
+        return {
+            'calls': self.calls,
+            'prompt_tokens': self.prompt_tokens,
+            'completion_tokens': self.completion_tokens,
+            'cached_tokens': self.cached_tokens,
+            'cost': round(self.cost, 4),
+            'by_function': self.by_function,
+            'top_nodes': dict(top_nodes)
+        }
+
+
+def _accumulate(table, key, usage):
+    entry = table.setdefault(key, {'calls': 0, 'prompt_tokens': 0, 'completion_tokens': 0, 'cached_tokens': 0})
+    entry['calls'] += 1
+    entry['prompt_tokens'] += usage['prompt_tokens']
+    entry['completion_tokens'] += usage['completion_tokens']
+    entry['cached_tokens'] += usage['cached_tokens']
+
+
+_run_usage = None
+
+
+def get_run_usage():
+    """获取进程内共享的运行用量统计"""
+    global _run_usage
+    if _run_usage is None:
+        _run_usage = RunUsage()
+    return _run_usage